@@ -1,104 +1,182 @@
+import argparse
+import csv
+import re
+import time
 import pandas as pd
 
-df = pd.read_csv("ocr_results.csv")
-
-df = df.drop_duplicates(subset='text', keep='first')
-
-df['text'] = df["text"].str.replace('‘', '')\
-    .str.replace('.', ',')\
-    .str.replace('~', '')\
-    .str.replace('"', '')\
-    .str.replace('Fz', 'Ez')\
-    .str.replace('Fiz', 'Ez')\
-    .str.replace('Bz', 'Ez')\
-    .str.replace('pp', 'Ps')\
-    .str.replace('J ', 'Jl')\
-    .str.replace('Jt', 'Jl')\
-    .str.replace('Ir ', 'Jr ')\
-    .str.replace('In ', 'Jr ')\
-    .str.replace('Jn ', 'Jr ')\
-    .str.replace('dr ', 'Jr ')\
-    .str.replace('Il Ch', 'II Ch ')\
-    .str.replace('I] Ch', 'II Ch ')\
-    .str.replace('1] Ch', 'II Ch ')\
-    .str.replace('{1 Ch', 'II Ch ')\
-    .str.replace('11Ch', 'II Ch')\
-    .str.replace('| Ch', 'I Ch')\
-    .str.replace('I Ch 20,25B', 'II Ch 20,25B')\
-    .str.replace('1$', 'I S')\
-    .str.replace('1S', 'I S')\
-    .str.replace('1I S', 'II S')\
-    .str.replace('11S', 'II S')\
-    .str.replace('11 Ch', 'II Ch')\
-    .str.replace('1I Ch', 'II Ch')\
-    .str.replace('Jg2,1', 'Jg 2,1')\
-    .str.replace('Jg5,11', 'Jg 5,11')\
-    .str.replace('Jg7,3', 'Jg 7,3')\
-    .str.replace('Jg9,31A', 'Jg 9,31')\
-    .str.replace('1$1,24A', 'I S 1,24')\
-    .str.replace('1$3,13A', 'I S 3,13')\
-    .str.replace('1$7,2', 'I S 7,2')\
-    .str.replace('1$9,24A', 'I S 9,24')\
-    .str.replace('1$14,41', 'I S 14,41')\
-    .str.replace('WS ', 'II S ')\
-    .str.replace('Il ', 'II ')\
-    .str.replace('ILS ', 'II S ')\
-    .str.replace('It\'S ', 'II S ')\
-    .str.replace('11 R', 'II R')\
-    .str.replace('I] R', 'II R')\
-    .str.replace('Jp ', 'Jr ')\
-    .str.replace('MI ', 'Mal ')\
-    .str.replace(r"\(.*?\)", "", regex=True).str.strip()
-
-df['text'] = df["text"].str.replace('II Ch', '2Ch')\
-    .str.replace('I Ch', '1Ch')\
-    .str.replace('II R', '2R')\
-    .str.replace('I R', '1R')\
-    .str.replace('II S', '2S')\
-    .str.replace('I S', '1S')\
-    .str.replace(',', ':')
-
-df = df.drop_duplicates(subset='text', keep='first')
-
-a = df["text"].str.split(" ", n=1, expand=True)
-a.columns = ["book", "verses"]
-df = pd.concat([df, a], axis=1)
-del a
-
-df["verses"] = df["verses"].str.replace(r"[A-Za-z]", "", regex=True)
-
-b = df["verses"].str.split("/", expand=True)
-b.columns = ["v1", "v2"]
-df = pd.concat([df, b], axis=1)
-del b
-
-df = df.drop(columns=["text", "page", "verses"])
-
-df = df.melt(id_vars=["volume", "pagina", "book"])
-
-df = df.dropna(subset=["value"])
-
-df = df.drop(columns=["variable"])
-
-df = df.drop_duplicates(subset=["book", "value"], keep='first')
-
-def remove_hyphen_last(text):
-    if text[-1] == "-":
-        return text[:-1].strip()
-    else:
-        return text.strip()
-
-df["value"] = df["value"].apply(remove_hyphen_last)
-
-def add_obadiah_chapter(row):
-    if row["book"] == "Ab":
-        return "1:" + str(row["value"])
-    else:
-        return str(row["value"])
-
-df["value"] = df[["book", "value"]].apply(add_obadiah_chapter, axis=1)
-
-
-df.to_csv("ocr_clean.csv", index=False)
-
-print(df)
+RULES_FILE = "ocr_rules.csv"
+
+# Steps of the rules file; the text is stripped between them
+STEPS = ("clean", "books")
+
+def load_rules(path):
+    """
+    Reads the substitution rules, in the order they are applied.
+
+    Each row of the rules file has a step, a kind ('literal' or 'regex'),
+    a pattern and its replacement. Every rule replaces all matches in the
+    text left by the rules above it.
+
+    Returns:
+        A dict of (kind, pattern, replacement) lists by step.
+    """
+    rules = {step: [] for step in STEPS}
+    with open(path, newline='', encoding='utf-8') as f:
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            if row['step'] not in rules or row['kind'] not in ('literal', 'regex'):
+                raise ValueError(f"{path}, line {line}: unknown step '{row['step']}' or kind '{row['kind']}'")
+            rules[row['step']].append((row['kind'], row['pattern'], row['replacement']))
+    return rules
+
+def _overlap(a, b):
+    """Whether a match of `b` can share characters with an occurrence of `a`."""
+    if a in b or b in a:
+        return True
+    return any(a.endswith(b[:k]) or b.endswith(a[:k]) for k in range(1, min(len(a), len(b))))
+
+def _independent(earlier, later):
+    """
+    Whether two literal rules give the same result applied in one pass as
+    applied one after the other: their matches cannot overlap, and the
+    earlier one cannot make, or by deleting text join up, a match of the later one.
+    """
+    _, pattern, replacement = earlier
+    _, later_pattern, _ = later
+    if _overlap(pattern, later_pattern):
+        return False
+    if replacement == '':
+        return len(later_pattern) == 1
+    return not _overlap(replacement, later_pattern)
+
+def compile_rules(rules):
+    """
+    Compiles an ordered list of rules into as few passes over the text as
+    give exactly the result of applying them one by one.
+
+    Consecutive literal rules that are independent of one another are
+    joined into one pass, matched by one regular expression, an alternation
+    of their patterns, whose matches are looked up in a table of
+    replacements. A regex rule, or a literal one that depends on an earlier
+    rule of the current pass, starts a new pass.
+
+    Returns:
+        A list of passes, each a (rules, matcher, table) tuple; the matcher
+        and table are None for a pass of a single rule.
+    """
+    groups = []
+    for rule in rules:
+        group = groups[-1] if groups else None
+        if rule[0] == 'literal' and group and group[0][0] == 'literal' and all(_independent(earlier, rule) for earlier in group):
+            group.append(rule)
+        else:
+            groups.append([rule])
+
+    passes = []
+    for group in groups:
+        if len(group) == 1:
+            passes.append((group, None, None))
+            continue
+        table = {pattern: replacement for _, pattern, replacement in group}
+        passes.append((group, re.compile('|'.join(re.escape(pattern) for pattern in table)), table))
+    return passes
+
+def apply_passes(text, passes):
+    """
+    Applies compiled passes to a Series of strings.
+
+    Where pandas keeps the strings in Arrow, the literal rules of a pass
+    run one by one as native kernels, which beats one pass that calls back
+    into Python for every match; the rules being independent, the result is
+    the same.
+    """
+    arrow = isinstance(text.dtype, pd.StringDtype) and text.dtype.storage == 'pyarrow'
+    for group, matcher, table in passes:
+        if matcher is None or arrow:
+            text = apply_rules_one_by_one(text, group)
+        else:
+            text = text.str.replace(matcher, lambda m, table=table: table[m.group(0)], regex=True)
+    return text
+
+def apply_rules_one_by_one(text, rules):
+    """The reference semantics of the rules file: one replacement after the other."""
+    for kind, pattern, replacement in rules:
+        text = text.str.replace(pattern, replacement, regex=kind == 'regex')
+    return text
+
+def clean_text(text, rules, check=False):
+    """
+    Cleans OCR'd header text with the compiled rules.
+
+    With `check`, the result is compared with applying the rules one by one,
+    on strings kept as Python objects so that the joined passes are used.
+    """
+    compiled = {step: compile_rules(rules[step]) for step in STEPS}
+    cleaned = apply_passes(apply_passes(text, compiled['clean']).str.strip(), compiled['books'])
+    print(f"{sum(len(rules[step]) for step in STEPS)} rules in {sum(len(compiled[step]) for step in STEPS)} passes")
+    if check:
+        objects = text.astype(object)
+        joined = apply_passes(apply_passes(objects, compiled['clean']).str.strip(), compiled['books'])
+        reference = apply_rules_one_by_one(apply_rules_one_by_one(objects, rules['clean']).str.strip(), rules['books'])
+        if not (joined.equals(reference) and cleaned.astype(object).equals(reference)):
+            raise AssertionError("Compiled rules differ from applying them one by one")
+        print("Compiled rules match applying them one by one")
+    return cleaned
+
+def clean_ocr_results(input_csv, output_csv, rules_file, check=False):
+    """Cleans the OCR'd headers into one row per verse reference of a page."""
+    df = pd.read_csv(input_csv)
+
+    df = df.drop_duplicates(subset='text', keep='first')
+
+    df['text'] = clean_text(df['text'], load_rules(rules_file), check)
+
+    df = df.drop_duplicates(subset='text', keep='first')
+
+    a = df["text"].str.split(" ", n=1, expand=True)
+    a.columns = ["book", "verses"]
+    df = pd.concat([df, a], axis=1)
+    del a
+
+    df["verses"] = df["verses"].str.replace(r"[A-Za-z]", "", regex=True)
+
+    b = df["verses"].str.split("/", expand=True)
+    b.columns = ["v1", "v2"]
+    df = pd.concat([df, b], axis=1)
+    del b
+
+    df = df.drop(columns=["text", "page", "verses"])
+
+    df = df.melt(id_vars=["volume", "pagina", "book"])
+
+    df = df.dropna(subset=["value"])
+
+    df = df.drop(columns=["variable"])
+
+    df = df.drop_duplicates(subset=["book", "value"], keep='first')
+
+    # Drop a trailing hyphen
+    value = df["value"]
+    value = value.where(~value.str.endswith("-"), value.str[:-1]).str.strip()
+
+    # Obadiah has a single chapter, so its references only give the verse
+    df["value"] = value.where(df["book"] != "Ab", "1:" + value)
+
+    df.to_csv(output_csv, index=False)
+
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clean the OCR'd CTAT headers into verse references.")
+    parser.add_argument("--input", default="ocr_results.csv", help="OCR results to clean (default: ocr_results.csv).")
+    parser.add_argument("--output", default="ocr_clean.csv", help="CSV file the references are written to (default: ocr_clean.csv).")
+    parser.add_argument("--rules", default=RULES_FILE, help=f"Substitution rules, applied in order (default: {RULES_FILE}).")
+    parser.add_argument(
+        "--check", action="store_true",
+        help="Check that the compiled rules give the same text as applying them one by one, e.g. after editing the rules."
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    print(clean_ocr_results(args.input, args.output, args.rules, args.check))
+    print(f"Cleaned in {time.perf_counter() - start:.2f}s")
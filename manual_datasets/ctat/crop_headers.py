@@ -1,7 +1,14 @@
-
+import argparse
 import os
 import csv
-from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+import fitz  # PyMuPDF
+
+# Resolution the header coordinates were measured at, on full pages rendered by process_pdfs.py
+DPI = 300
+
+# Pages a worker renders per task, so each task opens its PDF once
+PAGES_PER_TASK = 16
 
 def get_crop_coordinates(csv_path):
     """Reads cropping coordinates from a CSV file for each volume."""
@@ -26,71 +33,143 @@ def get_crop_coordinates(csv_path):
             }
     return coordinates
 
-def process_images(images_dir, headers_dir, coordinates):
+def header_clip(page, coords, dpi=DPI):
     """
-    Crops images based on volume-specific coordinates and saves them.
+    Maps a header box in pixels of a page rendered at `dpi` to the PDF
+    rectangle it shows, undoing the page's rotation.
     """
-    if not os.path.exists(headers_dir):
-        os.makedirs(headers_dir)
+    scale = 72 / dpi
+    box = fitz.Rect(coords['x1'] * scale, coords['y1'] * scale, coords['x2'] * scale, coords['y2'] * scale)
+    return box * page.derotation_matrix
 
-    for volume in os.listdir(images_dir):
-        volume_path = os.path.join(images_dir, volume)
-        if not os.path.isdir(volume_path):
-            continue
+def render_pages(task):
+    """
+    Renders the header boxes of a range of pages of one volume; run in a worker process.
 
-        if volume not in coordinates:
-            print(f"Warning: No coordinates found for volume '{volume}'. Skipping this volume.")
-            continue
-        
-        volume_coords = coordinates[volume]
+    Returns:
+        One (page number, header image, message) tuple per page, where the
+        image is a PNG file path if `headers_dir` is set and an in-memory
+        PIL image otherwise.
+    """
+    volume, pdf_path, first, last, volume_coords, headers_dir = task
+    results = []
+    with fitz.open(pdf_path) as doc:
+        for page_index in range(first, last):
+            page_number = page_index + 1
+            coords = volume_coords['odd' if page_number % 2 != 0 else 'even']
+            try:
+                page = doc.load_page(page_index)
+                pix = page.get_pixmap(dpi=DPI, clip=header_clip(page, coords), colorspace=fitz.csGRAY)
+                if headers_dir is not None:
+                    image = os.path.join(headers_dir, volume, f'{page_number}.png')
+                    pix.save(image)
+                else:
+                    from PIL import Image
+                    image = Image.frombytes('L', (pix.width, pix.height), pix.samples)
+                results.append((page_number, image, f"Rendered header of page {page_number} of volume {volume}"))
+            except Exception as e:
+                results.append((page_number, None, f"Error rendering page {page_number} of {pdf_path}: {e}"))
+    return results
 
-        output_volume_path = os.path.join(headers_dir, volume)
-        if os.path.exists(output_volume_path):
-            print(f"Skipping volume {volume} as output directory already exists.")
+def render_and_ocr_pages(task):
+    """Renders the header boxes of a range of pages and reads them in the worker; see render_pages."""
+    from ocr_headers import ocr_image
+    volume = task[0]
+    rows = []
+    for page_number, image, message in render_pages(task):
+        if image is None:
+            rows.append((None, message))
             continue
-        os.makedirs(output_volume_path)
+        rows.append(({'volume': volume, 'page': f'{page_number}.png', 'text': ocr_image(image), 'pagina': page_number}, message))
+    return rows
 
-        for image_name in os.listdir(volume_path):
-            if not image_name.lower().endswith('.png'):
-                continue
+def _init_ocr_worker():
+    from ocr_headers import init_worker
+    init_worker()
 
-            image_path = os.path.join(volume_path, image_name)
-            try:
-                page_number = int(os.path.splitext(image_name)[0])
-            except ValueError:
-                print(f"Warning: Could not determine page number from filename '{image_name}'. Skipping.")
-                continue
+def render_headers(pdfs_dir, headers_dir, coordinates, workers=None, ocr_csv_path=None):
+    """
+    Renders the header box of every page of every volume straight from its PDF.
 
-            page_type = 'odd' if page_number % 2 != 0 else 'even'
-            
-            coords_for_page = volume_coords[page_type]
+    Only the header box is rasterized, at the resolution its coordinates
+    were measured at, so no full-page image is ever made. Pages are spread
+    over a pool of worker processes. Headers are saved as PNG files to
+    `headers_dir`, skipping those already there; with `ocr_csv_path`, they
+    are read in memory instead and the results are appended to that file,
+    skipping pages already in it.
+    """
+    done = set()
+    if ocr_csv_path is not None:
+        from ocr_headers import open_results
+        csvfile, writer, done = open_results(ocr_csv_path)
 
-            try:
-                with Image.open(image_path) as img:
-                    crop_box = (
-                        coords_for_page['x1'],
-                        coords_for_page['y1'],
-                        coords_for_page['x2'],
-                        coords_for_page['y2'],
-                    )
-                    header = img.crop(crop_box)
-                    output_path = os.path.join(output_volume_path, image_name)
-                    header.save(output_path)
-                    print(f"Saved header for {image_path} to {output_path}")
-            except Exception as e:
-                print(f"Error processing {image_path}: {e}")
+    tasks = []
+    for pdf_file in sorted(os.listdir(pdfs_dir)):
+        volume, extension = os.path.splitext(pdf_file)
+        if extension.lower() != '.pdf':
+            continue
+        if volume not in coordinates:
+            print(f"Warning: No coordinates found for volume '{volume}'. Skipping this volume.")
+            continue
+        pdf_path = os.path.join(pdfs_dir, pdf_file)
+        with fitz.open(pdf_path) as doc:
+            page_count = doc.page_count
+        if ocr_csv_path is None:
+            os.makedirs(os.path.join(headers_dir, volume), exist_ok=True)
+            pending = [
+                index for index in range(page_count)
+                if not os.path.exists(os.path.join(headers_dir, volume, f'{index + 1}.png'))
+            ]
+        else:
+            pending = [index for index in range(page_count) if (volume, f'{index + 1}.png') not in done]
+        print(f"Volume {volume}: {page_count} pages, {len(pending)} headers to render")
+        # Runs of pending pages, cut into tasks of at most PAGES_PER_TASK pages
+        start = None
+        for position, index in enumerate(pending):
+            if start is None:
+                start = index
+            run_ends = position + 1 == len(pending) or pending[position + 1] != index + 1
+            if run_ends or index + 1 - start == PAGES_PER_TASK:
+                tasks.append((volume, pdf_path, start, index + 1, coordinates[volume], headers_dir if ocr_csv_path is None else None))
+                start = None
+
+    if ocr_csv_path is None:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for results in executor.map(render_pages, tasks):
+                for _, _, message in results:
+                    print(message)
+        return
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_ocr_worker) as executor:
+            for rows in executor.map(render_and_ocr_pages, tasks):
+                for row, message in rows:
+                    if row is not None:
+                        writer.writerow(row)
+                    print(message)
+                csvfile.flush()
+    finally:
+        csvfile.close()
+    print(f"\nOCR results saved to {ocr_csv_path}")
 
 
 if __name__ == "__main__":
-    IMAGES_DIR = 'images'
-    HEADERS_DIR = 'headers'
-    COORDINATES_CSV = 'header_coordinates.csv'
+    parser = argparse.ArgumentParser(description="Render the page headers of the CTAT volumes straight from their PDFs.")
+    parser.add_argument("--pdfs-dir", default='pdfs', help="Directory with one PDF per volume, named after the volume (default: pdfs).")
+    parser.add_argument("--headers-dir", default='headers', help="Directory the header images are saved to (default: headers).")
+    parser.add_argument("--coordinates", default='header_coordinates.csv', help="Header boxes of each volume in 300 dpi pixels (default: header_coordinates.csv).")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: one per core).")
+    parser.add_argument(
+        "--ocr", metavar="CSV", default=None,
+        help="Read the headers in memory instead of saving them, appending the results to this CSV file (e.g. ocr_results.csv)."
+    )
+    args = parser.parse_args()
 
     try:
-        crop_coordinates = get_crop_coordinates(COORDINATES_CSV)
-        process_images(IMAGES_DIR, HEADERS_DIR, crop_coordinates)
+        crop_coordinates = get_crop_coordinates(args.coordinates)
+        render_headers(args.pdfs_dir, args.headers_dir, crop_coordinates, args.workers, args.ocr)
         print("\nProcessing complete.")
     except FileNotFoundError:
-        print(f"Error: The file {COORDINATES_CSV} was not found.")
+        print(f"Error: The file {args.coordinates} was not found.")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
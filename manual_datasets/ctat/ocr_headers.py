@@ -1,43 +1,128 @@
+import argparse
 import os
 import csv
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image
 import pytesseract
 
-def ocr_images_in_directory(directory_path, output_csv_path):
+# A header holds one reference such as "I S 1,24A/25", so the image is read as
+# a single line of text made only of the characters references are written with
+HEADER_PSM = 7
+HEADER_WHITELIST = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789,./-"
+HEADER_CONFIG = f"--psm {HEADER_PSM} -c tessedit_char_whitelist={HEADER_WHITELIST}"
+
+FIELDNAMES = ['volume', 'page', 'text', 'pagina']
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# The OCR engine of a worker process, set up once by init_worker()
+_engine = None
+
+def init_worker():
+    """
+    Sets up the OCR engine of a worker process.
+
+    With tesserocr installed, every worker keeps one Tesseract engine loaded
+    for all its images. Otherwise pytesseract starts a tesseract process per
+    image. Either way Tesseract is kept to one thread, since the pool
+    already runs one worker per core.
+    """
+    global _engine
+    os.environ['OMP_THREAD_LIMIT'] = '1'
+    try:
+        import tesserocr
+    except ImportError:
+        _engine = None
+        return
+    _engine = tesserocr.PyTessBaseAPI(psm=HEADER_PSM)
+    _engine.SetVariable('tessedit_char_whitelist', HEADER_WHITELIST)
+
+def ocr_image(image):
+    """Reads the text of a header image with the header configuration."""
+    if _engine is not None:
+        _engine.SetImage(image)
+        return _engine.GetUTF8Text().strip()
+    return pytesseract.image_to_string(image, config=HEADER_CONFIG).strip()
+
+def page_number(image_file):
+    """Returns the page number an image is named after, e.g. 148 for '148.png', or '' if there is none."""
+    stem = os.path.splitext(image_file)[0]
+    return int(stem) if stem.isdigit() else ''
+
+def ocr_file(task):
+    """Reads the header image of one page; run in a worker process."""
+    volume, image_file, image_path = task
+    try:
+        with Image.open(image_path) as image:
+            text = ocr_image(image)
+    except Exception as e:
+        return None, f"Error processing {image_path}: {e}"
+    return {'volume': volume, 'page': image_file, 'text': text, 'pagina': page_number(image_file)}, f"Processed {image_path}"
+
+def repair_tail(path):
+    """Cuts off a last row that a killed run left half written."""
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+
+def open_results(output_csv_path):
+    """
+    Opens the results file for appending, writing the header if it is new.
+
+    Returns:
+        The open file, a csv.DictWriter on it, and the (volume, page) pairs
+        already in the file.
+    """
+    done = set()
+    if os.path.exists(output_csv_path) and os.path.getsize(output_csv_path) > 0:
+        repair_tail(output_csv_path)
+        with open(output_csv_path, newline='', encoding='utf-8') as csvfile:
+            done = {(row['volume'], row['page']) for row in csv.DictReader(csvfile)}
+    csvfile = open(output_csv_path, 'a', newline='', encoding='utf-8')
+    writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
+    if csvfile.tell() == 0:
+        writer.writeheader()
+    return csvfile, writer, done
+
+def ocr_images_in_directory(directory_path, output_csv_path, workers=None):
     """
     Performs OCR on all images in a directory and its subdirectories,
     saving the results to a CSV file.
 
+    Images are read by a pool of worker processes, and every result is
+    written as soon as it is in, in page order. Pages already in the CSV
+    file are skipped, so an interrupted run carries on where it stopped.
+
     Args:
         directory_path (str): The path to the directory containing the images.
         output_csv_path (str): The path to the output CSV file.
+        workers (int): The number of worker processes (default: one per core).
     """
-    results = []
+    csvfile, writer, done = open_results(output_csv_path)
+    tasks = []
     for volume_folder in sorted(os.listdir(directory_path)):
         volume_path = os.path.join(directory_path, volume_folder)
         if os.path.isdir(volume_path):
             for image_file in sorted(os.listdir(volume_path)):
-                if image_file.endswith(('.png', '.jpg', '.jpeg')):
-                    image_path = os.path.join(volume_path, image_file)
-                    try:
-                        text = pytesseract.image_to_string(Image.open(image_path)).strip()
-                        results.append({
-                            'volume': volume_folder,
-                            'page': image_file,
-                            'text': text
-                        })
-                        print(f"Processed {image_path}")
-                    except Exception as e:
-                        print(f"Error processing {image_path}: {e}")
-
-    with open(output_csv_path, 'w', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['volume', 'page', 'text']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(results)
+                if image_file.endswith(IMAGE_EXTENSIONS) and (volume_folder, image_file) not in done:
+                    tasks.append((volume_folder, image_file, os.path.join(volume_path, image_file)))
+    print(f"{len(done)} pages already read, {len(tasks)} to go")
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+            for row, message in executor.map(ocr_file, tasks, chunksize=8):
+                if row is not None:
+                    writer.writerow(row)
+                    csvfile.flush()
+                print(message)
+    finally:
+        csvfile.close()
     print(f"\nOCR results saved to {output_csv_path}")
 
 if __name__ == "__main__":
-    HEADERS_DIR = 'headers'
-    OUTPUT_CSV = 'ocr_results.csv'
-    ocr_images_in_directory(HEADERS_DIR, OUTPUT_CSV)
+    parser = argparse.ArgumentParser(description="Read the verse references in the cropped CTAT page headers.")
+    parser.add_argument("--headers-dir", default='headers', help="Directory with one folder of header images per volume (default: headers).")
+    parser.add_argument("--output", default='ocr_results.csv', help="CSV file the results are appended to (default: ocr_results.csv).")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: one per core).")
+    args = parser.parse_args()
+    ocr_images_in_directory(args.headers_dir, args.output, args.workers)
@@ -1,28 +1,157 @@
-
+import argparse
+import hashlib
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
 import requests
-import fitz  # PyMuPDF
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Volumes downloaded at once, bytes written per chunk, and (connect, read) timeouts in seconds;
+# the read timeout is per chunk, so large volumes no longer time out as a whole
+DEFAULT_WORKERS = 4
+CHUNK_SIZE = 1 << 20
+TIMEOUT = (30, 60)
+
+# Attempts per volume; each one resumes from the bytes already on disk
+MAX_ATTEMPTS = 5
+
+class IncompleteDownload(ValueError):
+    """Raised when a download ends before the whole file was received; it is resumed on the next attempt."""
+
+def make_session(workers=DEFAULT_WORKERS):
+    """Returns a session with a connection pool for `workers` threads that retries failed connections."""
+    session = requests.Session()
+    retry = Retry(total=3, connect=3, read=0, backoff_factor=1, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=('GET',))
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def _total_length(response, offset):
+    """Returns the full size of the file a response is part of, or None if the server does not say."""
+    content_range = response.headers.get('Content-Range', '')
+    if '/' in content_range and content_range.rsplit('/', 1)[1].isdigit():
+        return int(content_range.rsplit('/', 1)[1])
+    if 'Content-Length' in response.headers:
+        return offset + int(response.headers['Content-Length'])
+    return None
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def download_pdf(session, url, pdf_path, sha256=None):
+    """
+    Streams a PDF to disk, resuming a partial download with an HTTP Range request.
+
+    The file is written to `pdf_path + '.part'` and only renamed to
+    `pdf_path` once its length, checksum if given, and PDF signature check
+    out, so a PDF that exists is always complete. A server that ignores the
+    Range header sends the whole file, which then replaces the partial one.
+
+    Returns:
+        The number of bytes received.
+
+    Raises:
+        requests.exceptions.RequestException: If the download fails.
+        IncompleteDownload: If the download ended early.
+        ValueError: If the file fails its checks.
+    """
+    part_path = pdf_path + '.part'
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {'Range': f'bytes={offset}-'} if offset else {}
+    received = 0
+    with session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+        if response.status_code == 416:
+            # The partial file already holds every byte there is
+            total = _total_length(response, offset)
+            if total is not None and total != offset:
+                os.remove(part_path)
+                raise ValueError(f"Partial file of {offset} bytes does not match the {total} bytes of {url}; discarded it")
+        else:
+            response.raise_for_status()
+            if response.status_code != 206:
+                offset = 0
+            total = _total_length(response, offset)
+            with open(part_path, 'ab' if offset else 'wb') as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+                    received += len(chunk)
+
+    size = os.path.getsize(part_path)
+    if total is not None and size != total:
+        raise IncompleteDownload(f"Received {size} of {total} bytes of {url}")
+    if sha256 and _sha256(part_path) != sha256.lower():
+        os.remove(part_path)
+        raise ValueError(f"Checksum of {url} does not match; discarded the download")
+    with open(part_path, 'rb') as f:
+        if f.read(5) != b'%PDF-':
+            os.remove(part_path)
+            raise ValueError(f"{url} is not a PDF; discarded the download")
+    os.replace(part_path, pdf_path)
+    return received
+
+def fetch_volume(session, volume, url, pdf_path, sha256=None):
+    """Downloads one volume, resuming after interrupted attempts; run in a worker thread."""
+    messages = [f"  Downloading volume '{volume}' from {url}..."]
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            received = download_pdf(session, url, pdf_path, sha256)
+            messages.append(f"  PDF saved to {pdf_path} ({received} bytes received)")
+            return True, messages
+        except (requests.exceptions.RequestException, IncompleteDownload) as e:
+            messages.append(f"  Attempt {attempt} of {MAX_ATTEMPTS} for volume '{volume}' failed: {e}")
+        except ValueError as e:
+            messages.append(f"  Volume '{volume}' failed its checks: {e}")
+            break
+    return False, messages
+
+def convert_pdf(pdf_path, image_folder):
+    """Saves each page of a PDF as a 300 dpi image."""
+    import fitz  # PyMuPDF, only needed for full-page images
+    print(f"  Converting {pdf_path} to images...")
+    os.makedirs(image_folder, exist_ok=True)
+    with fitz.open(pdf_path) as doc:
+        if not doc.page_count:
+            print(f"  Warning: PDF '{pdf_path}' has no pages.")
+            return
+        for page_num in range(doc.page_count):
+            page = doc.load_page(page_num)
+            pix = page.get_pixmap(dpi=300)
+            output_image_path = os.path.join(image_folder, f'{page_num + 1}.png')
+            pix.save(output_image_path)
+        print(f"  Saved {doc.page_count} pages as images in {image_folder}")
 
-def download_and_convert_pdfs(csv_file):
+def download_and_convert_pdfs(csv_file, full_pages=False, workers=DEFAULT_WORKERS):
     """
-    Downloads PDFs from a CSV file, saves them, and converts each page to an image.
-    It skips volumes that have already been processed.
+    Downloads PDFs from a CSV file and saves them, and with `full_pages`
+    converts each page to an image. It skips volumes that have already been processed.
+
+    Several volumes are downloaded at once over one pooled session, each
+    streamed to disk and resumed where an earlier run stopped. An optional
+    `sha256` column in the CSV file is checked against each download.
+
+    The headers are rendered straight from the PDFs by crop_headers.py, so
+    full-page images are only needed to measure header coordinates for a new volume.
     """
     # Create base directories if they don't exist
     pdfs_dir = 'pdfs'
     images_dir = 'images'
     os.makedirs(pdfs_dir, exist_ok=True)
-    os.makedirs(images_dir, exist_ok=True)
 
     # Read the CSV file
     try:
-        df = pd.read_csv(csv_file)
+        df = pd.read_csv(csv_file, dtype=str)
     except FileNotFoundError:
         print(f"Error: The file '{csv_file}' was not found.")
         return
 
-    # Process each row in the CSV
+    downloads = []
+    to_convert = []
     for index, row in df.iterrows():
         try:
             volume = str(row['volume'])
@@ -30,55 +159,51 @@ def download_and_convert_pdfs(csv_file):
         except KeyError as e:
             print(f"Skipping row {index+2}: Missing expected column {e}.")
             continue
+        sha256 = row['sha256'] if 'sha256' in df.columns and pd.notna(row['sha256']) else None
 
         pdf_path = os.path.join(pdfs_dir, f'{volume}.pdf')
         image_folder = os.path.join(images_dir, volume)
+        needs_images = full_pages and not (os.path.exists(image_folder) and os.listdir(image_folder))
 
-        # Check if the image folder already exists, if so, skip this volume
-        if os.path.exists(image_folder) and os.listdir(image_folder):
-            print(f"Volume '{volume}' already processed. Skipping.")
+        # A PDF only exists once it was downloaded in full, so it is not fetched again
+        if os.path.exists(pdf_path):
+            if needs_images:
+                to_convert.append((pdf_path, image_folder))
+            else:
+                print(f"Volume '{volume}' already processed. Skipping.")
             continue
+        downloads.append((volume, url, pdf_path, sha256, image_folder))
 
-        print(f"Processing volume '{volume}'...")
-
-        # Create a folder for the images
-        os.makedirs(image_folder, exist_ok=True)
-
-        # Download the PDF
-        try:
-            print(f"  Downloading PDF from {url}...")
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
-            with open(pdf_path, 'wb') as f:
-                f.write(response.content)
-            print(f"  PDF saved to {pdf_path}")
-        except requests.exceptions.RequestException as e:
-            print(f"  Error downloading {url}: {e}")
-            # Clean up empty image folder if download fails
-            if not os.listdir(image_folder):
-                os.rmdir(image_folder)
-            continue
+    print(f"Downloading {len(downloads)} volumes with {workers} workers...")
+    session = make_session(workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(fetch_volume, session, volume, url, pdf_path, sha256): (volume, pdf_path, image_folder)
+            for volume, url, pdf_path, sha256, image_folder in downloads
+        }
+        for future in as_completed(futures):
+            volume, pdf_path, image_folder = futures[future]
+            ok, messages = future.result()
+            print('\n'.join(messages))
+            if not ok:
+                print(f"  Error downloading volume '{volume}'; run again to retry it.")
+            elif full_pages:
+                to_convert.append((pdf_path, image_folder))
+    session.close()
 
-        # Convert PDF to images
+    # Convert PDFs to images
+    for pdf_path, image_folder in to_convert:
         try:
-            print(f"  Converting {pdf_path} to images...")
-            doc = fitz.open(pdf_path)
-            if not doc.page_count:
-                print(f"  Warning: PDF '{pdf_path}' has no pages.")
-                doc.close()
-                continue
-                
-            for page_num in range(doc.page_count):
-                page = doc.load_page(page_num)
-                pix = page.get_pixmap(dpi=300)
-                output_image_path = os.path.join(image_folder, f'{page_num + 1}.png')
-                pix.save(output_image_path)
-            
-            print(f"  Saved {doc.page_count} pages as images in {image_folder}")
-            doc.close()
+            convert_pdf(pdf_path, image_folder)
         except Exception as e:
             print(f"  Error converting {pdf_path} to images: {e}")
-            continue
 
 if __name__ == '__main__':
-    download_and_convert_pdfs('urls.csv')
+    parser = argparse.ArgumentParser(description="Download the CTAT volumes listed in urls.csv.")
+    parser.add_argument(
+        "--full-pages", action="store_true",
+        help="Also save every page as a 300 dpi image in images/, e.g. to measure the header coordinates of a new volume."
+    )
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"Number of volumes downloaded at once (default: {DEFAULT_WORKERS}).")
+    args = parser.parse_args()
+    download_and_convert_pdfs('urls.csv', args.full_pages, args.workers)
@@ -0,0 +1,313 @@
+"""
+Incremental builds of the manual datasets.
+
+Every step declares the files and directories it reads and writes, relative
+to its dataset directory. A step is run again only if the content of its
+inputs, its script included, or its command changed since it last ran, or
+an output was changed or removed. Because inputs are compared by content, a step whose
+outputs come out unchanged does not make the steps after it run again, and
+editing a cleanup rule only re-runs the cleanup. Independent steps run in
+parallel.
+
+On a fresh checkout, `--touch` records the datasets that are checked in as
+built, so that only what changes afterwards is rebuilt.
+"""
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATE_FILE = ".pipeline_state.json"
+DEFAULT_JOBS = 2
+
+TAHOT_SOURCES = [
+    f"TAHOT {volume} - Translators Amalgamated Hebrew OT - STEPBible.org CC BY.txt"
+    for volume in ("Gen-Deu", "Jos-Est", "Job-Sng", "Isa-Mal")
+]
+
+@dataclass(frozen=True)
+class Step:
+    """A command run in a dataset directory, with the paths it reads and writes there."""
+    name: str
+    directory: str
+    command: tuple[str, ...]
+    inputs: tuple[str, ...]
+    outputs: tuple[str, ...]
+
+    def paths(self, paths):
+        return [os.path.join(self.directory, path) for path in paths]
+
+STEPS = [
+    # CTAT: download the volumes, render and read their page headers, and clean what was read
+    Step("ctat-download", "ctat", ("python", "process_pdfs.py"), ("process_pdfs.py", "urls.csv"), ("pdfs",)),
+    Step("ctat-headers", "ctat", ("python", "crop_headers.py"), ("crop_headers.py", "header_coordinates.csv", "pdfs"), ("headers",)),
+    Step("ctat-ocr", "ctat", ("python", "ocr_headers.py", "--output", "ocr_results.csv"), ("ocr_headers.py", "headers"), ("ocr_results.csv",)),
+    Step("ctat-clean", "ctat", ("python", "clean_ocr_results.py"), ("clean_ocr_results.py", "ocr_rules.csv", "ocr_results.csv"), ("ocr_clean.csv",)),
+    Step("ctat-hottp", "ctat", ("bash", "hottp_extractor.sh"), ("hottp_extractor.sh", "HOTTP-PENTATEUCH.txt"), ("hottp_refs.txt",)),
+    # Qere/Ketiv: classify the Qere/Ketiv words of TAHOT, then list the verses that have them
+    Step(
+        "qk-analyze", "qere_ketiv", ("python", "qk_analyzer.py"), ("qk_analyzer.py", *TAHOT_SOURCES),
+        ("different_lexicon_entry.csv", "same_lexicon_entry_different_parsing.csv", "stats.csv"),
+    ),
+    Step(
+        "qk-verses", "qere_ketiv", ("python", "verse_consolidator.py"),
+        ("verse_consolidator.py", "different_lexicon_entry.csv", "same_lexicon_entry_different_parsing.csv"),
+        ("qere_ketiv_verses.csv",),
+    ),
+]
+
+# Steps that append to their output and skip what is already in it; they start from an
+# empty output when their inputs change, so that nothing stale is kept
+FRESH_OUTPUTS = {"ctat-ocr"}
+
+def dependencies(steps):
+    """
+    Returns the steps each step depends on: those writing a path it reads.
+
+    Raises:
+        ValueError: If two steps write the same path or the steps form a cycle.
+    """
+    writers = {}
+    for step in steps:
+        for path in step.paths(step.outputs):
+            if path in writers:
+                raise ValueError(f"{path} is written by both {writers[path]} and {step.name}")
+            writers[path] = step.name
+    depends = {}
+    for step in steps:
+        depends[step.name] = {
+            writer
+            for path in step.paths(step.inputs)
+            for output, writer in writers.items()
+            if writer != step.name and (path == output or path.startswith(output + os.sep))
+        }
+    visiting, visited = set(), set()
+
+    def visit(name):
+        if name in visiting:
+            raise ValueError(f"The steps form a cycle through {name}")
+        if name not in visited:
+            visiting.add(name)
+            for dependency in depends[name]:
+                visit(dependency)
+            visiting.discard(name)
+            visited.add(name)
+
+    for name in depends:
+        visit(name)
+    return depends
+
+class Fingerprints:
+    """
+    Content hashes of files and directories.
+
+    A file is only hashed again if its size or modification time changed
+    since it was last hashed, so unchanged PDFs and header images cost a stat.
+    """
+    def __init__(self, root, cache=None):
+        self.root = root
+        self.cache = cache if cache is not None else {}
+
+    def file(self, path):
+        stat = os.stat(os.path.join(self.root, path))
+        cached = self.cache.get(path)
+        if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        digest = hashlib.blake2b(digest_size=16)
+        with open(os.path.join(self.root, path), 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        self.cache[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def path(self, path):
+        """Returns the hash of a file, or of the names and contents of the files under a directory, or None if there is neither."""
+        full_path = os.path.join(self.root, path)
+        if os.path.isfile(full_path):
+            return self.file(path)
+        if not os.path.isdir(full_path):
+            return None
+        digest = hashlib.blake2b(digest_size=16)
+        for directory, subdirectories, files in os.walk(full_path):
+            subdirectories.sort()
+            for name in sorted(files):
+                relative = os.path.relpath(os.path.join(directory, name), self.root)
+                digest.update(f"{os.path.relpath(relative, path)}\0{self.file(relative)}\n".encode('utf-8'))
+        return digest.hexdigest()
+
+    def step(self, step):
+        """Returns the hash of a step's command and inputs."""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(json.dumps(step.command).encode('utf-8'))
+        for path in step.paths(step.inputs):
+            digest.update(f"{path}\0{self.path(path)}\n".encode('utf-8'))
+        return digest.hexdigest()
+
+class PipelineState:
+    """The hashes of the inputs and outputs of each step when it last ran, and the file hash cache, kept in a JSON file."""
+    def __init__(self, path):
+        self.path = path
+        self.steps, cache = {}, {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            self.steps, cache = data['steps'], data['files']
+        self.fingerprints = Fingerprints(os.path.dirname(path), cache)
+
+    def save(self):
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'steps': self.steps, 'files': self.fingerprints.cache}, f, indent=1, sort_keys=True)
+        os.replace(self.path + '.tmp', self.path)
+
+    def outputs(self, step):
+        return {path: self.fingerprints.path(path) for path in step.paths(step.outputs)}
+
+    def stale(self, step):
+        """
+        Returns why a step has to run, or None if it is up to date.
+
+        An output is only missing if it was there when the step last ran, so
+        intermediate outputs that were never kept, such as the header images
+        of a fresh checkout, do not make a step run again.
+        """
+        recorded = self.steps.get(step.name)
+        if recorded is None:
+            return "never ran"
+        if recorded['inputs'] != self.fingerprints.step(step):
+            return "inputs changed"
+        changed = [path for path, digest in self.outputs(step).items() if digest != recorded['outputs'].get(path)]
+        if changed:
+            return f"{', '.join(changed)} changed or missing"
+        return None
+
+    def record(self, step):
+        self.steps[step.name] = {'inputs': self.fingerprints.step(step), 'outputs': self.outputs(step)}
+
+def remove_outputs(root, step):
+    for path in step.paths(step.outputs):
+        full_path = os.path.join(root, path)
+        if os.path.isfile(full_path):
+            os.remove(full_path)
+
+def run_step(root, step):
+    """Runs a step in its dataset directory; run in a worker thread."""
+    command = [sys.executable if part == "python" else part for part in step.command]
+    result = subprocess.run(command, cwd=os.path.join(root, step.directory), capture_output=True, text=True)
+    return result.returncode, result.stdout + result.stderr
+
+def select(steps, depends, targets):
+    """Returns the targets and every step they depend on, in declaration order."""
+    if not targets:
+        return list(steps)
+    names = {step.name for step in steps}
+    unknown = [target for target in targets if target not in names]
+    if unknown:
+        raise ValueError(f"Unknown steps: {', '.join(unknown)}")
+    selected = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending.extend(depends[name])
+    return [step for step in steps if step.name in selected]
+
+def build(root=ROOT, targets=None, jobs=DEFAULT_JOBS, force=False, touch=False, dry_run=False, steps=STEPS):
+    """
+    Brings the outputs of the selected steps up to date.
+
+    Returns:
+        The outcome of each step: 'ran', 'up to date', 'touched', 'would run',
+        'failed', 'missing inputs' or 'blocked' (a step it depends on failed).
+    """
+    depends = dependencies(steps)
+    selected = select(steps, depends, targets)
+    state = PipelineState(os.path.join(root, STATE_FILE))
+    outcomes = {}
+    running = {}
+
+    def missing_inputs(step):
+        return [
+            path for path in step.paths(step.inputs)
+            if state.fingerprints.path(path) is None and not any(path in other.paths(other.outputs) for other in steps)
+        ]
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while len(outcomes) < len(selected):
+            for step in selected:
+                if step.name in outcomes or step.name in running:
+                    continue
+                upstream = [outcomes.get(name) for name in depends[step.name] if any(s.name == name for s in selected)]
+                if any(outcome is None for outcome in upstream):
+                    continue
+                if any(outcome in ('failed', 'missing inputs', 'blocked') for outcome in upstream):
+                    outcomes[step.name] = 'blocked'
+                    print(f"{step.name}: blocked, a step it depends on did not finish")
+                    continue
+                if 'would run' in upstream:
+                    outcomes[step.name] = 'would run'
+                    print(f"{step.name}: would run if a step it depends on changes its outputs")
+                    continue
+                if touch:
+                    state.record(step)
+                    outcomes[step.name] = 'touched'
+                    print(f"{step.name}: recorded as up to date")
+                    continue
+                reason = "forced" if force else state.stale(step)
+                if reason is None:
+                    outcomes[step.name] = 'up to date'
+                    print(f"{step.name}: up to date")
+                    continue
+                missing = missing_inputs(step)
+                if missing:
+                    outcomes[step.name] = 'missing inputs'
+                    print(f"{step.name}: cannot run ({reason}), missing {', '.join(missing)}")
+                    continue
+                if dry_run:
+                    outcomes[step.name] = 'would run'
+                    print(f"{step.name}: would run ({reason})")
+                    continue
+                print(f"{step.name}: running ({reason})")
+                if step.name in FRESH_OUTPUTS:
+                    remove_outputs(root, step)
+                running[step.name] = executor.submit(run_step, root, step)
+
+            if not running:
+                continue
+            finished, _ = wait(running.values(), return_when=FIRST_COMPLETED)
+            for name, future in list(running.items()):
+                if future not in finished:
+                    continue
+                del running[name]
+                step = next(step for step in selected if step.name == name)
+                returncode, output = future.result()
+                if returncode == 0:
+                    state.record(step)
+                    state.save()
+                    outcomes[name] = 'ran'
+                    print(f"{name}: done")
+                else:
+                    outcomes[name] = 'failed'
+                    print(f"{name}: failed with exit code {returncode}\n{output[-2000:]}")
+
+    if touch or not dry_run:
+        state.save()
+    return outcomes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the manual datasets whose inputs changed.")
+    parser.add_argument("steps", nargs="*", help=f"Steps to bring up to date, with the steps they depend on (default: all of {', '.join(step.name for step in STEPS)}).")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help=f"Number of steps run at once (default: {DEFAULT_JOBS}).")
+    parser.add_argument("--force", action="store_true", help="Run the selected steps even if they are up to date.")
+    parser.add_argument("--touch", action="store_true", help="Record the selected steps as up to date without running them, e.g. for the datasets of a fresh checkout.")
+    parser.add_argument("--dry-run", action="store_true", help="Only print which steps would run.")
+    args = parser.parse_args()
+
+    outcomes = build(targets=args.steps, jobs=args.jobs, force=args.force, touch=args.touch, dry_run=args.dry_run)
+    sys.exit(1 if any(outcome in ('failed', 'missing inputs', 'blocked') for outcome in outcomes.values()) else 0)
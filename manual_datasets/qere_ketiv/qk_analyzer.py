@@ -1,81 +1,125 @@
+import argparse
+import io
 import pandas as pd
-import numpy as np
 
-qk = pd.read_csv("OT-QK.tsv", sep="\t", header=None)
-columns_to_keep = [0,1,6,4,5]
-qk = qk.iloc[:,columns_to_keep]
-qk.columns = ["Coordinates", "Qere", "Ketiv", "Strongs Q", "Parsing Q"]
-
-# Splitting the coordinates
-
-qk["Coordinates"] = qk["Coordinates"].str.replace("=Q(K)", "")
-book_and_verse = qk["Coordinates"].str.split("#", expand=True)[0]
-book_and_verse = book_and_verse.str.replace(r"\([^)]*\)", "", regex=True)
-word_series = qk["Coordinates"].str.split("#", expand=True)[1].astype(int)
-book = book_and_verse.str.split(".", expand=True)[0]
-chapter = book_and_verse.str.split(".", expand=True)[1].astype(int)
-verse = book_and_verse.str.split(".", expand=True)[2]
-
-qk["book"] = book
-qk["chapter"] = chapter
-qk["verse"] = verse
-qk["word_index"] = word_series
-del qk["Coordinates"]
-
-qk = qk[["book", "chapter", "verse", "word_index", "Qere", "Ketiv", "Strongs Q", "Parsing Q"]]
-
-
-
-# Splitting the Ketiv
-
-qk["Strongs K"] = qk["Ketiv"].str.split(expand=False).apply(lambda x: x[-1]).str.split("=").apply(lambda x: x[0])
-qk["Parsing K"] = qk["Ketiv"].str.split(expand=False).apply(lambda x: x[-1]).str.split("=").apply(lambda x: x[1])
-
-
-# Removing extra characters
-qk["Strongs K"] = qk["Strongs K"].str.replace("(", "").str.replace("/", " ").str.replace("\\", " ")
-qk["Parsing K"] = qk["Parsing K"].str.replace(")", "").str.replace("/", " ").str.replace("\\", " ")
-
-qk["Strongs Q"] = qk["Strongs Q"].str.replace("{", "").str.replace("}", "").str.replace("/", " ").str.replace("\\", " ")
-qk["Parsing Q"] = qk["Parsing Q"].str.replace("{", "").str.replace("}", "").str.replace("/", " ").str.replace("\\", " ")
-
-# Removing syntactic waws and hes
-# Waw
-qk["Strongs K"] = qk["Strongs K"].str.replace("H9001", "").str.replace("H9002", "").str.strip()
-qk["Strongs Q"] = qk["Strongs Q"].str.replace("H9001", "").str.replace("H9002", "").str.strip()
-
-qk["Parsing K"] = qk["Parsing K"].str.replace("Hc", "").str.replace("HC", "").str.strip()
-qk["Parsing Q"] = qk["Parsing Q"].str.replace("Hc", "").str.replace("HC", "").str.strip()
-
-
-# He
-qk["Strongs K"] = qk["Strongs K"].str.replace("H9009", "").str.strip()
-qk["Strongs Q"] = qk["Strongs Q"].str.replace("H9009", "").str.strip()
-# We don't remove them from the parsing as they are difficult to remove safely
-
-print(qk)
-
-
-# Splitting the dataset
-without_proper_nouns = qk[~qk["Parsing Q"].str.contains("HNpm", na=False)]
-
-different_lexicon_entry = without_proper_nouns[without_proper_nouns["Strongs Q"] != without_proper_nouns["Strongs K"]]
-
-same_lexicon_entry = without_proper_nouns[without_proper_nouns["Strongs Q"] == without_proper_nouns["Strongs K"]]
-
-same_lexicon_entry_different_parsing = same_lexicon_entry[same_lexicon_entry["Parsing Q"] != same_lexicon_entry["Parsing K"]]
-
-same_lexicon_entry_same_parsing = same_lexicon_entry[same_lexicon_entry["Parsing Q"] == same_lexicon_entry["Parsing K"]]
-
-# Saving datasets of interest
-
-different_lexicon_entry.to_csv("different_lexicon_entry.csv", index=False)
-same_lexicon_entry_different_parsing.to_csv("same_lexicon_entry_different_parsing.csv", index=False)
-
-# Saving some statistics
-
-stats = [len(qk), len(qk)-len(without_proper_nouns), len(same_lexicon_entry_same_parsing), len(same_lexicon_entry_different_parsing), len(different_lexicon_entry)]
-stats = pd.DataFrame(stats).T
-stats.columns = ["Words with QK", "Words that are proper nouns", "Words with same lexicon entry and same parsing", "Words with same lexicon entry but different parsing", "Words with different lexicon entry"]
-stats.to_csv("stats.csv", index=False)
-print(stats.T)
+# The TAHOT volumes of STEPBible.org (CC BY), in canonical order
+TAHOT_SOURCES = [
+    "TAHOT Gen-Deu - Translators Amalgamated Hebrew OT - STEPBible.org CC BY.txt",
+    "TAHOT Jos-Est - Translators Amalgamated Hebrew OT - STEPBible.org CC BY.txt",
+    "TAHOT Job-Sng - Translators Amalgamated Hebrew OT - STEPBible.org CC BY.txt",
+    "TAHOT Isa-Mal - Translators Amalgamated Hebrew OT - STEPBible.org CC BY.txt",
+]
+
+# TAHOT marks the words whose Qere is read in place of their Ketiv
+QK_MARKER = "=Q(K)"
+
+# A word reference such as "Exo.22.5(22.4)#09=Q(K)": book, chapter and verse, with the
+# English versification in parentheses, and the index of the word in the verse
+COORDINATES = r"^(?P<book>[^.#]*)\.(?P<chapter>[^.#]*)\.(?P<verse>[^.#(]*)(?:\([^)]*\))?[^#]*#(?P<word_index>[^#]*)"
+
+# The last field of a Ketiv such as 'K= tzei.dah (צֵידָה\׃) "food" (H6720\H9016=HNcbsa)'
+KETIV_ANALYSIS = r"(?:^|\s)(?P<strongs>[^\s=]*)=(?P<parsing>[^\s=]*)\S*\s*$"
+
+def read_qk_rows(sources):
+    """
+    Streams the TAHOT sources line by line and keeps the Qere/Ketiv words.
+
+    Only those lines are held in memory, so adding volumes does not grow
+    memory beyond their Qere/Ketiv words.
+
+    Returns:
+        A DataFrame with the coordinates, Qere, Ketiv, and the Qere's
+        Strong's numbers and parsing.
+    """
+    qk_lines = io.StringIO()
+    for source in sources:
+        with open(source, encoding="utf-8") as f:
+            for line in f:
+                if QK_MARKER in line:
+                    qk_lines.write(line)
+        print(f"Read {source}")
+    qk_lines.seek(0)
+    qk = pd.read_csv(qk_lines, sep="\t", header=None, usecols=[0, 1, 4, 5, 6])
+    qk = qk[[0, 1, 6, 4, 5]]
+    qk.columns = ["Coordinates", "Qere", "Ketiv", "Strongs Q", "Parsing Q"]
+    return qk
+
+def remove(series, *substrings):
+    for substring in substrings:
+        series = series.str.replace(substring, "", regex=False)
+    return series
+
+def to_spaces(series):
+    """Separates the morphemes of a word, joined by '/' and '\\' in TAHOT, with spaces."""
+    return series.str.replace("/", " ", regex=False).str.replace("\\", " ", regex=False)
+
+def split_qk(qk):
+    """Splits the coordinates and the Ketiv's analysis into columns, one pass over each."""
+    coordinates = qk["Coordinates"].str.replace(QK_MARKER, "", regex=False).str.extract(COORDINATES)
+    ketiv = qk["Ketiv"].str.extract(KETIV_ANALYSIS)
+
+    qk = pd.DataFrame({
+        "book": coordinates["book"],
+        "chapter": coordinates["chapter"].astype(int),
+        "verse": coordinates["verse"],
+        "word_index": coordinates["word_index"].astype(int),
+        "Qere": qk["Qere"],
+        "Ketiv": qk["Ketiv"],
+        "Strongs Q": to_spaces(remove(qk["Strongs Q"], "{", "}")),
+        "Parsing Q": to_spaces(remove(qk["Parsing Q"], "{", "}")),
+        "Strongs K": to_spaces(remove(ketiv["strongs"], "(")),
+        "Parsing K": to_spaces(remove(ketiv["parsing"], ")")),
+    })
+
+    # Removing syntactic waws and hes
+    # Waw
+    for column in ["Strongs K", "Strongs Q"]:
+        qk[column] = remove(qk[column], "H9001", "H9002").str.strip()
+    for column in ["Parsing K", "Parsing Q"]:
+        qk[column] = remove(qk[column], "Hc", "HC").str.strip()
+
+    # He
+    for column in ["Strongs K", "Strongs Q"]:
+        qk[column] = remove(qk[column], "H9009").str.strip()
+    # We don't remove them from the parsing as they are difficult to remove safely
+
+    return qk
+
+def analyze(sources):
+    """Extracts the Qere/Ketiv words of the TAHOT sources and saves the datasets of interest and their statistics."""
+    qk = split_qk(read_qk_rows(sources))
+    print(qk)
+
+    # Splitting the dataset
+    without_proper_nouns = qk[~qk["Parsing Q"].str.contains("HNpm", na=False)]
+
+    different_lexicon_entry = without_proper_nouns[without_proper_nouns["Strongs Q"] != without_proper_nouns["Strongs K"]]
+
+    same_lexicon_entry = without_proper_nouns[without_proper_nouns["Strongs Q"] == without_proper_nouns["Strongs K"]]
+
+    same_lexicon_entry_different_parsing = same_lexicon_entry[same_lexicon_entry["Parsing Q"] != same_lexicon_entry["Parsing K"]]
+
+    same_lexicon_entry_same_parsing = same_lexicon_entry[same_lexicon_entry["Parsing Q"] == same_lexicon_entry["Parsing K"]]
+
+    # Saving datasets of interest
+
+    different_lexicon_entry.to_csv("different_lexicon_entry.csv", index=False)
+    same_lexicon_entry_different_parsing.to_csv("same_lexicon_entry_different_parsing.csv", index=False)
+
+    # Saving some statistics
+
+    stats = [len(qk), len(qk)-len(without_proper_nouns), len(same_lexicon_entry_same_parsing), len(same_lexicon_entry_different_parsing), len(different_lexicon_entry)]
+    stats = pd.DataFrame(stats).T
+    stats.columns = ["Words with QK", "Words that are proper nouns", "Words with same lexicon entry and same parsing", "Words with same lexicon entry but different parsing", "Words with different lexicon entry"]
+    stats.to_csv("stats.csv", index=False)
+    print(stats.T)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract and classify the Qere/Ketiv words of the TAHOT files.")
+    parser.add_argument(
+        "--sources", nargs="+", default=TAHOT_SOURCES,
+        help="TAHOT files to read, in canonical order (default: the four TAHOT volumes, in this directory)."
+    )
+    args = parser.parse_args()
+    analyze(args.sources)
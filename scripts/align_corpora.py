@@ -0,0 +1,60 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+
+# Assuming the script is run from the root of the project
+from src.data_loader import configure_corpus_cache, load_data
+from src.alignment import aligned_table
+from src.divergence import divergence_scores, DEFAULT_NGRAM
+from src.result_writer import read_output, output_path, OUTPUT_FORMATS
+
+DEFAULT_OUTPUT_FORMAT = 'csv'
+DEFAULT_ALIGNED_PATH = os.path.join('output', 'aligned_verses.csv')
+
+def main(args):
+    """
+    Aligns the three corpora and whatever normalizations exist, scores how far
+    apart each pair of texts is, and saves the aligned table.
+    """
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    configure_corpus_cache()
+
+    data_dir = 'data'
+    output_dir = 'output'
+    texts = {}
+    normalizations = {}
+    for source_name in ("masoretic", "vulgate", "septuagint"):
+        texts[source_name] = load_data(os.path.join(data_dir, f"{source_name}.csv"))
+        normalized_path = output_path(output_dir, source_name, args.output_format)
+        if os.path.exists(normalized_path):
+            normalizations[source_name] = read_output(normalized_path, args.output_format)
+        else:
+            logging.info(f"No normalized output at {normalized_path}; aligning {source_name} without it.")
+
+    table = aligned_table(texts, normalizations)
+    table = table.join(divergence_scores(table, list(itertools.combinations(texts, 2)), n=args.divergence_ngram))
+    for column in table.columns:
+        if column.startswith('normalization_'):
+            table[column] = table[column].map(lambda value: json.dumps(value, ensure_ascii=False) if isinstance(value, list) else None)
+
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+    table.to_csv(args.out)
+    logging.info(f"Saved {len(table)} aligned verses to {args.out}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Align the corpora and their normalizations by canonical verse ID.")
+    parser.add_argument(
+        "--output-format", choices=OUTPUT_FORMATS, default=DEFAULT_OUTPUT_FORMAT,
+        help=f"Format of the normalized output files to read (default: {DEFAULT_OUTPUT_FORMAT})."
+    )
+    parser.add_argument(
+        "--divergence-ngram", type=int, default=DEFAULT_NGRAM,
+        help=f"Length of the character n-grams the divergence scores use (default: {DEFAULT_NGRAM})."
+    )
+    parser.add_argument(
+        "--out", default=DEFAULT_ALIGNED_PATH,
+        help=f"Where to save the aligned table as CSV (default: {DEFAULT_ALIGNED_PATH})."
+    )
+    main(parser.parse_args())
@@ -0,0 +1,165 @@
+import argparse
+import logging
+import os
+
+# Assuming the script is run from the root of the project
+from scripts.run_normalization import pending_verses, record_committed
+from src.batch_job import parse_request_key, parse_result, read_results, request_line
+from src.checkpoint import CheckpointManifest, verse_hashes
+from src.data_loader import configure_corpus_cache, load_data
+from src.normalization_service import build_batches
+from src.result_writer import ResultWriter, open_sink, output_path, OUTPUT_FORMATS, DURABILITY_POLICIES, DURABILITY_FLUSH
+
+DATA_DIR = 'data'
+OUTPUT_DIR = 'output'
+PROMPT_PATH = 'prompts/normalization_prompt.txt'
+BATCH_PROMPT_PATH = 'prompts/batch_normalization_prompt.txt'
+SOURCE_NAMES = ("masoretic", "vulgate", "septuagint")
+
+# Default location of the request file; not the repository's own requests.jsonl
+DEFAULT_REQUESTS_PATH = os.path.join('output', 'batch_requests.jsonl')
+DEFAULT_OUTPUT_FORMAT = 'csv'
+
+def source_file(source_name: str) -> str:
+    return os.path.join(DATA_DIR, f"{source_name}.csv")
+
+def open_manifest(output_format: str) -> CheckpointManifest:
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    return CheckpointManifest(os.path.join(OUTPUT_DIR, f"checkpoint_{output_format}.sqlite"))
+
+def emit(args):
+    """
+    Writes every pending verse to a batch-job request file, one request per line.
+    """
+    with open(PROMPT_PATH, 'r') as f:
+        prompt_template = f.read()
+    with open(BATCH_PROMPT_PATH, 'r') as f:
+        batch_prompt_template = f.read()
+
+    manifest = open_manifest(args.output_format)
+    requests = verses = 0
+    try:
+        with open(args.requests, 'w', encoding='utf-8') as f:
+            for source_name in SOURCE_NAMES:
+                try:
+                    df = pending_verses(
+                        source_name, source_file(source_name), output_path(OUTPUT_DIR, source_name, args.output_format),
+                        manifest, args.output_format,
+                    )
+                except FileNotFoundError:
+                    logging.warning(f"Source file not found at {source_file(source_name)}. Skipping.")
+                    continue
+                rows = df.to_dict('records')
+                batches = build_batches(rows, args.batch_tokens) if args.batch_tokens > 0 else [[row] for row in rows]
+                for batch in batches:
+                    f.write(request_line(
+                        source_name, batch, prompt_template, batch_prompt_template,
+                        structured_output=not args.no_structured_output,
+                    ))
+                requests += len(batches)
+                verses += len(rows)
+                logging.info(f"{source_name}: {len(rows)} verses in {len(batches)} requests")
+    finally:
+        manifest.close()
+    logging.info(f"Wrote {requests} requests for {verses} verses to {args.requests}")
+
+def ingest(args):
+    """
+    Merges the result file of a batch job into the normalized outputs and the checkpoint manifest.
+
+    The result file is streamed line by line and each answer goes to its
+    source's background writer, so neither file is held in memory. Verses
+    already done are skipped, so a result file can be ingested twice, and
+    verses without a usable answer are left pending.
+    """
+    manifest = open_manifest(args.output_format)
+    lookup = {}
+    completed = {}
+    writers = {}
+    counts = {'done': 0, 'failed': 0, 'skipped': 0, 'unknown': 0}
+    try:
+        for result in read_results(args.results):
+            try:
+                source_name, hashes = parse_request_key(str(result.get('key', '')))
+            except ValueError:
+                counts['unknown'] += 1
+                continue
+            if source_name not in lookup:
+                if source_name not in SOURCE_NAMES or not os.path.isfile(source_file(source_name)):
+                    counts['unknown'] += 1
+                    continue
+                df = load_data(source_file(source_name))
+                df['verse_hash'] = verse_hashes(df)
+                lookup[source_name] = {row['verse_hash']: row for row in df.to_dict('records')}
+                completed[source_name] = manifest.completed(source_name)
+            # Verses whose source text changed since the request file was written are not found
+            rows = [lookup[source_name][h] for h in hashes if h in lookup[source_name]]
+            counts['unknown'] += len(hashes) - len(rows)
+            results = parse_result(result, rows) if rows else {}
+            for row in rows:
+                if row['verse_hash'] in completed[source_name]:
+                    counts['skipped'] += 1
+                    continue
+                propositions = results[row['verse_hash']]
+                if not propositions:
+                    # Left pending, so the next request file or run sends it again
+                    counts['failed'] += 1
+                    continue
+                if source_name not in writers:
+                    writers[source_name] = ResultWriter(
+                        open_sink(output_path(OUTPUT_DIR, source_name, args.output_format), args.output_format, args.durability),
+                        on_commit=lambda rows, source_name=source_name: record_committed(manifest, source_name, rows),
+                    )
+                writers[source_name].submit(row, propositions)
+                completed[source_name].add(row['verse_hash'])
+                counts['done'] += 1
+    finally:
+        for source_name, writer in writers.items():
+            try:
+                writer.close()
+            except Exception as e:
+                logging.error(f"An error occurred while writing the results of {source_name}: {e}")
+        manifest.close()
+    logging.info(
+        f"Ingested {args.results}: {counts['done']} verses normalized, {counts['failed']} failed "
+        f"(left pending), {counts['skipped']} already done, {counts['unknown']} not found"
+    )
+    return counts
+
+def main(args):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    configure_corpus_cache()
+    return args.func(args)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Normalize in bulk through a batch-prediction job.")
+    parser.add_argument(
+        "--output-format", choices=OUTPUT_FORMATS, default=DEFAULT_OUTPUT_FORMAT,
+        help=f"Format of the normalized output files and their checkpoint (default: {DEFAULT_OUTPUT_FORMAT})."
+    )
+    subparsers = parser.add_subparsers(required=True)
+
+    emit_parser = subparsers.add_parser("emit", help="Write the pending verses as batch-job requests.")
+    emit_parser.add_argument(
+        "--requests", default=DEFAULT_REQUESTS_PATH,
+        help=f"Where to write the request file (default: {DEFAULT_REQUESTS_PATH})."
+    )
+    emit_parser.add_argument(
+        "--batch-tokens", type=int, default=0,
+        help="Pack verses into multi-verse requests of about this many tokens; 0 writes one request per verse (default: 0)."
+    )
+    emit_parser.add_argument(
+        "--no-structured-output", action="store_true",
+        help="Do not constrain the answers with a JSON response schema."
+    )
+    emit_parser.set_defaults(func=emit)
+
+    ingest_parser = subparsers.add_parser("ingest", help="Merge a batch-job result file into the outputs.")
+    ingest_parser.add_argument("results", help="The result file of the batch job (JSONL).")
+    ingest_parser.add_argument(
+        "--durability", choices=DURABILITY_POLICIES, default=DURABILITY_FLUSH,
+        help=f"Durability of the output writes (default: {DURABILITY_FLUSH})."
+    )
+    ingest_parser.set_defaults(func=ingest)
+
+    main(parser.parse_args())
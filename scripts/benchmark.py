@@ -0,0 +1,256 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+import numpy as np
+import pandas as pd
+
+# Assuming the script is run from the root of the project
+from scripts import run_normalization
+from src.fake_backend import FakeGeminiBackend, LATENCY_DISTRIBUTIONS
+from src.normalization_service import NormalizationService
+from src.result_writer import read_output, output_path, OUTPUT_FORMATS
+
+SOURCES = ("masoretic", "vulgate", "septuagint")
+
+# Book names of the synthetic corpora, in the naming scheme of each source
+SYNTHETIC_BOOKS = {"masoretic": "GEN", "vulgate": "Genesis", "septuagint": "Genesis"}
+
+SYNTHETIC_WORDS = (
+    "and the lord god said unto moses behold i will send a cloud over the land of egypt "
+    "in that day the people went out from the city and their sons and daughters with them"
+).split()
+
+def synthetic_corpus(source_name: str, verses: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Builds a corpus of random verses in the columns of a source file.
+
+    Verses run 30 to a chapter and hold 10 to 40 words, in one or two sentences.
+    """
+    rng = np.random.default_rng(seed)
+    texts = []
+    for _ in range(verses):
+        words = rng.choice(SYNTHETIC_WORDS, size=rng.integers(10, 41))
+        middle = len(words) // 2
+        texts.append(f"{' '.join(words[:middle]).capitalize()}; {' '.join(words[middle:])}.")
+    numbers = np.arange(verses)
+    df = pd.DataFrame({
+        'book_name': SYNTHETIC_BOOKS[source_name],
+        'chapter': numbers // 30 + 1,
+        'verse': numbers % 30 + 1,
+        'text': texts,
+    })
+    if source_name == "septuagint":
+        df.insert(3, 'potential_difference_verse', True)
+    return df
+
+def prepare_workspace(work_dir: str, data_dir: str | None, synthetic_verses: int, seed: int):
+    """Lays out the data/, prompts/ and output/ directories the driver expects in `work_dir`."""
+    os.makedirs(os.path.join(work_dir, 'data'), exist_ok=True)
+    shutil.copytree('prompts', os.path.join(work_dir, 'prompts'), dirs_exist_ok=True)
+    for position, source_name in enumerate(SOURCES):
+        target = os.path.join(work_dir, 'data', f"{source_name}.csv")
+        if data_dir is None:
+            synthetic_corpus(source_name, synthetic_verses, seed + position).to_csv(target, index=False)
+        else:
+            shutil.copyfile(os.path.join(data_dir, f"{source_name}.csv"), target)
+
+def timed_run(driver_args: argparse.Namespace, work_dir: str) -> tuple[float, list[float]]:
+    """
+    Runs the normalization driver in `work_dir`.
+
+    Returns:
+        The wall-clock seconds of the run, and the seconds each call to the
+        normalization service took, including rate-limit waits and retries.
+    """
+    latencies = []
+
+    def timed(method):
+        async def wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await method(self, *args, **kwargs)
+            finally:
+                latencies.append(time.perf_counter() - start)
+        return wrapper
+
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        with mock.patch.object(NormalizationService, 'normalize_async', timed(NormalizationService.normalize_async)), \
+             mock.patch.object(NormalizationService, 'normalize_batched_async', timed(NormalizationService.normalize_batched_async)):
+            start = time.perf_counter()
+            run_normalization.main(driver_args)
+            return time.perf_counter() - start, latencies
+    finally:
+        os.chdir(cwd)
+
+def percentiles(values: list[float]) -> dict:
+    """Returns the p50, p95 and p99 of `values` in seconds, or None if there are none."""
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50': float(p50), 'p95': float(p95), 'p99': float(p99)}
+
+def benchmark(args) -> dict:
+    """
+    Runs the real normalization driver against a fake Gemini backend, then
+    again to time how long resuming a finished run takes.
+    """
+    backend = FakeGeminiBackend(
+        latency=args.latency,
+        latency_mean=args.latency_mean,
+        latency_spread=args.latency_spread,
+        rate_limit_rate=args.rate_limit_rate,
+        malformed_rate=args.malformed_rate,
+        requests_per_minute=args.backend_rpm,
+        tokens_per_minute=args.backend_tpm,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='tessela-benchmark-')
+    prepare_workspace(work_dir, args.data_dir, args.synthetic_verses, args.seed)
+    # Fake keys, each with its own quota in the backend
+    keys_file = os.path.join(work_dir, 'api_keys.txt')
+    with open(keys_file, 'w') as f:
+        f.writelines(f"fake-key-{number}\n" for number in range(1, args.api_keys + 1))
+    driver_args = run_normalization.build_parser().parse_args([
+        '--concurrency', str(args.concurrency),
+        '--batch-tokens', str(args.batch_tokens),
+        '--output-format', args.output_format,
+        '--rpm', str(args.rpm),
+        '--tpm', str(args.tpm),
+        '--no-cache',
+        '--api-keys-file', os.path.abspath(keys_file),
+    ])
+
+    output_paths = [output_path(os.path.join(work_dir, 'output'), name, args.output_format) for name in SOURCES]
+    with backend.install():
+        wall_seconds, latencies = timed_run(driver_args, work_dir)
+        stats = backend.stats()
+        backend_latencies = list(backend.latencies)
+        # Batched service calls cover many verses, so count them from the outputs
+        processed = sum(len(read_output(path, args.output_format)) for path in output_paths if os.path.exists(path))
+        with open(os.path.join(work_dir, run_normalization.SUMMARY_PATH), encoding='utf-8') as f:
+            summary = json.load(f)
+        # Resuming re-sends the verses that failed, e.g. on malformed answers
+        resume_seconds, _ = timed_run(driver_args, work_dir)
+
+    report = {
+        'work_dir': work_dir,
+        'verses': processed,
+        'wall_seconds': wall_seconds,
+        'verses_per_second': processed / wall_seconds if wall_seconds > 0 else None,
+        'service_calls': len(latencies),
+        'latency_seconds': percentiles(latencies),
+        'backend_latency_seconds': percentiles(backend_latencies),
+        'retries': stats['rate_limited'],
+        'requests': stats['requests'],
+        'api_keys': args.api_keys,
+        'malformed': stats['malformed'],
+        'prompt_tokens': stats['prompt_tokens'],
+        'output_tokens': stats['output_tokens'],
+        'rate_limit_wait_fraction': summary['rate_limit_wait_fraction'],
+        'writer_busy_fraction': summary['writer_busy_fraction'],
+        'resume_seconds': resume_seconds,
+        'resume_requests': backend.stats()['requests'] - stats['requests'],
+    }
+    if args.work_dir is None and not args.keep:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return report
+
+def main(args):
+    report = benchmark(args)
+    logging.info(f"Benchmark report: {report}")
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the normalization pipeline against a local fake Gemini backend.")
+    parser.add_argument(
+        "--data-dir", default=None,
+        help="Directory with masoretic.csv, vulgate.csv and septuagint.csv to benchmark on (default: synthetic data)."
+    )
+    parser.add_argument(
+        "--synthetic-verses", type=int, default=1000,
+        help="Number of synthetic verses per source when no --data-dir is given (default: 1000)."
+    )
+    parser.add_argument(
+        "--latency", choices=LATENCY_DISTRIBUTIONS, default='lognormal',
+        help="Distribution of the backend latency (default: lognormal)."
+    )
+    parser.add_argument(
+        "--latency-mean", type=float, default=0.2,
+        help="Mean backend latency in seconds, the median for lognormal (default: 0.2)."
+    )
+    parser.add_argument(
+        "--latency-spread", type=float, default=0.5,
+        help="Half-width in seconds for uniform, sigma for lognormal (default: 0.5)."
+    )
+    parser.add_argument(
+        "--rate-limit-rate", type=float, default=0.0,
+        help="Fraction of requests answered with a 429 error (default: 0)."
+    )
+    parser.add_argument(
+        "--malformed-rate", type=float, default=0.0,
+        help="Fraction of requests answered with invalid JSON (default: 0)."
+    )
+    parser.add_argument(
+        "--retry-after", type=float, default=1.0,
+        help="Retry hint in seconds sent with injected 429 errors (default: 1)."
+    )
+    parser.add_argument(
+        "--backend-rpm", type=int, default=None,
+        help="Requests-per-minute quota per key the backend enforces with 429 errors (default: none)."
+    )
+    parser.add_argument(
+        "--backend-tpm", type=int, default=None,
+        help="Tokens-per-minute quota per key the backend enforces with 429 errors (default: none)."
+    )
+    parser.add_argument(
+        "--api-keys", type=int, default=1,
+        help="Number of fake API keys the driver spreads its requests over; the quotas apply to each (default: 1)."
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=run_normalization.DEFAULT_CONCURRENCY,
+        help=f"Concurrency of the driver (default: {run_normalization.DEFAULT_CONCURRENCY})."
+    )
+    parser.add_argument(
+        "--batch-tokens", type=int, default=run_normalization.DEFAULT_BATCH_TOKENS,
+        help="Batch size of the driver in estimated tokens; 0 sends one verse per request (default: 0)."
+    )
+    parser.add_argument(
+        "--output-format", choices=OUTPUT_FORMATS, default=run_normalization.DEFAULT_OUTPUT_FORMAT,
+        help=f"Output format of the driver (default: {run_normalization.DEFAULT_OUTPUT_FORMAT})."
+    )
+    parser.add_argument(
+        "--rpm", type=int, default=run_normalization.DEFAULT_RPM,
+        help=f"Requests-per-minute quota per key the driver paces itself to (default: {run_normalization.DEFAULT_RPM})."
+    )
+    parser.add_argument(
+        "--tpm", type=int, default=run_normalization.DEFAULT_TPM,
+        help=f"Tokens-per-minute quota per key the driver paces itself to (default: {run_normalization.DEFAULT_TPM})."
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0,
+        help="Seed of the synthetic data and of the backend's random draws (default: 0)."
+    )
+    parser.add_argument(
+        "--work-dir", default=None,
+        help="Directory to run in, kept afterwards (default: a temporary directory)."
+    )
+    parser.add_argument(
+        "--keep", action="store_true",
+        help="Keep the temporary directory with the outputs of the run."
+    )
+    parser.add_argument(
+        "--report", default=None,
+        help="Also save the JSON report to this path."
+    )
+    main(parser.parse_args())
@@ -0,0 +1,114 @@
+import argparse
+import logging
+import os
+
+# Assuming the script is run from the root of the project
+from scripts.run_normalization import SHARD_DIR, record_committed
+from src.checkpoint import CheckpointManifest, verse_hashes
+from src.result_writer import ResultWriter, open_sink, output_path, read_output, OUTPUT_FORMATS, DURABILITY_POLICIES, DURABILITY_FLUSH
+from src.shard_queue import ShardQueue, repair_shard_output, shard_outputs
+
+OUTPUT_DIR = 'output'
+SOURCE_NAMES = ("masoretic", "vulgate", "septuagint")
+DEFAULT_OUTPUT_FORMAT = 'csv'
+
+def shard_results(source_name: str, output_format: str) -> dict[int, dict]:
+    """
+    Collects the results of every shard output of a source.
+
+    A verse written by several workers, e.g. by one that lost its lease and
+    the one that took the shard over, is kept once, preferring a successful
+    normalization over a failed one.
+
+    Returns:
+        The rows by verse hash, in shard order.
+    """
+    results = {}
+    for path in shard_outputs(SHARD_DIR, source_name, output_format):
+        if repair_shard_output(path):
+            logging.warning(f"Removed a partially written last line from {path}.")
+        try:
+            df = read_output(path, output_format)
+        except Exception as e:
+            logging.error(f"Could not read {path}, skipping it: {e}")
+            continue
+        if not len(df):
+            continue
+        df['verse_hash'] = verse_hashes(df)
+        for row in df.to_dict('records'):
+            kept = results.get(row['verse_hash'])
+            if kept is None or (row['normalization'] and not kept['normalization']):
+                results[row['verse_hash']] = row
+    return results
+
+def merge(args) -> dict[str, dict[str, int]]:
+    """
+    Merges the per-shard outputs of sharded workers into the canonical
+    `*_normalised.*` outputs and their checkpoint manifest.
+
+    Verses already done in the manifest are skipped, and so are failed
+    verses already recorded, so merging again, e.g. while workers are still
+    running, only adds what is new.
+
+    Returns:
+        The number of verses merged and skipped, by source.
+    """
+    if args.shard_queue:
+        queue = ShardQueue(args.shard_queue)
+        progress = queue.progress()
+        queue.close()
+        unfinished = {source: counts for source, counts in progress.items() if set(counts) - {'done'}}
+        if unfinished:
+            logging.warning(f"Not every shard is done yet, merging what there is: {unfinished}")
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    manifest = CheckpointManifest(os.path.join(OUTPUT_DIR, f"checkpoint_{args.output_format}.sqlite"))
+    counts = {}
+    try:
+        for source_name in SOURCE_NAMES:
+            results = shard_results(source_name, args.output_format)
+            if not results:
+                continue
+            done = manifest.completed(source_name)
+            recorded = manifest.recorded(source_name)
+            counts[source_name] = {'merged': 0, 'skipped': 0}
+            writer = ResultWriter(
+                open_sink(output_path(OUTPUT_DIR, source_name, args.output_format), args.output_format, args.durability),
+                on_commit=lambda rows, source_name=source_name: record_committed(manifest, source_name, rows),
+            )
+            try:
+                for verse_hash, row in results.items():
+                    if verse_hash in done or (not row['normalization'] and verse_hash in recorded):
+                        counts[source_name]['skipped'] += 1
+                        continue
+                    writer.submit(row, row['normalization'])
+                    counts[source_name]['merged'] += 1
+            finally:
+                writer.close()
+            logging.info(
+                f"{source_name}: merged {counts[source_name]['merged']} verses into "
+                f"{output_path(OUTPUT_DIR, source_name, args.output_format)}, {counts[source_name]['skipped']} already there"
+            )
+    finally:
+        manifest.close()
+    return counts
+
+def main(args):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    return merge(args)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Merge the per-shard outputs of sharded workers into the normalized outputs.")
+    parser.add_argument(
+        "--shard-queue", default=None,
+        help="The workers' shard queue, to warn about shards that are not done yet (default: none)."
+    )
+    parser.add_argument(
+        "--output-format", choices=OUTPUT_FORMATS, default=DEFAULT_OUTPUT_FORMAT,
+        help=f"Format of the shard outputs and of the normalized output files (default: {DEFAULT_OUTPUT_FORMAT})."
+    )
+    parser.add_argument(
+        "--durability", choices=DURABILITY_POLICIES, default=DURABILITY_FLUSH,
+        help=f"Durability of the output writes (default: {DURABILITY_FLUSH})."
+    )
+    main(parser.parse_args())
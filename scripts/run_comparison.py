@@ -0,0 +1,222 @@
+import argparse
+import asyncio
+import logging
+import os
+import time
+from tqdm import tqdm
+
+# Assuming the script is run from the root of the project
+from src.comparison_service import ComparisonService, PairMatcher, COMPARISON_SCHEMA, DEFAULT_PAIRS, pair_name, parse_pairs
+from src.checkpoint import CheckpointManifest, DONE, FAILED, repair_torn_tail
+from src.result_writer import (
+    OutputTail, ResultWriter, open_sink, output_path, OUTPUT_FORMATS, DURABILITY_POLICIES, DURABILITY_FLUSH,
+)
+from src.response_cache import configure_response_cache
+from src.utils import configure_rate_limiter
+
+DEFAULT_CONCURRENCY = 100
+DEFAULT_OUTPUT_FORMAT = 'csv'
+DEFAULT_CACHE_PATH = os.path.join('output', 'response_cache.sqlite')
+DEFAULT_RPM = 2000
+DEFAULT_TPM = 4_000_000
+
+# How often the normalized outputs are checked for new rows, and how long
+# --follow waits without new rows before stopping
+DEFAULT_POLL_INTERVAL = 2.0
+DEFAULT_IDLE_TIMEOUT = 300.0
+
+def setup_logging():
+    """Sets up the logging for the script."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler("comparison.log"),
+            logging.StreamHandler()
+        ]
+    )
+
+async def compare_stream(
+    tails: dict[str, OutputTail],
+    matcher: PairMatcher,
+    completed: dict[str, set[int]],
+    writer: ResultWriter,
+    service: ComparisonService,
+    progress: tqdm,
+    concurrency: int,
+    follow: bool = False,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+    idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+):
+    """
+    Compares verse pairs as their normalizations appear in the outputs.
+
+    The outputs are polled for new rows, and each pair whose two sides are
+    both normalized is queued for up to `concurrency` workers straight away.
+    Without `follow`, the outputs are read once; with it, polling continues
+    until no new rows have appeared for `idle_timeout` seconds.
+    """
+    queue = asyncio.Queue()
+
+    async def worker():
+        while True:
+            pair = await queue.get()
+            try:
+                result = await service.compare_async(
+                    pair['source_a'], pair['normalization_a'], pair['source_b'], pair['normalization_b']
+                )
+            except Exception as exc:
+                logging.error(f"{pair_name(pair['source_a'], pair['source_b'])}: {pair['book']} {pair['chapter']}:{pair['verse']} generated an exception: {exc}")
+                result = None
+            writer.submit_row({
+                'verse_id': pair['verse_id'],
+                'book': pair['book'],
+                'chapter': pair['chapter'],
+                'verse': pair['verse'],
+                'source_a': pair['source_a'],
+                'source_b': pair['source_b'],
+                'difference': result[0] if result is not None else None,
+                'justification': result[1] if result is not None else None,
+                'verse_hash': pair['verse_hash'],
+            })
+            progress.update(1)
+            queue.task_done()
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+    last_rows = time.monotonic()
+    while True:
+        for source_name, tail in tails.items():
+            rows = tail.read_new()
+            if rows:
+                last_rows = time.monotonic()
+            for pair in matcher.add(source_name, rows):
+                if pair['verse_hash'] in completed[pair_name(pair['source_a'], pair['source_b'])]:
+                    continue
+                queue.put_nowait(pair)
+                progress.total += 1
+                progress.refresh()
+        if not follow or time.monotonic() - last_rows >= idle_timeout:
+            break
+        await asyncio.sleep(poll_interval)
+
+    await queue.join()
+    for task in workers:
+        task.cancel()
+
+def record_committed(manifest: CheckpointManifest, rows: list[dict]):
+    """Marks comparisons the writer has committed to disk as done or failed in the manifest."""
+    by_status = {}
+    for row in rows:
+        status = DONE if row['difference'] is not None else FAILED
+        by_status.setdefault((pair_name(row['source_a'], row['source_b']), status), []).append(row['verse_hash'])
+    for (name, status), hashes in by_status.items():
+        manifest.mark(name, hashes, status)
+
+def main(args):
+    """
+    Main function to run the comparison stage.
+    """
+    setup_logging()
+    logging.info("Starting comparison process...")
+    try:
+        pairs = parse_pairs(args.pairs) if args.pairs else DEFAULT_PAIRS
+    except ValueError as e:
+        logging.error(f"Invalid --pairs: {e}")
+        return
+    configure_rate_limiter(requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
+    response_cache = configure_response_cache(None if args.no_cache else args.cache_path)
+
+    output_dir = 'output'
+    prompt_path = 'prompts/comparison_prompt.txt'
+
+    try:
+        service = ComparisonService(prompt_path)
+    except (FileNotFoundError, ValueError) as e:
+        logging.error(f"Could not set up the comparison service: {e}")
+        return
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = CheckpointManifest(os.path.join(output_dir, f"comparison_checkpoint_{args.output_format}.sqlite"))
+    completed = {pair_name(*pair): manifest.completed(pair_name(*pair)) for pair in pairs}
+
+    comparisons_path = os.path.join(output_dir, f"comparisons.{args.output_format}")
+    if args.output_format != 'parquet' and os.path.isfile(comparisons_path) and repair_torn_tail(comparisons_path):
+        logging.warning(f"Removed a partially written last line from {comparisons_path}.")
+    writer = ResultWriter(
+        open_sink(comparisons_path, args.output_format, args.durability, schema=COMPARISON_SCHEMA),
+        on_commit=lambda rows: record_committed(manifest, rows),
+    )
+
+    sources = {source for pair in pairs for source in pair}
+    tails = {source: OutputTail(output_path(output_dir, source, args.output_format), args.output_format) for source in sorted(sources)}
+    progress = tqdm(total=0, desc="Comparing verses")
+    try:
+        asyncio.run(compare_stream(
+            tails, PairMatcher(pairs), completed, writer, service, progress, args.concurrency,
+            follow=args.follow, poll_interval=args.poll_interval, idle_timeout=args.idle_timeout,
+        ))
+    finally:
+        progress.close()
+        try:
+            writer.close()
+            logging.info(f"Saved the comparisons to {comparisons_path}")
+        except Exception as e:
+            logging.error(f"An error occurred while writing {comparisons_path}: {e}")
+
+    for pair in pairs:
+        logging.info(f"{pair_name(*pair)}: {manifest.counts(pair_name(*pair))}")
+    manifest.close()
+    if response_cache is not None:
+        logging.info(f"Response cache: {response_cache.stats()}")
+        configure_response_cache(None)
+
+    logging.info("Comparison process finished.")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the normalizations of each verse across sources.")
+    parser.add_argument(
+        "--pairs", default="",
+        help="Pairs of sources to compare, e.g. 'masoretic:vulgate,vulgate:septuagint' "
+             "(default: the Masoretic text against each translation)."
+    )
+    parser.add_argument(
+        "--output-format", choices=OUTPUT_FORMATS, default=DEFAULT_OUTPUT_FORMAT,
+        help=f"Format of the normalized outputs read and the comparisons written (default: {DEFAULT_OUTPUT_FORMAT})."
+    )
+    parser.add_argument(
+        "--follow", action="store_true",
+        help="Keep comparing new verses while the normalization is still running."
+    )
+    parser.add_argument(
+        "--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL,
+        help=f"Seconds between checks of the normalized outputs (default: {DEFAULT_POLL_INTERVAL})."
+    )
+    parser.add_argument(
+        "--idle-timeout", type=float, default=DEFAULT_IDLE_TIMEOUT,
+        help=f"With --follow, stop after this many seconds without new verses (default: {DEFAULT_IDLE_TIMEOUT})."
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+        help=f"Maximum number of API requests in flight at once (default: {DEFAULT_CONCURRENCY})."
+    )
+    parser.add_argument(
+        "--durability", choices=DURABILITY_POLICIES, default=DURABILITY_FLUSH,
+        help=f"How each write of the comparisons is made durable (default: {DURABILITY_FLUSH})."
+    )
+    parser.add_argument(
+        "--rpm", type=int, default=DEFAULT_RPM,
+        help=f"Requests-per-minute quota of the API key (default: {DEFAULT_RPM})."
+    )
+    parser.add_argument(
+        "--tpm", type=int, default=DEFAULT_TPM,
+        help=f"Tokens-per-minute quota of the API key (default: {DEFAULT_TPM})."
+    )
+    parser.add_argument(
+        "--cache-path", default=DEFAULT_CACHE_PATH,
+        help=f"Path to the on-disk response cache (default: {DEFAULT_CACHE_PATH})."
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="Disable the response cache."
+    )
+    main(parser.parse_args())
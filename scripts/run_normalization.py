@@ -1,17 +1,61 @@
-import json
 import argparse
+import json
 import os
 import pandas as pd
 from tqdm import tqdm
 import logging
-import concurrent.futures
+import asyncio
+from collections import deque
 
 # Assuming the script is run from the root of the project
-from src.data_loader import load_data, filter_septuagint
-from src.normalization_service import normalize_text
+from src.data_loader import configure_corpus_cache, load_data, filter_septuagint, DEFAULT_CACHE_DIR as DEFAULT_CORPUS_CACHE_DIR
+from src.normalization_service import NormalizationService, build_batches, verse_key
+from src.key_pool import configure_key_pool, load_api_keys
+from src.response_cache import configure_response_cache
+from src.metrics import configure_metrics, get_metrics, current_source, METRICS_FORMATS
+from src.checkpoint import CheckpointManifest, DONE, FAILED, verse_hashes, repair_torn_tail
+from src.scheduler import WeightedScheduler, parse_weights
+from src.divergence import divergence_flags, DEFAULT_NGRAM
+from src.planner import load_tokenizer, observed_output_tokens, plan_source, plan_run
+from src.shard_queue import ShardQueue, default_worker_id, repair_shard_output, shard_output_path, shard_outputs
+from src.result_writer import ResultWriter, open_sink, output_path, read_output, OUTPUT_FORMATS, DURABILITY_POLICIES, DURABILITY_FLUSH
+
+# Default number of API requests kept in flight at once
+DEFAULT_CONCURRENCY = 100
+
+# Default estimated token size of a batch in batched mode; 0 disables batching
+DEFAULT_BATCH_TOKENS = 0
+
+# Default location and size of the on-disk response cache
+DEFAULT_CACHE_PATH = os.path.join('output', 'response_cache.sqlite')
+DEFAULT_CACHE_MAX_ENTRIES = 500_000
+
+# Default output format and batching of the background result writer
+DEFAULT_OUTPUT_FORMAT = 'csv'
+DEFAULT_FLUSH_ROWS = 500
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+# Default number of times a verse is tried before its failure is recorded
+DEFAULT_MAX_ATTEMPTS = 3
+
+# Default API quotas of each key
+DEFAULT_RPM = 2000
+DEFAULT_TPM = 4_000_000
 
-# Define the maximum number of concurrent workers for API calls
-MAX_WORKERS = 5
+# Default locations of the per-call log and of the end-of-run summary, and export of the live metrics
+DEFAULT_CALL_LOG_PATH = os.path.join('output', 'normalization_calls.jsonl')
+SUMMARY_PATH = os.path.join('output', 'normalization_summary.json')
+DEFAULT_METRICS_FORMAT = 'prometheus'
+DEFAULT_METRICS_INTERVAL = 5.0
+
+# Where --dry-run saves its plan, and the request latency it plans with when no earlier run has measured one
+PLAN_PATH = os.path.join('output', 'run_plan.json')
+DEFAULT_EXPECTED_LATENCY = 5.0
+
+# Where sharded workers write their per-shard outputs, and the default size and lease of a shard
+SHARD_DIR = os.path.join('output', 'shards')
+DEFAULT_SHARD_SIZE = 1000
+DEFAULT_LEASE_SECONDS = 300.0
 
 def setup_logging():
     """Sets up the logging for the script."""
@@ -24,17 +68,328 @@ def setup_logging():
         ]
     )
 
+async def normalize_sources(scheduler: WeightedScheduler, writers: dict[str, ResultWriter], progress: dict[str, tqdm], service: NormalizationService, concurrency: int, batch_tokens: int = 0, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+    """
+    Normalizes the work of every source from one global pool.
+
+    Up to `concurrency` workers pull batches from the weighted scheduler, so
+    the concurrency limit stays saturated until the last source runs dry.
+    Each result is handed to its source's background writer as soon as it
+    completes.
+
+    Verses that fail are put on a dead-letter queue, which workers drain
+    before taking new work, and re-asked one by one until they have been
+    tried `max_attempts` times; only then is their empty result written.
+
+    If batch_tokens is positive, batches hold multi-verse requests of about
+    that many tokens; otherwise every batch is a single verse.
+    """
+    dead_letters = deque()
+    busy = 0
+    changed = asyncio.Condition()
+    reasked = 0
+
+    async def next_item():
+        nonlocal busy
+        async with changed:
+            while True:
+                if dead_letters:
+                    item = dead_letters.popleft()
+                    break
+                item = scheduler.next()
+                if item is not None:
+                    item = (*item, 1)
+                    break
+                if busy == 0:
+                    return None
+                # Running workers may still put failed verses on the queue
+                await changed.wait()
+            busy += 1
+            return item
+
+    async def normalize_item(source_name: str, batch: list[dict], attempt: int) -> int:
+        """Normalizes one batch and returns how many of its verses went on the dead-letter queue."""
+        # Each worker runs in its own task, so this only labels its own calls
+        current_source.set(source_name)
+        try:
+            if batch_tokens > 0:
+                results = await service.normalize_batched_async(batch)
+            else:
+                row = batch[0]
+                results = {
+                    verse_key(row['book_name'], row['chapter'], row['verse']):
+                    await service.normalize_async(row['book_name'], row['chapter'], row['verse'], row['text'])
+                }
+        except Exception as exc:
+            logging.error(f"{source_name}: batch starting with '{batch[0]['text']}' generated an exception: {exc}")
+            results = {}
+        failed = 0
+        for row in batch:
+            propositions = results.get(verse_key(row['book_name'], row['chapter'], row['verse']), [])
+            if not propositions and attempt < max_attempts:
+                dead_letters.append((source_name, [row], attempt + 1))
+                failed += 1
+                continue
+            # After the last attempt, save an entry anyway to mark it as processed (with empty normalization)
+            writers[source_name].submit(row, propositions)
+        progress[source_name].update(len(batch) - failed)
+        return failed
+
+    async def worker():
+        nonlocal busy, reasked
+        while True:
+            item = await next_item()
+            if item is None:
+                return
+            source_name, batch, attempt = item
+            try:
+                reasked += await normalize_item(source_name, batch, attempt)
+            finally:
+                async with changed:
+                    busy -= 1
+                    changed.notify_all()
+
+    await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(scheduler))))))
+    if reasked:
+        logging.info(f"Re-asked failed verses {reasked} times from the dead-letter queue.")
+
+async def normalize_shard(queue: ShardQueue, shard, worker_id: str, scheduler: WeightedScheduler, writers: dict[str, ResultWriter], progress: dict[str, tqdm], service: NormalizationService, args):
+    """
+    Normalizes the verses of one shard like normalize_sources(), renewing
+    the shard's lease every third of the lease time meanwhile.
+    """
+    async def hold_lease():
+        while True:
+            await asyncio.sleep(queue.lease_seconds / 3)
+            if not await asyncio.to_thread(queue.renew, shard, worker_id):
+                logging.warning(f"Lost the lease on {shard.source} shard {shard.shard_id}; another worker has taken it over.")
+                return
+
+    renewer = asyncio.create_task(hold_lease())
+    try:
+        await normalize_sources(
+            scheduler, writers, progress, service, args.concurrency,
+            batch_tokens=args.batch_tokens, max_attempts=args.max_attempts
+        )
+    finally:
+        renewer.cancel()
+
+def shard_finished_hashes(shard, output_format: str) -> set[int]:
+    """
+    Returns the hashes of the verses of a shard that earlier holders of the
+    shard normalized successfully, repairing what a killed holder left half written.
+    """
+    finished = set()
+    for path in shard_outputs(SHARD_DIR, shard.source, output_format, shard.shard_id):
+        if repair_shard_output(path):
+            logging.warning(f"Removed a partially written last line from {path}.")
+        try:
+            df = read_output(path, output_format)
+        except Exception as e:
+            logging.warning(f"Could not read {path}, its verses are normalized again: {e}")
+            continue
+        df = df[df['normalization'].map(len) > 0]
+        if len(df):
+            finished.update(verse_hashes(df))
+    return finished
+
+def run_shards(args, queue: ShardQueue, worker_id: str, frames: dict[str, pd.DataFrame], service: NormalizationService) -> int:
+    """
+    Claims shards from the queue and normalizes them until none is left.
+
+    Each shard's verses that are neither done in the checkpoint manifest
+    nor in the outputs of earlier holders of the shard are written to this
+    worker's own output for the shard. A shard is given back if the worker
+    fails or is interrupted, and is taken over by another worker once its
+    lease runs out if the worker dies.
+
+    Args:
+        frames: The pending verses of every source, indexed by their row in the source file.
+
+    Returns:
+        The number of shards this worker completed.
+    """
+    metrics = get_metrics()
+    completed = 0
+    while True:
+        shard = queue.claim(worker_id, sources=list(frames))
+        if shard is None:
+            return completed
+        df = frames[shard.source]
+        df = df[(df.index >= shard.start) & (df.index < shard.stop)]
+        finished = shard_finished_hashes(shard, args.output_format)
+        rows = df[~df['verse_hash'].isin(finished)].to_dict('records')
+        logging.info(
+            f"Claimed {shard.source} shard {shard.shard_id} (rows {shard.start} to {shard.stop - 1}): "
+            f"{len(rows)} verses to normalize"
+        )
+        try:
+            if rows:
+                path = shard_output_path(SHARD_DIR, shard, worker_id, args.output_format)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                scheduler = WeightedScheduler()
+                scheduler.add_source(shard.source, build_batches(rows, args.batch_tokens) if args.batch_tokens > 0 else [[row] for row in rows])
+                writer = ResultWriter(
+                    open_sink(path, args.output_format, args.durability),
+                    batch_size=args.flush_rows,
+                    flush_interval=args.flush_interval,
+                )
+                progress = tqdm(total=len(rows), desc=f"Normalizing {shard.source} shard {shard.shard_id}")
+                if metrics is not None:
+                    metrics.watch_writer(shard.source, writer)
+                try:
+                    asyncio.run(normalize_shard(queue, shard, worker_id, scheduler, {shard.source: writer}, {shard.source: progress}, service, args))
+                finally:
+                    progress.close()
+                    writer.close()
+        except BaseException:
+            queue.release(shard, worker_id)
+            raise
+        if queue.complete(shard, worker_id):
+            completed += 1
+        else:
+            logging.warning(f"{shard.source} shard {shard.shard_id} was taken over before it was finished; its new holder completes it.")
+
+def pending_verses(source_name: str, file_path: str, output_file_path: str, manifest: CheckpointManifest, output_format: str, flags: pd.Series | None = None) -> pd.DataFrame:
+    """
+    Loads a source and returns the verses that still have to be normalized.
+
+    Resumes from the checkpoint manifest, seeding it from an older CSV output
+    file if needed. The returned DataFrame has a 'verse_hash' column.
+
+    If `flags` is given, it replaces the 'potential_difference_verse' column
+    and only flagged verses are kept, whatever the source.
+    """
+    df = load_data(file_path)
+    logging.info(f"Initial {source_name} DataFrame size: {len(df)}")
+
+    # Apply the divergence triage, or the curated filtering for Septuagint
+    if flags is not None:
+        df['potential_difference_verse'] = flags
+        df = filter_septuagint(df)
+        logging.info(f"{source_name} verses flagged as potentially different: {len(df)}")
+    elif source_name == "septuagint":
+        df = filter_septuagint(df)
+
+    df['verse_hash'] = verse_hashes(df)
+
+    if os.path.isfile(output_file_path):
+        if repair_torn_tail(output_file_path):
+            logging.warning(f"Removed a partially written last line from {output_file_path}.")
+        if output_format == 'csv' and not manifest.has_source(source_name):
+            imported = manifest.import_csv(source_name, output_file_path)
+            logging.info(f"Seeded the checkpoint manifest with {imported} rows from {output_file_path}.")
+    completed = manifest.completed(source_name)
+    df_to_process = df[~df['verse_hash'].isin(completed)]
+    logging.info(f"Number of processed verses for {source_name}: {len(df) - len(df_to_process)}")
+    logging.info(f"DataFrame to process for {source_name} size: {len(df_to_process)}")
+    return df_to_process
+
+def record_committed(manifest: CheckpointManifest, source_name: str, rows: list[dict]):
+    """Marks rows the writer has committed to disk as done or failed in the manifest."""
+    manifest.mark(source_name, [row['verse_hash'] for row in rows if row['normalization']], DONE)
+    manifest.mark(source_name, [row['verse_hash'] for row in rows if not row['normalization']], FAILED)
+
+def plan_pending(args, pending: dict[str, list[dict]], manifest: CheckpointManifest, output_files: dict[str, str], prompt_path: str, batch_prompt_path: str) -> dict:
+    """
+    Plans the pending work without calling the API, logs the plan and saves it to PLAN_PATH.
+
+    Prompts are rendered as the run would send them and counted with the
+    --tokenizer. Answers are sized from the answers already received, and
+    latency is taken from the summary of the last run unless
+    --expected-latency is given. The quotas are those of each key, times the
+    number of keys found.
+    """
+    count_tokens = load_tokenizer(args.tokenizer)
+    try:
+        key_count = len(load_api_keys(args.api_keys_file))
+    except ValueError:
+        key_count = 1
+    with open(prompt_path, 'r') as f:
+        prompt_template = f.read()
+    with open(batch_prompt_path, 'r') as f:
+        batch_prompt_template = f.read()
+
+    latency = args.expected_latency
+    if latency is None and os.path.isfile(SUMMARY_PATH):
+        with open(SUMMARY_PATH, encoding='utf-8') as f:
+            latency = json.load(f)['latency_seconds']['p50']
+    latency = latency or DEFAULT_EXPECTED_LATENCY
+
+    sources = {}
+    for source_name, rows in pending.items():
+        output_file_path = output_files[source_name]
+        received = read_output(output_file_path, args.output_format)['normalization'] if os.path.exists(output_file_path) else []
+        sources[source_name] = plan_source(
+            rows, prompt_template, batch_prompt_template, args.batch_tokens, count_tokens,
+            observed_output_tokens(received, count_tokens),
+        )
+        sources[source_name]['checkpoint'] = manifest.counts(source_name)
+    plan = plan_run(
+        sources,
+        prompt_overhead=count_tokens(prompt_template.format(verse_text='')),
+        batch_overhead=count_tokens(batch_prompt_template.format(verses_json='{}')),
+        rpm=args.rpm * key_count, tpm=args.tpm * key_count,
+        rpd=args.rpd * key_count if args.rpd is not None else None, latency=latency,
+    )
+    plan['expected_latency'] = latency
+    plan['api_keys'] = key_count
+
+    for source_name, source in sources.items():
+        logging.info(
+            f"{source_name}: {source['verses']} verses left (checkpoint: {source['checkpoint']}), "
+            f"{source['requests']} requests, {source['input_tokens']} input and {source['output_tokens']} output tokens"
+        )
+    totals = plan['totals']
+    logging.info(
+        f"Total: {totals['verses']} verses, {totals['requests']} requests, {totals['tokens']} tokens; "
+        f"at least {plan['minimum_wall_seconds'] / 60:.1f} minutes, bound by the {plan['bound_by']} quota"
+        + (f", {plan['days']:.2f} days of the daily request quota" if plan['days'] is not None else "")
+    )
+    logging.info(
+        f"Recommended: --batch-tokens {plan['recommended_batch_tokens']} --concurrency {plan['recommended_concurrency']}"
+        + (f" (about {plan['recommended_wall_seconds'] / 60:.1f} minutes)" if 'recommended_wall_seconds' in plan else "")
+    )
+    with open(PLAN_PATH, 'w', encoding='utf-8') as f:
+        json.dump(plan, f, indent=2)
+    logging.info(f"Plan saved to {PLAN_PATH}")
+    return plan
+
 def main(args):
     """
     Main function to run the normalization process.
     """
     setup_logging()
     logging.info("Starting normalization process...")
+    try:
+        weights = parse_weights(args.weights)
+    except ValueError as e:
+        logging.error(f"Invalid --weights: {e}")
+        return
+    response_cache = configure_response_cache(
+        None if args.no_cache else args.cache_path, max_entries=args.cache_max_entries
+    )
+    configure_corpus_cache(None if args.no_corpus_cache else DEFAULT_CORPUS_CACHE_DIR)
+    metrics = configure_metrics(call_log_path=None if args.no_call_log else args.call_log)
+    if args.metrics_path:
+        metrics.start_export(args.metrics_path, args.metrics_format, args.metrics_interval)
 
     # Define file paths
     data_dir = 'data'
     output_dir = 'output'
     prompt_path = 'prompts/normalization_prompt.txt'
+    batch_prompt_path = 'prompts/batch_normalization_prompt.txt'
+
+    try:
+        key_pool = None if args.dry_run else configure_key_pool(
+            load_api_keys(args.api_keys_file), requests_per_minute=args.rpm, tokens_per_minute=args.tpm
+        )
+        service = None if args.dry_run else NormalizationService(
+            prompt_path, batch_prompt_path, structured_output=not args.no_structured_output, key_pool=key_pool
+        )
+    except (FileNotFoundError, ValueError) as e:
+        logging.error(f"Could not set up the normalization service: {e}")
+        return
 
     source_files = {
         "masoretic": os.path.join(data_dir, "masoretic.csv"),
@@ -43,120 +398,268 @@ def main(args):
     }
 
     output_files = {
-        "masoretic": os.path.join(output_dir, "masoretic_normalised.csv"),
-        "vulgate": os.path.join(output_dir, "vulgate_normalised.csv"),
-        "septuagint": os.path.join(output_dir, "septuagint_normalised.csv"),
+        source_name: output_path(output_dir, source_name, args.output_format)
+        for source_name in source_files
     }
 
     # Ensure output directory exists
     os.makedirs(output_dir, exist_ok=True)
+    # One manifest per output format, since each format is a separate set of output files
+    manifest = CheckpointManifest(os.path.join(output_dir, f"checkpoint_{args.output_format}.sqlite"))
 
-    # Process each source file
+    # Flag the verses that may differ between sources, to skip the others
+    flags = {}
+    if args.divergence_threshold is not None:
+        try:
+            texts = {
+                source_name: load_data(file_path, columns=['book_name', 'chapter', 'verse', 'text'])
+                for source_name, file_path in source_files.items() if os.path.isfile(file_path)
+            }
+            flags = divergence_flags(texts, args.divergence_threshold, n=args.divergence_ngram)
+        except Exception as e:
+            logging.error(f"Could not compute the divergence triage: {e}")
+            manifest.close()
+            return
+
+    # Queue the pending work of every source on one scheduler
+    scheduler = WeightedScheduler()
+    totals = {}
+    pending = {}
+    frames = {}
     for source_name, file_path in source_files.items():
         logging.info(f"Processing {source_name}...")
         try:
-            df = load_data(file_path)
-            logging.info(f"Initial {source_name} DataFrame size: {len(df)}")
-
-            # Apply filtering for Septuagint
-            if source_name == "septuagint":
-                df = filter_septuagint(df)
-
-            output_file_path = output_files[source_name]
-            logging.debug(f"Checking if output file exists: {output_file_path} -> {os.path.exists(output_file_path)}")
-            processed_verses = set()
-
-            # Check for existing output file to resume
-            if os.path.exists(output_file_path):
-                logging.info(f"Output file found for {source_name}. Resuming...")
-                processed_df = pd.read_csv(output_file_path)
-                # Create a unique identifier for each verse in the processed DataFrame
-                processed_df['unique_verse_id'] = processed_df.apply(
-                    lambda row: (row['book_name'], row['chapter'], row['verse'], row['text']), axis=1
-                )
-                # Convert 'normalization' column from string representation of list to actual list
-                # Handle potential NaN values or malformed JSON strings
-                processed_df['normalization_list'] = processed_df['normalization'].apply(
-                    lambda x: json.loads(x) if pd.notna(x) and x.strip() else []
-                )
-                # Only consider verses with non-empty normalization results as processed
-                processed_df_successful = processed_df[processed_df['normalization_list'].apply(lambda x: bool(x))]
-                processed_verses = set(processed_df_successful['unique_verse_id'])
-                logging.info(f"Number of processed verses for {source_name}: {len(processed_verses)}")
-
-                # Create a unique identifier for each verse in the original DataFrame
-                df['unique_verse_id'] = df.apply(
-                    lambda row: (row['book_name'], row['chapter'], row['verse'], row['text']), axis=1
-                )
-                df_to_process = df[~df['unique_verse_id'].isin(processed_verses)]
-                # Drop the temporary unique_verse_id column from df
-                df = df.drop(columns=['unique_verse_id'])
-            else:
-                df_to_process = df
-
-            logging.info(f"DataFrame to process for {source_name} size: {len(df_to_process)}")
-            if df_to_process.empty:
-                logging.info(f"All verses in {source_name} have already been processed. Skipping.")
-                # Log verses that were in original df but not in processed_verses (if any)
-                unprocessed_in_original = set(df['text']) - processed_verses
-                if unprocessed_in_original:
-                    logging.warning(f"Unexpected: {len(unprocessed_in_original)} verses from original {source_name} dataset were not found in processed_verses, but df_to_process is empty. Examples: {list(unprocessed_in_original)[:5]}")
-                continue
-            else:
-                logging.info(f"Resuming processing for {source_name}. First 5 verses to process: {list(df_to_process['text'])[:5]}")
-
-            # Initialize output file if it doesn't exist
-            if not os.path.exists(output_file_path):
-                pd.DataFrame(columns=['book_name', 'chapter', 'verse', 'text', 'normalization']).to_csv(output_file_path, mode='w', header=True, index=False)
-
-            # Normalize text for each row concurrently
-            with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-                # Submit tasks to the executor
-                future_to_row = {
-                    executor.submit(normalize_text, row['book_name'], row['chapter'], row['verse'], row['text'], prompt_path): row
-                    for index, row in df_to_process.iterrows()
-                }
-
-                # Process results as they complete and save incrementally
-                for future in tqdm(
-                    concurrent.futures.as_completed(future_to_row),
-                    total=len(df_to_process),
-                    desc=f"Normalizing {source_name}"
-                ):
-                    original_row = future_to_row[future]
-                    try:
-                        propositions = future.result()
-                        result_df = pd.DataFrame([{
-                            'book_name': original_row['book_name'],
-                            'chapter': original_row['chapter'],
-                            'verse': original_row['verse'],
-                            'text': original_row['text'],
-                            'normalization': json.dumps(propositions)
-                        }])
-                        result_df.to_csv(output_file_path, mode='a', header=False, index=False)
-                    except Exception as exc:
-                        logging.error(f"'{original_row['text']}' generated an exception: {exc}")
-                        # Even on error, save an entry to mark it as processed (with empty normalization)
-                        result_df = pd.DataFrame([{
-                            'book_name': original_row['book_name'],
-                            'chapter': original_row['chapter'],
-                            'verse': original_row['verse'],
-                            'text': original_row['text'],
-                            'normalization': []
-                        }])
-                        result_df.to_csv(output_file_path, mode='a', header=False, index=False)
-
-            logging.info(f"Successfully processed and saved all new verses to {output_files[source_name]}")
+            df_to_process = pending_verses(
+                source_name, file_path, output_files[source_name], manifest, args.output_format, flags.get(source_name)
+            )
         except FileNotFoundError:
             logging.warning(f"Source file not found at {file_path}. Skipping.")
+            continue
         except Exception as e:
             logging.error(f"An error occurred while processing {file_path}: {e}")
+            continue
+        rows = df_to_process.to_dict('records')
+        pending[source_name] = rows
+        frames[source_name] = df_to_process
+        if not rows:
+            logging.info(f"All verses in {source_name} have already been processed. Skipping.")
+            continue
+        batches = build_batches(rows, args.batch_tokens) if args.batch_tokens > 0 else [[row] for row in rows]
+        scheduler.add_source(source_name, batches, weight=weights.get(source_name, 1))
+        totals[source_name] = len(rows)
+
+    if args.dry_run:
+        try:
+            plan_pending(args, pending, manifest, output_files, prompt_path, batch_prompt_path)
+        except (FileNotFoundError, ValueError, ImportError, AttributeError) as e:
+            logging.error(f"Could not plan the run: {e}")
+        manifest.close()
+        configure_metrics(False)
+        configure_response_cache(None)
+        return
+
+    if args.shard_queue:
+        worker_id = args.worker_id or default_worker_id()
+        queue = ShardQueue(args.shard_queue, lease_seconds=args.lease_seconds)
+        try:
+            for source_name in frames:
+                queue.seed(source_name, len(load_data(source_files[source_name], columns=['verse'])), args.shard_size)
+            completed = run_shards(args, queue, worker_id, frames, service)
+            logging.info(f"Worker {worker_id} completed {completed} shards. Shards by status: {queue.progress()}")
+        except ValueError as e:
+            logging.error(f"Could not run the shards: {e}")
+        finally:
+            queue.close()
+            manifest.close()
+            configure_metrics(False)
+            configure_key_pool(None)
+            configure_response_cache(None)
+        return
+
+    writers = {}
+    progress = {}
+    for position, source_name in enumerate(totals):
+        output_file_path = output_files[source_name]
+        writers[source_name] = ResultWriter(
+            open_sink(output_file_path, args.output_format, args.durability),
+            batch_size=args.flush_rows,
+            flush_interval=args.flush_interval,
+            on_commit=lambda rows, source_name=source_name: record_committed(manifest, source_name, rows),
+        )
+        progress[source_name] = tqdm(total=totals[source_name], desc=f"Normalizing {source_name}", position=position)
+        metrics.watch_writer(source_name, writers[source_name])
+
+    # Normalize all sources concurrently
+    try:
+        if writers:
+            asyncio.run(normalize_sources(
+                scheduler, writers, progress, service, args.concurrency,
+                batch_tokens=args.batch_tokens, max_attempts=args.max_attempts
+            ))
+    finally:
+        for source_name, writer in writers.items():
+            progress[source_name].close()
+            try:
+                writer.close()
+                logging.info(f"Successfully processed and saved all new verses to {output_files[source_name]}")
+            except Exception as e:
+                logging.error(f"An error occurred while writing {output_files[source_name]}: {e}")
+    logging.info(f"Current request rate: {key_pool.current_rpm:.0f} RPM over {len(key_pool.keys)} API keys")
+    logging.info(f"API keys: {key_pool.stats()}")
+    configure_key_pool(None)
+
+    metrics.write(SUMMARY_PATH, 'json')
+    logging.info(f"Run summary written to {SUMMARY_PATH}: {metrics.snapshot()}")
+    configure_metrics(False)
+
+    manifest.close()
+    if response_cache is not None:
+        logging.info(f"Response cache: {response_cache.stats()}")
+        configure_response_cache(None)
 
     logging.info("Normalization process finished.")
 
 
-if __name__ == '__main__':
+def build_parser() -> argparse.ArgumentParser:
+    """Returns the command-line parser of the script."""
     parser = argparse.ArgumentParser(description="Run the biblical text normalization process.")
-    # We can add arguments here in the future, e.g., for input/output dirs
-    args = parser.parse_args()
-    main(args)
+    parser.add_argument(
+        "--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+        help=f"Maximum number of API requests in flight at once (default: {DEFAULT_CONCURRENCY})."
+    )
+    parser.add_argument(
+        "--weights", default="",
+        help="Relative share of the concurrency each source gets while several have work left, "
+             "e.g. 'septuagint=2,masoretic=1' (default: 1 for every source)."
+    )
+    parser.add_argument(
+        "--batch-tokens", type=int, default=DEFAULT_BATCH_TOKENS,
+        help="Pack verses into multi-verse requests of about this many tokens "
+             "(e.g. 4000); 0 sends one request per verse (default: 0)."
+    )
+    parser.add_argument(
+        "--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS,
+        help="Times a verse is tried, re-asking failed verses during the run, before it is "
+             f"recorded as failed (default: {DEFAULT_MAX_ATTEMPTS})."
+    )
+    parser.add_argument(
+        "--no-structured-output", action="store_true",
+        help="Do not constrain the model's answers with a JSON response schema, for models that do not support it."
+    )
+    parser.add_argument(
+        "--divergence-threshold", type=float, default=None,
+        help="Only normalize verses whose character n-gram divergence from another source is above this "
+             "value between 0 and 1 (e.g. 0.5), replacing the curated Septuagint filter (default: off)."
+    )
+    parser.add_argument(
+        "--divergence-ngram", type=int, default=DEFAULT_NGRAM,
+        help=f"Length of the character n-grams used by --divergence-threshold (default: {DEFAULT_NGRAM})."
+    )
+    parser.add_argument(
+        "--output-format", choices=OUTPUT_FORMATS, default=DEFAULT_OUTPUT_FORMAT,
+        help=f"Format of the normalized output files (default: {DEFAULT_OUTPUT_FORMAT})."
+    )
+    parser.add_argument(
+        "--flush-rows", type=int, default=DEFAULT_FLUSH_ROWS,
+        help=f"Number of results the writer collects before writing them (default: {DEFAULT_FLUSH_ROWS})."
+    )
+    parser.add_argument(
+        "--flush-interval", type=float, default=DEFAULT_FLUSH_INTERVAL,
+        help=f"Maximum seconds a result waits before being written (default: {DEFAULT_FLUSH_INTERVAL})."
+    )
+    parser.add_argument(
+        "--durability", choices=DURABILITY_POLICIES, default=DURABILITY_FLUSH,
+        help="none: buffer until the end; flush: hand each write to the OS; "
+             f"fsync: force each write to disk (default: {DURABILITY_FLUSH})."
+    )
+    parser.add_argument(
+        "--shard-queue", default=None,
+        help="Run as one of several workers sharing this SQLite work queue on shared storage: claim ranges of "
+             f"verses with a lease and write them to per-shard outputs in {SHARD_DIR}, to be merged with "
+             "scripts/merge_shards.py (default: off)."
+    )
+    parser.add_argument(
+        "--shard-size", type=int, default=DEFAULT_SHARD_SIZE,
+        help=f"Rows of a source file per shard; fixed by the first worker to seed the queue (default: {DEFAULT_SHARD_SIZE})."
+    )
+    parser.add_argument(
+        "--lease-seconds", type=float, default=DEFAULT_LEASE_SECONDS,
+        help="Seconds a claimed shard stays with its worker without a renewal, before another worker may take "
+             f"it over (default: {DEFAULT_LEASE_SECONDS:.0f})."
+    )
+    parser.add_argument(
+        "--worker-id", default=None,
+        help="Name of this worker in the shard queue (default: the host name and process ID)."
+    )
+    parser.add_argument(
+        "--api-keys-file", default=None,
+        help="File with one API key per line to spread the requests over, each with its own quota "
+             "(default: the comma-separated GOOGLE_API_KEYS, or GOOGLE_API_KEY)."
+    )
+    parser.add_argument(
+        "--rpm", type=int, default=DEFAULT_RPM,
+        help=f"Requests-per-minute quota of each API key (default: {DEFAULT_RPM})."
+    )
+    parser.add_argument(
+        "--tpm", type=int, default=DEFAULT_TPM,
+        help=f"Tokens-per-minute quota of each API key (default: {DEFAULT_TPM})."
+    )
+    parser.add_argument(
+        "--rpd", type=int, default=None,
+        help="Requests-per-day quota of each API key, used by --dry-run to plan across days (default: none)."
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true",
+        help=f"Plan the pending work without calling the API: count the tokens of the rendered prompts, "
+             f"estimate the run time under the quotas and recommend a batch size and concurrency ({PLAN_PATH})."
+    )
+    parser.add_argument(
+        "--tokenizer", default='chars',
+        help="How --dry-run counts tokens: 'chars' (about four characters per token), 'api' "
+             "(exact counts from the API) or 'module:function' (default: chars)."
+    )
+    parser.add_argument(
+        "--expected-latency", type=float, default=None,
+        help="Seconds per request --dry-run plans the concurrency with "
+             f"(default: the median of the last run, or {DEFAULT_EXPECTED_LATENCY})."
+    )
+    parser.add_argument(
+        "--cache-path", default=DEFAULT_CACHE_PATH,
+        help=f"Path to the on-disk response cache (default: {DEFAULT_CACHE_PATH})."
+    )
+    parser.add_argument(
+        "--cache-max-entries", type=int, default=DEFAULT_CACHE_MAX_ENTRIES,
+        help=f"Number of cached responses kept before the least recently used are evicted (default: {DEFAULT_CACHE_MAX_ENTRIES})."
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="Disable the response cache."
+    )
+    parser.add_argument(
+        "--no-corpus-cache", action="store_true",
+        help=f"Parse the source CSV files on every run instead of keeping typed Parquet copies in {DEFAULT_CORPUS_CACHE_DIR}."
+    )
+    parser.add_argument(
+        "--call-log", default=DEFAULT_CALL_LOG_PATH,
+        help=f"Where to append one JSON record per API call (default: {DEFAULT_CALL_LOG_PATH})."
+    )
+    parser.add_argument(
+        "--no-call-log", action="store_true",
+        help="Do not log individual API calls."
+    )
+    parser.add_argument(
+        "--metrics-path", default=None,
+        help="Periodically write the live metrics to this file, e.g. a node_exporter textfile (default: off)."
+    )
+    parser.add_argument(
+        "--metrics-format", choices=METRICS_FORMATS, default=DEFAULT_METRICS_FORMAT,
+        help=f"Format of --metrics-path (default: {DEFAULT_METRICS_FORMAT})."
+    )
+    parser.add_argument(
+        "--metrics-interval", type=float, default=DEFAULT_METRICS_INTERVAL,
+        help=f"Seconds between writes of --metrics-path (default: {DEFAULT_METRICS_INTERVAL})."
+    )
+    return parser
+
+if __name__ == '__main__':
+    main(build_parser().parse_args())
@@ -0,0 +1,312 @@
+import functools
+import os
+import numpy as np
+import pandas as pd
+
+# Canonical book codes, in the order of data/masoretic.csv; a book's number is its position plus one
+BOOKS = [
+    'GEN', 'EXO', 'LEV', 'NUM', 'DEU', 'JOS', 'JDG', 'RUT', '1SA', '2SA', '1KI', '2KI', '1CH', '2CH',
+    'EZR', 'NEH', 'EST', 'JOB', 'PSA', 'PRO', 'ECC', 'SNG', 'ISA', 'JER', 'LAM', 'EZK', 'DAN', 'HOS',
+    'JOL', 'AMO', 'OBA', 'JON', 'MIC', 'NAM', 'HAB', 'ZEP', 'HAG', 'ZEC', 'MAL',
+]
+BOOK_NUMBERS = {book: number for number, book in enumerate(BOOKS, start=1)}
+
+def _names(names: list[str], **aliases: str) -> dict[str, str]:
+    mapping = dict(zip(names, BOOKS))
+    mapping.update(aliases)
+    return mapping
+
+# Book names used by each naming scheme, mapped to canonical codes
+MASORETIC_BOOKS = _names(BOOKS, SOL='SNG', EZE='EZK', JOE='JOL', NAH='NAM')
+ENGLISH_BOOKS = _names([
+    'Genesis', 'Exodus', 'Leviticus', 'Numbers', 'Deuteronomy', 'Joshua', 'Judges', 'Ruth', '1 Samuel',
+    '2 Samuel', '1 Kings', '2 Kings', '1 Chronicles', '2 Chronicles', 'Ezra', 'Nehemiah', 'Esther', 'Job',
+    'Psalms', 'Proverbs', 'Ecclesiastes', 'Song of Songs', 'Isaiah', 'Jeremiah', 'Lamentations', 'Ezekiel',
+    'Daniel', 'Hosea', 'Joel', 'Amos', 'Obadiah', 'Jonah', 'Micah', 'Nahum', 'Habakkuk', 'Zephaniah',
+    'Haggai', 'Zechariah', 'Malachi',
+], **{'Song of Solomon': 'SNG'})
+# Douay-Rheims names; its 1-4 Kings are 1-2 Samuel and 1-2 Kings
+VULGATE_BOOKS = _names([
+    'Genesis', 'Exodus', 'Leviticus', 'Numbers', 'Deuteronomy', 'Josue', 'Judges', 'Ruth', '1 Kings',
+    '2 Kings', '3 Kings', '4 Kings', '1 Paralipomenon', '2 Paralipomenon', '1 Esdras', '2 Esdras', 'Esther',
+    'Job', 'Psalms', 'Proverbs', 'Ecclesiastes', 'Canticle of Canticles', 'Isaias', 'Jeremias',
+    'Lamentations of Jeremias', 'Ezechiel', 'Daniel', 'Osee', 'Joel', 'Amos', 'Abdias', 'Jonas', 'Micheas',
+    'Nahum', 'Habacuc', 'Sophonias', 'Aggeus', 'Zacharias', 'Malachias',
+])
+STEPBIBLE_BOOKS = _names([
+    'Gen', 'Exo', 'Lev', 'Num', 'Deu', 'Jos', 'Jdg', 'Rut', '1Sa', '2Sa', '1Ki', '2Ki', '1Ch', '2Ch', 'Ezr',
+    'Neh', 'Est', 'Job', 'Psa', 'Pro', 'Ecc', 'Sng', 'Isa', 'Jer', 'Lam', 'Ezk', 'Dan', 'Hos', 'Jol', 'Amo',
+    'Oba', 'Jon', 'Mic', 'Nam', 'Hab', 'Zep', 'Hag', 'Zec', 'Mal',
+])
+# French abbreviations of the CTAT volumes; 'JI' is a frequent OCR misreading of 'Jl'
+CTAT_BOOKS = _names([
+    'Gn', 'Ex', 'Lv', 'Nb', 'Dt', 'Jos', 'Jg', 'Rt', '1S', '2S', '1R', '2R', '1Ch', '2Ch', 'Esd', 'Néh',
+    'Est', 'Jb', 'Ps', 'Pr', 'Qo', 'Ct', 'Is', 'Jr', 'Lm', 'Ez', 'Dn', 'Os', 'Jl', 'Am', 'Ab', 'Jon', 'Mi',
+    'Na', 'Ha', 'So', 'Ag', 'Za', 'Mal',
+], JI='JOL')
+
+# For each scheme: its book names, and the versification tables that map its
+# references to the canonical (Hebrew) versification, in order of precedence
+SCHEMES = {
+    'masoretic': (MASORETIC_BOOKS, ('english',)),
+    'vulgate': (VULGATE_BOOKS, ('vulgate', 'english')),
+    'septuagint': (ENGLISH_BOOKS, ('septuagint',)),
+    'stepbible': (STEPBIBLE_BOOKS, ()),
+    'ctat': (CTAT_BOOKS, ()),
+    'hottp': (MASORETIC_BOOKS, ()),
+}
+
+# The Septuagint recension kept where a book has several, following Brenton
+DEFAULT_RECENSIONS = {'JOS': 'Vaticanus', 'JDG': 'Vaticanus', 'DAN': 'Theodotion'}
+
+VERSIFICATION_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'versification')
+VERSIFICATION_COLUMNS = ['book', 'chapter', 'verse_start', 'verse_end', 'to_chapter', 'to_verse', 'occurrence']
+
+def _scheme(scheme: str):
+    try:
+        return SCHEMES[scheme]
+    except KeyError:
+        raise ValueError(f"Unknown naming scheme: {scheme}") from None
+
+def split_recension(names: pd.Series) -> pd.DataFrame:
+    """Splits names such as 'Joshua (Vaticanus)' into a 'name' and a 'recension' column."""
+    parts = names.str.extract(r'^\s*(.*?)\s*(?:\((.+)\))?\s*$')
+    parts.columns = ['name', 'recension']
+    return parts
+
+def canonical_books(names: pd.Series, scheme: str, errors: str = 'raise') -> pd.Series:
+    """
+    Maps the book names of a naming scheme to canonical book codes.
+
+    Args:
+        names: The book names, without recension suffixes.
+        scheme: A key of SCHEMES.
+        errors: 'raise' to fail on unknown names, 'coerce' to map them to missing values.
+
+    Raises:
+        ValueError: If the scheme is unknown, or a name is unknown and errors is 'raise'.
+    """
+    book_names, _ = _scheme(scheme)
+    books = names.map(book_names)
+    if errors == 'raise':
+        unknown = names[books.isna() & names.notna()].unique()
+        if len(unknown):
+            raise ValueError(f"Unknown {scheme} book names: {', '.join(map(str, unknown))}")
+    return books
+
+def pack_verse_ids(books: pd.Series, chapters: pd.Series, verses: pd.Series) -> pd.Series:
+    """
+    Packs canonical references into integer verse IDs.
+
+    An ID is book_number * 1_000_000 + chapter * 1000 + verse, so IDs sort in
+    canonical order. References with a missing part get a missing ID.
+    """
+    numbers = books.map(BOOK_NUMBERS).astype('Int64')
+    return numbers * 1_000_000 + chapters.astype('Int64') * 1000 + verses.astype('Int64')
+
+def unpack_verse_ids(verse_ids: pd.Series) -> pd.DataFrame:
+    """Splits verse IDs back into 'book', 'chapter' and 'verse' columns."""
+    verse_ids = verse_ids.astype('Int64')
+    return pd.DataFrame({
+        'book': (verse_ids // 1_000_000).map(dict(enumerate(BOOKS, start=1))),
+        'chapter': verse_ids // 1000 % 1000,
+        'verse': verse_ids % 1000,
+    }, index=verse_ids.index)
+
+@functools.lru_cache(maxsize=None)
+def load_versification(name: str, directory: str = VERSIFICATION_DIR) -> pd.DataFrame:
+    """
+    Loads a versification table from `directory`/`name`.csv.
+
+    Each row maps the verses verse_start..verse_end of a chapter to
+    to_chapter, starting at to_verse. An empty to_chapter means the verses
+    have no counterpart in the canonical versification. An occurrence of n
+    restricts the row to the n-th time a reference appears in a source,
+    for sources that restart a verse count within a chapter.
+    """
+    table = pd.read_csv(os.path.join(directory, f"{name}.csv"), dtype={'book': str})
+    return table.reindex(columns=VERSIFICATION_COLUMNS)
+
+def apply_versification(refs: pd.DataFrame, tables: tuple[str, ...]) -> pd.DataFrame:
+    """
+    Maps references to the canonical versification.
+
+    Every table takes over the books it lists, so a later table never
+    remaps a book an earlier one covers. References that no table covers
+    are already canonical.
+
+    Args:
+        refs: A DataFrame with canonical 'book' codes and 'chapter' and 'verse' columns.
+        tables: The names of the versification tables to apply.
+
+    Returns:
+        A DataFrame with the canonical 'chapter' and 'verse' of every row,
+        missing where a verse has no counterpart.
+    """
+    result = pd.DataFrame({
+        'chapter': refs['chapter'].astype('Int64'),
+        'verse': refs['verse'].astype('Int64'),
+    }, index=refs.index)
+    if not tables or refs.empty:
+        return result
+
+    frame = pd.DataFrame({
+        'book': refs['book'].to_numpy(),
+        'chapter': result['chapter'].to_numpy(),
+        'verse': result['verse'].to_numpy(),
+        'position': range(len(refs)),
+    })
+    frame['occurrence'] = frame.groupby(['book', 'chapter', 'verse'], dropna=False).cumcount() + 1
+    frame = frame.dropna(subset=['book', 'chapter', 'verse'])
+    frame = frame.astype({'chapter': 'int64', 'verse': 'int64'})
+
+    claimed = set()
+    chapters = result['chapter'].to_numpy(dtype='float64', na_value=np.nan)
+    verses = result['verse'].to_numpy(dtype='float64', na_value=np.nan)
+    for name in tables:
+        table = load_versification(name)
+        table = table[~table['book'].isin(claimed)]
+        claimed.update(table['book'])
+        matches = frame.merge(table, on=['book', 'chapter'])
+        matches = matches[
+            matches['verse'].between(matches['verse_start'], matches['verse_end'])
+            & (matches['occurrence_y'].isna() | (matches['occurrence_x'] == matches['occurrence_y']))
+        ].drop_duplicates('position')
+        positions = matches['position'].to_numpy()
+        chapters[positions] = matches['to_chapter'].to_numpy(dtype='float64', na_value=np.nan)
+        verses[positions] = (matches['to_verse'] + matches['verse'] - matches['verse_start']).to_numpy(dtype='float64', na_value=np.nan)
+    result['chapter'] = pd.Series(chapters, index=refs.index).astype('Int64')
+    result['verse'] = pd.Series(verses, index=refs.index).astype('Int64')
+    return result
+
+def canonical_references(
+    df: pd.DataFrame,
+    scheme: str,
+    book_column: str = 'book_name',
+    chapter_column: str = 'chapter',
+    verse_column: str = 'verse',
+    errors: str = 'raise',
+) -> pd.DataFrame:
+    """
+    Maps the references of a dataset to canonical references and verse IDs.
+
+    Args:
+        df: The dataset, with its book names in the naming scheme.
+        scheme: A key of SCHEMES.
+        book_column, chapter_column, verse_column: The columns holding the reference.
+        errors: 'raise' to fail on unknown book names, 'coerce' to give them missing IDs.
+
+    Returns:
+        A DataFrame with the index of `df` and 'book', 'chapter', 'verse',
+        'recension' and 'verse_id' columns.
+    """
+    _, tables = _scheme(scheme)
+    names = split_recension(df[book_column].astype('string'))
+    refs = pd.DataFrame({
+        'book': canonical_books(names['name'], scheme, errors=errors),
+        'chapter': df[chapter_column],
+        'verse': df[verse_column],
+    }, index=df.index)
+    refs[['chapter', 'verse']] = apply_versification(refs, tables)
+    refs['recension'] = names['recension']
+    refs['verse_id'] = pack_verse_ids(refs['book'], refs['chapter'], refs['verse'])
+    return refs
+
+def parse_chapter_verse(values: pd.Series) -> pd.DataFrame:
+    """
+    Extracts the first 'chapter:verse' reference of each value as integer columns.
+
+    Tolerates the spacing and trailing ranges found in OCR output, e.g. '8: 14' or '2:30 :31'.
+    """
+    parts = values.astype('string').str.extract(r'(\d+)\s*:\s*(\d+)')
+    return pd.DataFrame({
+        'chapter': pd.to_numeric(parts[0]).astype('Int64'),
+        'verse': pd.to_numeric(parts[1]).astype('Int64'),
+    }, index=values.index)
+
+def parse_references(references: pd.Series) -> pd.DataFrame:
+    """Splits references such as 'GEN 1:1' into 'book_name', 'chapter' and 'verse' columns."""
+    parts = references.astype('string').str.extract(r'^\s*(.+?)\s+(\d+\s*:\s*\d+)')
+    result = parse_chapter_verse(parts[1])
+    result.insert(0, 'book_name', parts[0])
+    return result
+
+def versification_from_markers(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Builds the versification table of data/masoretic.csv from its verse markers.
+
+    The texts carry the Hebrew reference of each verse whose English number
+    differs, as in '(51-3)'. A verse holding several Hebrew verses is mapped
+    to the first one. Consecutive verses with the same offset are merged
+    into one row.
+    """
+    markers = df['text'].str.extract(r'\((\d+)-(\d+)\)').astype('Int64')
+    refs = pd.DataFrame({
+        'book': canonical_books(df['book_name'], 'masoretic'),
+        'chapter': df['chapter'].astype('int64'),
+        'verse': df['verse'].astype('int64'),
+        'to_chapter': markers[0],
+        'to_verse': markers[1],
+    }).dropna()
+    refs = refs[(refs['chapter'] != refs['to_chapter']) | (refs['verse'] != refs['to_verse'])]
+    offset = refs['to_verse'] - refs['verse']
+    run = (
+        (refs['book'] != refs['book'].shift())
+        | (refs['chapter'] != refs['chapter'].shift())
+        | (refs['to_chapter'] != refs['to_chapter'].shift())
+        | (offset != offset.shift())
+        | (refs['verse'] != refs['verse'].shift() + 1)
+    ).cumsum()
+    table = refs.groupby(run).agg(
+        book=('book', 'first'),
+        chapter=('chapter', 'first'),
+        verse_start=('verse', 'first'),
+        verse_end=('verse', 'last'),
+        to_chapter=('to_chapter', 'first'),
+        to_verse=('to_verse', 'first'),
+    )
+    return table.reset_index(drop=True).reindex(columns=VERSIFICATION_COLUMNS)
+
+def _keyed(df: pd.DataFrame, refs: pd.DataFrame, column: str, name: str, recensions: dict[str, str]) -> pd.Series:
+    preferred = refs['book'].map(recensions)
+    keep = refs['verse_id'].notna() & (refs['recension'].isna() | preferred.isna() | (refs['recension'] == preferred))
+    values = df.loc[keep, column]
+    ids = refs.loc[keep, 'verse_id']
+    # Where a verse occurs more than once, prefer a row that has a value
+    order = values.isna().to_numpy().argsort(kind='stable')
+    series = pd.Series(values.to_numpy()[order], index=ids.to_numpy()[order], name=name)
+    return series[~series.index.duplicated()]
+
+def aligned_table(
+    texts: dict[str, pd.DataFrame],
+    normalizations: dict[str, pd.DataFrame] | None = None,
+    schemes: dict[str, str] | None = None,
+    recensions: dict[str, str] = DEFAULT_RECENSIONS,
+) -> pd.DataFrame:
+    """
+    Aligns several corpora, and optionally their normalizations, verse by verse.
+
+    Every dataset is keyed by canonical verse ID and all of them are joined
+    at once, so verses missing from a source get empty values.
+
+    Args:
+        texts: Source DataFrames with 'book_name', 'chapter', 'verse' and 'text' columns, by source name.
+        normalizations: Normalized outputs with a 'normalization' column, by source name.
+        schemes: The naming scheme of each source. Defaults to the source name.
+        recensions: The recension kept for books that have several.
+
+    Returns:
+        A DataFrame indexed by 'verse_id', with 'book', 'chapter' and 'verse'
+        columns followed by 'text_<source>' and 'normalization_<source>' columns.
+    """
+    schemes = schemes or {}
+    columns = []
+    for datasets, column in ((texts, 'text'), (normalizations or {}, 'normalization')):
+        for source, df in datasets.items():
+            refs = canonical_references(df, schemes.get(source, source))
+            columns.append(_keyed(df, refs, column, f"{column}_{source}", recensions))
+
+    table = pd.concat(columns, axis=1, join='outer').sort_index()
+    table.index = table.index.astype('int64')
+    table.index.name = 'verse_id'
+    return pd.concat([unpack_verse_ids(table.index.to_series()), table], axis=1)
@@ -0,0 +1,105 @@
+import json
+from src.normalization_service import verse_key
+from src.structured_output import PROPOSITIONS_SCHEMA, generation_config, keyed_propositions_schema, parse_keyed_propositions, parse_propositions
+
+def request_key(source_name: str, hashes: list[int]) -> str:
+    """
+    Returns the key a batch-job request is filed under, e.g. 'masoretic:123,-456'.
+
+    The key names the source and the verse hashes of the verses in the
+    request, so results can be matched to their verses whatever order the
+    batch service returns them in.
+    """
+    return f"{source_name}:{','.join(str(int(h)) for h in hashes)}"
+
+def parse_request_key(key: str) -> tuple[str, list[int]]:
+    """
+    Splits a request key into the source name and the verse hashes.
+
+    Raises:
+        ValueError: If the key is not of the form request_key() writes.
+    """
+    source_name, sep, hashes = key.partition(':')
+    if not sep or not hashes:
+        raise ValueError(f"Malformed request key: {key}")
+    return source_name, [int(h) for h in hashes.split(',')]
+
+def request_line(source_name: str, batch: list[dict], prompt_template: str, batch_prompt_template: str | None, structured_output: bool = True) -> str:
+    """
+    Renders one line of a batch-job request file.
+
+    A single verse is sent with the single-verse prompt, several with the
+    batch prompt. Lines follow the Gemini batch-mode format:
+    {"key": ..., "request": {"contents": [...], "generation_config": {...}}}.
+
+    Args:
+        batch: Verses with 'book_name', 'chapter', 'verse', 'text' and 'verse_hash' keys.
+    """
+    if len(batch) == 1:
+        prompt = prompt_template.format(verse_text=batch[0]['text'])
+        schema = PROPOSITIONS_SCHEMA
+    else:
+        keyed_verses = {verse_key(row['book_name'], row['chapter'], row['verse']): row['text'] for row in batch}
+        prompt = batch_prompt_template.format(verses_json=json.dumps(keyed_verses, ensure_ascii=False))
+        schema = keyed_propositions_schema(list(keyed_verses))
+    request = {'contents': [{'role': 'user', 'parts': [{'text': prompt}]}]}
+    if structured_output:
+        request['generation_config'] = generation_config(schema)
+    return json.dumps({
+        'key': request_key(source_name, [row['verse_hash'] for row in batch]),
+        'request': request,
+    }, ensure_ascii=False) + '\n'
+
+def response_text(result: dict) -> str | None:
+    """
+    Returns the text of the first candidate of a batch-job result line.
+
+    Returns:
+        The text, or None if the request failed or the answer was blocked.
+    """
+    response = result.get('response') or {}
+    for candidate in response.get('candidates') or []:
+        parts = (candidate.get('content') or {}).get('parts') or []
+        text = ''.join(part.get('text', '') for part in parts)
+        if text:
+            return text
+    return None
+
+def parse_result(result: dict, rows: list[dict]) -> dict[int, list[str]]:
+    """
+    Parses the answer of a result line for the verses of its request.
+
+    Args:
+        result: A parsed result line.
+        rows: The verses of the request, in request order.
+
+    Returns:
+        The propositions of every verse, by verse hash. Verses whose answer
+        is missing or unusable map to an empty list.
+    """
+    text = response_text(result)
+    if text is None:
+        return {row['verse_hash']: [] for row in rows}
+    if len(rows) == 1:
+        return {rows[0]['verse_hash']: parse_propositions(text) or []}
+    keyed = parse_keyed_propositions(text, [verse_key(row['book_name'], row['chapter'], row['verse']) for row in rows])
+    return {
+        row['verse_hash']: keyed.get(verse_key(row['book_name'], row['chapter'], row['verse']), [])
+        for row in rows
+    }
+
+def read_results(path: str):
+    """
+    Streams the result lines of a batch job.
+
+    Yields:
+        The parsed lines, one dict per line. Blank and torn lines are skipped.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
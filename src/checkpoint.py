@@ -0,0 +1,165 @@
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import pandas as pd
+
+DONE = 'done'
+FAILED = 'failed'
+
+def verse_hash(book_name: str, chapter: int, verse: int, text: str) -> int:
+    """
+    Returns a stable 64-bit hash identifying a verse.
+
+    The hash covers the reference and the text, so a verse whose text changes
+    in the source data is treated as new work.
+    """
+    key = f"{book_name}\x1f{int(chapter)}\x1f{int(verse)}\x1f{text}"
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+def verse_hashes(df: pd.DataFrame) -> pd.Series:
+    """Returns verse_hash() for every row of a DataFrame with the standard verse columns."""
+    return pd.Series(
+        [
+            verse_hash(book_name, chapter, verse, text)
+            for book_name, chapter, verse, text in zip(df['book_name'], df['chapter'], df['verse'], df['text'])
+        ],
+        index=df.index,
+        dtype='int64',
+    )
+
+def repair_torn_tail(path: str) -> bool:
+    """
+    Truncates a partially written final line left behind by a killed run.
+
+    Returns:
+        True if the file was repaired.
+    """
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size == 0:
+            return False
+        f.seek(size - 1)
+        if f.read(1) == b'\n':
+            return False
+        # Walk back to the last complete line
+        block = 4096
+        position = size
+        while position > 0:
+            start = max(0, position - block)
+            f.seek(start)
+            chunk = f.read(position - start)
+            newline = chunk.rfind(b'\n')
+            if newline != -1:
+                f.truncate(start + newline + 1)
+                return True
+            position = start
+        f.truncate(0)
+        return True
+
+class CheckpointManifest:
+    """
+    An append-only record of which verses have been normalized.
+
+    Each verse is stored under its source and verse_hash() with a status of
+    DONE or FAILED. Updates are committed to a SQLite database in WAL mode,
+    so a killed run loses at most the verses that were in flight, and
+    resuming only needs to load the set of completed hashes.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: The path to the SQLite database file. Parent directories are created.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS verses ("
+            "source TEXT NOT NULL, verse_hash INTEGER NOT NULL, status TEXT NOT NULL, "
+            "updated REAL NOT NULL, PRIMARY KEY (source, verse_hash)) WITHOUT ROWID"
+        )
+
+    def mark(self, source: str, hashes: list[int], status: str):
+        """
+        Records the status of several verses in one transaction.
+
+        A verse that is already DONE stays DONE.
+        """
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "INSERT INTO verses (source, verse_hash, status, updated) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (source, verse_hash) DO UPDATE SET status = excluded.status, "
+                    "updated = excluded.updated WHERE verses.status != 'done'",
+                    [(source, int(h), status, now) for h in hashes],
+                )
+
+    def completed(self, source: str) -> set[int]:
+        """Returns the hashes of the verses of a source that were normalized successfully."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT verse_hash FROM verses WHERE source = ? AND status = ?", (source, DONE)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def recorded(self, source: str) -> set[int]:
+        """Returns the hashes of the verses of a source recorded with any status."""
+        with self._lock:
+            rows = self._conn.execute("SELECT verse_hash FROM verses WHERE source = ?", (source,)).fetchall()
+        return {row[0] for row in rows}
+
+    def counts(self, source: str) -> dict[str, int]:
+        """Returns the number of verses of a source in each status."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM verses WHERE source = ? GROUP BY status", (source,)
+            ).fetchall()
+        return dict(rows)
+
+    def has_source(self, source: str) -> bool:
+        """Returns whether anything has been recorded for a source."""
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM verses WHERE source = ? LIMIT 1", (source,)).fetchone()
+        return row is not None
+
+    def import_csv(self, source: str, output_file_path: str) -> int:
+        """
+        Seeds the manifest from an output CSV written before the manifest existed.
+
+        The file is streamed row by row; a torn final row is ignored.
+
+        Returns:
+            The number of rows imported.
+        """
+        done, failed = [], []
+        with open(output_file_path, newline='') as f:
+            reader = csv.DictReader(f)
+            try:
+                for row in reader:
+                    try:
+                        h = verse_hash(row['book_name'], row['chapter'], row['verse'], row['text'])
+                        propositions = json.loads(row['normalization']) if row['normalization'] else []
+                    except (TypeError, ValueError):
+                        continue
+                    (done if propositions else failed).append(h)
+            except csv.Error:
+                pass
+        self.mark(source, done, DONE)
+        self.mark(source, failed, FAILED)
+        return len(done) + len(failed)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,198 @@
+import google.generativeai as genai
+import json
+import logging
+import pandas as pd
+from src.alignment import DEFAULT_RECENSIONS, canonical_references
+from src.checkpoint import verse_hash
+from src.normalization_service import MODEL_NAME, configure_api_key, estimate_tokens, _clean_response_text
+from src.response_cache import ResponseCache, get_response_cache
+from src.utils import AdaptiveRateLimiter, async_call_with_rate_limiter, get_rate_limiter
+
+# Columns of the comparison output, with their Arrow type names
+COMPARISON_SCHEMA = [
+    ('verse_id', 'int64'),
+    ('book', 'string'),
+    ('chapter', 'int32'),
+    ('verse', 'int32'),
+    ('source_a', 'string'),
+    ('source_b', 'string'),
+    ('difference', 'bool'),
+    ('justification', 'string'),
+]
+
+# The Masoretic text is compared against each of the translations
+DEFAULT_PAIRS = [('masoretic', 'vulgate'), ('masoretic', 'septuagint')]
+
+logger = logging.getLogger(__name__)
+
+def pair_name(source_a: str, source_b: str) -> str:
+    """Returns the name a pair of sources is tracked under, e.g. 'masoretic-vulgate'."""
+    return f"{source_a}-{source_b}"
+
+def parse_pairs(spec: str) -> list[tuple[str, str]]:
+    """
+    Parses pairs of sources given as 'masoretic:vulgate,masoretic:septuagint'.
+
+    Raises:
+        ValueError: If an entry is not two different source names.
+    """
+    pairs = []
+    for entry in filter(None, (part.strip() for part in spec.split(','))):
+        sources = [name.strip() for name in entry.split(':')]
+        if len(sources) != 2 or not all(sources) or sources[0] == sources[1]:
+            raise ValueError(f"Expected 'source:source', got '{entry}'")
+        pairs.append(tuple(sources))
+    return pairs
+
+def format_comparison(source_a: str, propositions_a: list[str], source_b: str, propositions_b: list[str]) -> str:
+    """Returns the part of the comparison prompt that follows the instructions."""
+    return (
+        f"\n\nSource 1: {source_a.capitalize()}:\n\n{json.dumps(propositions_a, ensure_ascii=False)}\n\n"
+        f"Source 2: {source_b.capitalize()}:\n\n{json.dumps(propositions_b, ensure_ascii=False)}\n\nOutput:\n"
+    )
+
+def _parse_comparison(response_text: str) -> tuple[bool, str] | None:
+    """
+    Parses a '[true, "justification"]' answer.
+
+    Returns:
+        The difference flag and justification, or None if the answer is malformed.
+    """
+    text = _clean_response_text(response_text).lstrip('*').strip()
+    try:
+        parsed = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(parsed, list) or not parsed or not isinstance(parsed[0], bool):
+        return None
+    justification = parsed[1] if len(parsed) > 1 and isinstance(parsed[1], str) else ''
+    return parsed[0], justification
+
+class ComparisonService:
+    """
+    A long-lived client for comparing the normalizations of a verse in two sources.
+
+    Like NormalizationService, all setup happens once in the constructor, and
+    answers are kept in the response cache.
+    """
+
+    def __init__(
+        self,
+        prompt_path: str,
+        model_name: str = MODEL_NAME,
+        cache: ResponseCache | None = None,
+        rate_limiter: AdaptiveRateLimiter | None = None,
+    ):
+        """
+        Args:
+            prompt_path: The path to the comparison prompt, which ends where the verse is appended.
+            model_name: The name of the generative model.
+            cache: The response cache. Defaults to the process-wide cache.
+            rate_limiter: The rate limiter. Defaults to the process-wide limiter.
+
+        Raises:
+            ValueError: If the GOOGLE_API_KEY environment variable is not set.
+            FileNotFoundError: If the prompt file does not exist.
+        """
+        configure_api_key()
+
+        with open(prompt_path, 'r') as f:
+            self.prompt_template = f.read()
+
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name=model_name)
+        self.cache = cache if cache is not None else get_response_cache()
+        self.rate_limiter = rate_limiter if rate_limiter is not None else get_rate_limiter()
+        self._cache_key = ResponseCache.key_function(model_name, self.prompt_template)
+
+    async def compare_async(
+        self, source_a: str, propositions_a: list[str], source_b: str, propositions_b: list[str]
+    ) -> tuple[bool, str] | None:
+        """
+        Compares the normalizations of one verse in two sources.
+
+        Returns:
+            Whether the sources differ in meaning and a short justification,
+            or None if the answer cannot be parsed.
+        """
+        verse_part = format_comparison(source_a, propositions_a, source_b, propositions_b)
+        cache_key = self._cache_key(verse_part)
+        cached = self.cache.get(cache_key) if self.cache is not None else None
+        if cached is not None:
+            return cached[0], cached[1]
+
+        final_prompt = self.prompt_template.rstrip() + verse_part
+        response = await async_call_with_rate_limiter(
+            self.model.generate_content_async, final_prompt,
+            estimated_tokens=estimate_tokens(final_prompt), limiter=self.rate_limiter
+        )
+
+        try:
+            result = _parse_comparison(response.text)
+        except ValueError:
+            # The response was blocked or empty
+            result = None
+        if result is None:
+            logger.debug(f"Could not parse the comparison of {source_a} and {source_b}")
+        elif self.cache is not None:
+            self.cache.put(cache_key, list(result))
+        return result
+
+class PairMatcher:
+    """
+    Pairs up the normalizations of the same verse as they arrive from each source.
+
+    Rows are keyed by canonical verse ID. A pair is emitted as soon as both
+    of its sides have a normalization; a verse that several rows of one
+    source map to keeps the first, and Septuagint recensions other than the
+    preferred one are ignored.
+    """
+
+    def __init__(self, pairs: list[tuple[str, str]], recensions: dict[str, str] = DEFAULT_RECENSIONS):
+        self.pairs = pairs
+        self.recensions = recensions
+        self._normalizations = {source: {} for pair in pairs for source in pair}
+
+    def add(self, source: str, rows: list[dict]) -> list[dict]:
+        """
+        Records normalized rows of a source.
+
+        Returns:
+            The pairs that became complete, each a dict with the canonical
+            reference, both source names, both normalizations and a
+            'verse_hash' identifying the work.
+        """
+        if source not in self._normalizations or not rows:
+            return []
+        df = pd.DataFrame(rows)
+        refs = canonical_references(df, source, errors='coerce')
+        preferred = refs['book'].map(self.recensions)
+        keep = refs['verse_id'].notna() & (refs['recension'].isna() | preferred.isna() | (refs['recension'] == preferred))
+
+        seen = self._normalizations[source]
+        completed = []
+        for ref, normalization in zip(refs[keep].itertuples(), df.loc[keep, 'normalization']):
+            if not normalization or ref.verse_id in seen:
+                continue
+            seen[ref.verse_id] = normalization
+            for source_a, source_b in self.pairs:
+                if source not in (source_a, source_b):
+                    continue
+                propositions_a = self._normalizations[source_a].get(ref.verse_id)
+                propositions_b = self._normalizations[source_b].get(ref.verse_id)
+                if propositions_a is None or propositions_b is None:
+                    continue
+                completed.append({
+                    'verse_id': int(ref.verse_id),
+                    'book': ref.book,
+                    'chapter': int(ref.chapter),
+                    'verse': int(ref.verse),
+                    'source_a': source_a,
+                    'source_b': source_b,
+                    'normalization_a': propositions_a,
+                    'normalization_b': propositions_b,
+                    'verse_hash': verse_hash(
+                        ref.book, ref.chapter, ref.verse, json.dumps([propositions_a, propositions_b])
+                    ),
+                })
+        return completed
@@ -1,19 +1,174 @@
+import hashlib
+import json
+import logging
+import os
 import pandas as pd
 
-def load_data(file_path: str) -> pd.DataFrame:
+# Declared types of the corpus columns; columns without a header, such as the
+# trailing empty ones of septuagint.csv, are never loaded
+CORPUS_SCHEMA = {
+    'book_name': 'category',
+    'chapter': 'int16',
+    'verse': 'int16',
+    'potential_difference_verse': 'boolean',
+    'text': 'str',
+}
+
+# Default location of the columnar copies of the corpora, and rows per chunk of iter_data()
+DEFAULT_CACHE_DIR = os.path.join('output', 'corpus_cache')
+DEFAULT_CHUNK_ROWS = 50_000
+
+logger = logging.getLogger(__name__)
+
+_cache_dir = None
+
+def configure_corpus_cache(cache_dir: str | None = DEFAULT_CACHE_DIR) -> str | None:
     """
-    Loads data from a CSV file into a pandas DataFrame.
+    Sets where load_data() and iter_data() keep Parquet copies of the corpora.
+
+    Args:
+        cache_dir: The cache directory, or None to always parse the CSV files.
+
+    Returns:
+        The cache directory.
+    """
+    global _cache_dir
+    _cache_dir = cache_dir
+    return _cache_dir
+
+def _header(file_path: str) -> list[str]:
+    return list(pd.read_csv(file_path, nrows=0).columns)
+
+def _projection(header: list[str], columns: list[str] | None) -> list[str]:
+    """Returns the columns to load: the requested ones, or every column with a header."""
+    if columns is not None:
+        missing = [column for column in columns if column not in header]
+        if missing:
+            raise KeyError(f"Columns not in the corpus: {', '.join(missing)}")
+        return list(columns)
+    return [column for column in header if not column.startswith('Unnamed:')]
+
+def _dtypes(columns: list[str]) -> dict[str, str]:
+    return {column: CORPUS_SCHEMA.get(column, 'str') for column in columns}
+
+def _file_digest(file_path: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _cache_paths(file_path: str, cache_dir: str) -> tuple[str, str]:
+    absolute = os.path.abspath(file_path)
+    name = f"{os.path.splitext(os.path.basename(absolute))[0]}-{hashlib.blake2b(absolute.encode('utf-8'), digest_size=8).hexdigest()}"
+    return os.path.join(cache_dir, f"{name}.parquet"), os.path.join(cache_dir, f"{name}.json")
+
+def _cached_copy(file_path: str, cache_dir: str) -> str | None:
+    """
+    Returns the path of an up-to-date Parquet copy of a CSV file, writing it if needed.
+
+    A copy is up to date if the CSV file has the size and modification time
+    it was made from, or, after a mere touch, the same content hash.
+
+    Returns:
+        The path, or None if pyarrow is not installed or the cache cannot be written.
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return None
+    parquet_path, meta_path = _cache_paths(file_path, cache_dir)
+    stat = os.stat(file_path)
+    meta = None
+    if os.path.isfile(parquet_path) and os.path.isfile(meta_path):
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+        except ValueError:
+            meta = None
+    if meta is not None and meta['size'] == stat.st_size and meta['mtime_ns'] == stat.st_mtime_ns:
+        return parquet_path
+    digest = _file_digest(file_path)
+    if meta is None or meta['digest'] != digest:
+        header = _header(file_path)
+        columns = _projection(header, None)
+        df = pd.read_csv(file_path, usecols=columns, dtype=_dtypes(columns))
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            df.to_parquet(parquet_path + '.tmp', index=False)
+            os.replace(parquet_path + '.tmp', parquet_path)
+        except OSError as e:
+            logger.warning(f"Could not cache {file_path} in {cache_dir}: {e}")
+            return None
+        logger.info(f"Cached {file_path} as {parquet_path}")
+    meta = {'source': os.path.abspath(file_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'digest': digest}
+    with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + '.tmp', meta_path)
+    return parquet_path
+
+def load_data(file_path: str, columns: list[str] | None = None, cache_dir: str | None = None) -> pd.DataFrame:
+    """
+    Loads a corpus CSV file into a typed pandas DataFrame.
+
+    Columns are read with the types of CORPUS_SCHEMA: a categorical book
+    name, 16-bit chapter and verse numbers, a boolean flag and string text.
+    Columns without a header are skipped. If a cache directory is set, the
+    file is parsed once into a Parquet copy, which later loads read instead
+    until the CSV file changes.
 
     Args:
         file_path: The path to the CSV file.
+        columns: The columns to load (default: every column with a header).
+        cache_dir: The cache directory. Defaults to the one set with
+            configure_corpus_cache(), if any.
 
     Returns:
-        A pandas DataFrame containing the data from the CSV file.
-    
+        A pandas DataFrame with one row per line of the file, indexed by line.
+
     Raises:
         FileNotFoundError: If the file does not exist.
+        KeyError: If a requested column is not in the file.
+    """
+    cache_dir = cache_dir if cache_dir is not None else _cache_dir
+    if not os.path.isfile(file_path):
+        raise FileNotFoundError(f"No such file: '{file_path}'")
+    parquet_path = _cached_copy(file_path, cache_dir) if cache_dir is not None else None
+    if parquet_path is not None:
+        import pyarrow.parquet as pq
+        names = pq.read_schema(parquet_path).names
+        return pd.read_parquet(parquet_path, columns=_projection(names, columns))
+    projection = _projection(_header(file_path), columns)
+    return pd.read_csv(file_path, usecols=projection, dtype=_dtypes(projection))[projection]
+
+def iter_data(file_path: str, columns: list[str] | None = None, chunk_rows: int = DEFAULT_CHUNK_ROWS, cache_dir: str | None = None):
+    """
+    Loads a corpus CSV file in chunks, for corpora too large to hold in memory.
+
+    Chunks have the types and index load_data() gives, so their
+    concatenation equals load_data().
+
+    Yields:
+        DataFrames of up to `chunk_rows` rows.
     """
-    return pd.read_csv(file_path)
+    cache_dir = cache_dir if cache_dir is not None else _cache_dir
+    if not os.path.isfile(file_path):
+        raise FileNotFoundError(f"No such file: '{file_path}'")
+    parquet_path = _cached_copy(file_path, cache_dir) if cache_dir is not None else None
+    if parquet_path is not None:
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(parquet_path)
+        start = 0
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=_projection(parquet_file.schema_arrow.names, columns)):
+            chunk = batch.to_pandas()
+            chunk.index = pd.RangeIndex(start, start + len(chunk))
+            start += len(chunk)
+            yield chunk
+        return
+    projection = _projection(_header(file_path), columns)
+    with pd.read_csv(file_path, usecols=projection, dtype=_dtypes(projection), chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            yield chunk[projection]
 
 def filter_septuagint(df: pd.DataFrame) -> pd.DataFrame:
     """
@@ -28,10 +183,5 @@ def filter_septuagint(df: pd.DataFrame) -> pd.DataFrame:
     if 'potential_difference_verse' not in df.columns:
         # If the column doesn't exist, return the original dataframe
         return df
-        
-    # The values might be read as strings, so handle 'True' and 'False' strings
-    if pd.api.types.is_string_dtype(df['potential_difference_verse']):
-        return df[df['potential_difference_verse'].str.lower() == 'true'].copy()
-    
-    # Handle boolean values
-    return df[df['potential_difference_verse'] == True].copy()
+    # load_data() reads the flag as a nullable boolean; unmarked verses are left out
+    return df[df['potential_difference_verse'].astype('boolean').fillna(False).astype(bool)].copy()
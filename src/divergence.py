@@ -0,0 +1,121 @@
+import itertools
+import numpy as np
+import pandas as pd
+from src.alignment import aligned_table, canonical_references
+
+# Length of the character n-grams verses are compared by
+DEFAULT_NGRAM = 3
+
+# Shingles are stored as the row number in the high bits and a 40-bit hash of the n-gram in the low bits
+_ROW_SHIFT = np.uint64(40)
+_HASH_MASK = np.uint64((1 << 40) - 1)
+_HASH_BASE = np.uint64(1_000_003)
+
+def clean_texts(texts: pd.Series) -> pd.Series:
+    """Lowercases texts and strips verse markers, punctuation and extra whitespace."""
+    return (
+        texts.astype('string').fillna('')
+        .str.lower()
+        .str.replace(r'\(\d+-\d+\)', ' ', regex=True)
+        .str.replace(r'[^\w\s]', ' ', regex=True)
+        .str.replace(r'\s+', ' ', regex=True)
+        .str.strip()
+    )
+
+def _shingles(texts: pd.Series, n: int) -> np.ndarray:
+    """
+    Returns the sorted, unique character n-grams of every text as uint64 keys.
+
+    All texts are concatenated into one array of code points and hashed
+    with a rolling polynomial, dropping n-grams that cross two texts.
+    """
+    lengths = texts.str.len().to_numpy(dtype=np.int64)
+    codes = np.frombuffer(''.join(texts).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    count = len(codes) - n + 1
+    if count <= 0:
+        return np.zeros(0, dtype=np.uint64)
+    rows = np.repeat(np.arange(len(texts), dtype=np.uint64), lengths)
+    hashes = np.zeros(count, dtype=np.uint64)
+    for offset in range(n):
+        hashes = hashes * _HASH_BASE + codes[offset:offset + count]
+    within = rows[:count] == rows[n - 1:]
+    keys = np.sort((rows[:count][within] << _ROW_SHIFT) | (hashes[within] & _HASH_MASK))
+    # A sort and a neighbour comparison beat np.unique's hash table on arrays this size
+    return keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+
+def jaccard_similarity(texts_a: pd.Series, texts_b: pd.Series, n: int = DEFAULT_NGRAM) -> np.ndarray:
+    """
+    Computes the Jaccard similarity of the character n-gram sets of aligned texts.
+
+    Args:
+        texts_a, texts_b: Texts of the same length, compared row by row.
+        n: The n-gram length.
+
+    Returns:
+        An array of similarities between 0 and 1, NaN where either text is
+        missing or shorter than n characters.
+    """
+    texts_a = clean_texts(texts_a)
+    texts_b = clean_texts(texts_b)
+    rows = len(texts_a)
+    shingles_a = _shingles(texts_a, n)
+    shingles_b = _shingles(texts_b, n)
+    shared = np.intersect1d(shingles_a, shingles_b, assume_unique=True)
+
+    def per_row(keys):
+        return np.bincount((keys >> _ROW_SHIFT).astype(np.int64), minlength=rows)
+
+    size_a, size_b, intersection = per_row(shingles_a), per_row(shingles_b), per_row(shared)
+    union = size_a + size_b - intersection
+    with np.errstate(invalid='ignore', divide='ignore'):
+        similarity = intersection / union
+    return np.where((size_a > 0) & (size_b > 0), similarity, np.nan)
+
+def divergence_scores(aligned: pd.DataFrame, pairs: list[tuple[str, str]], n: int = DEFAULT_NGRAM) -> pd.DataFrame:
+    """
+    Scores how far apart the texts of each pair of sources are, verse by verse.
+
+    Args:
+        aligned: A table from aligned_table() with 'text_<source>' columns.
+        pairs: The pairs of sources to score.
+
+    Returns:
+        A DataFrame with the index of `aligned` and a 'divergence_<a>_<b>'
+        column per pair, from 0 (same n-grams) to 1 (none shared), and NaN
+        where a source lacks the verse.
+    """
+    return pd.DataFrame({
+        f"divergence_{source_a}_{source_b}":
+            1 - jaccard_similarity(aligned[f"text_{source_a}"], aligned[f"text_{source_b}"], n)
+        for source_a, source_b in pairs
+    }, index=aligned.index)
+
+def divergence_flags(texts: dict[str, pd.DataFrame], threshold: float, n: int = DEFAULT_NGRAM) -> dict[str, pd.Series]:
+    """
+    Flags the verses of each source that may differ from the other sources.
+
+    A verse is flagged when its divergence from any other source is above
+    `threshold`, or when no other source has the verse to compare with.
+    Verses without text are never flagged.
+
+    Args:
+        texts: Source DataFrames with 'book_name', 'chapter', 'verse' and 'text' columns, by source name.
+        threshold: The divergence above which verses count as different, between 0 and 1.
+        n: The n-gram length.
+
+    Returns:
+        A boolean Series per source, with the index of its DataFrame, suitable
+        as its 'potential_difference_verse' column.
+    """
+    sources = list(texts)
+    pairs = list(itertools.combinations(sources, 2))
+    scores = divergence_scores(aligned_table(texts), pairs, n)
+
+    flags = {}
+    for source in sources:
+        source_scores = scores[[f"divergence_{a}_{b}" for a, b in pairs if source in (a, b)]]
+        divergent = (source_scores > threshold).any(axis=1) | source_scores.isna().all(axis=1)
+        verse_ids = canonical_references(texts[source], source)['verse_id']
+        flagged = verse_ids.map(divergent).astype('boolean').fillna(True).astype(bool)
+        flags[source] = flagged & texts[source]['text'].notna()
+    return flags
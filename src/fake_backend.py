@@ -0,0 +1,205 @@
+import asyncio
+import collections
+import json
+import random
+import re
+import threading
+import contextlib
+import time
+from unittest import mock
+from google.api_core.exceptions import ResourceExhausted
+
+LATENCY_DISTRIBUTIONS = ('constant', 'uniform', 'lognormal')
+
+_VERSES_JSON = re.compile(r'Verses:\s*(\{)')
+_OUTPUT_CUE = re.compile(r'\s*Output:\s*$')
+
+class _UsageMetadata:
+    def __init__(self, prompt_token_count: int, candidates_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+class FakeResponse:
+    """The parts of a generate_content response the pipeline reads."""
+
+    def __init__(self, text: str, prompt_tokens: int):
+        self.text = text
+        self.usage_metadata = _UsageMetadata(prompt_tokens, len(text) // 4)
+
+def fake_answer(prompt: str) -> str:
+    """
+    Answers a prompt the way the model is asked to.
+
+    Batch prompts get a keyed JSON object, comparison prompts a
+    [bool, justification] array, and single-verse prompts a JSON array with
+    one proposition per sentence of the verse.
+    """
+    batch = None
+    for match in _VERSES_JSON.finditer(prompt):
+        batch = match
+    if batch is not None:
+        try:
+            verses, _ = json.JSONDecoder().raw_decode(prompt, batch.start(1))
+        except ValueError:
+            verses = None
+        if isinstance(verses, dict):
+            return json.dumps({key: _propositions(text) for key, text in verses.items()}, ensure_ascii=False)
+    if 'Source 2:' in prompt:
+        return '[false, ""]'
+    verse_text = _OUTPUT_CUE.sub('', prompt.rsplit('Verse:', 1)[-1]).strip()
+    return json.dumps(_propositions(verse_text), ensure_ascii=False)
+
+def _propositions(text: str) -> list[str]:
+    sentences = [part.strip() for part in re.split(r'(?<=[.;:!?])\s+', str(text)) if part.strip()]
+    return sentences or [str(text)]
+
+class FakeGeminiBackend:
+    """
+    A local stand-in for the Gemini API, for tests and benchmarks.
+
+    It answers generate_content calls with well-formed output after a
+    latency drawn from a configurable distribution, and can inject
+    rate-limit errors and malformed answers. Requests and tokens are
+    counted, and an optional per-minute quota is enforced over a sliding
+    window like the real service does, separately for every API key.
+
+    install() swaps google.generativeai.GenerativeModel, and the per-key
+    models of src.key_pool, for models backed by this object, so the
+    pipeline runs unchanged against it.
+    """
+
+    def __init__(
+        self,
+        latency: str = 'lognormal',
+        latency_mean: float = 0.2,
+        latency_spread: float = 0.5,
+        rate_limit_rate: float = 0.0,
+        malformed_rate: float = 0.0,
+        requests_per_minute: int | None = None,
+        tokens_per_minute: int | None = None,
+        retry_after: float = 1.0,
+        seed: int | None = None,
+        clock=time.monotonic,
+    ):
+        """
+        Args:
+            latency: One of LATENCY_DISTRIBUTIONS.
+            latency_mean: The mean latency in seconds ('lognormal': the median).
+            latency_spread: 'uniform': the half-width in seconds; 'lognormal':
+                the sigma of the underlying normal distribution.
+            rate_limit_rate: The probability of answering with a 429 error.
+            malformed_rate: The probability of answering with invalid JSON.
+            requests_per_minute: A request quota per key enforced with 429 errors, if any.
+            tokens_per_minute: A token quota per key enforced with 429 errors, if any.
+            retry_after: The retry hint in seconds sent with injected 429 errors.
+            seed: Seeds the random draws, for reproducible runs.
+            clock: A monotonic clock, injectable for tests.
+
+        Raises:
+            ValueError: If the latency distribution is unknown.
+        """
+        if latency not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {latency}")
+        self.latency = latency
+        self.latency_mean = latency_mean
+        self.latency_spread = latency_spread
+        self.rate_limit_rate = rate_limit_rate
+        self.malformed_rate = malformed_rate
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._windows = collections.defaultdict(collections.deque)
+        self._window_tokens = collections.defaultdict(int)
+        self.requests = 0
+        self.rate_limited = 0
+        self.malformed = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.latencies = []
+
+    def _draw_latency(self) -> float:
+        if self.latency == 'constant':
+            return self.latency_mean
+        if self.latency == 'uniform':
+            return max(0.0, self._random.uniform(self.latency_mean - self.latency_spread, self.latency_mean + self.latency_spread))
+        return self._random.lognormvariate(0.0, self.latency_spread) * self.latency_mean
+
+    def _admit(self, prompt_tokens: int, api_key: str | None) -> tuple[float, bool]:
+        """Counts a request against its key's quota and draws its latency and fate."""
+        with self._lock:
+            now = self._clock()
+            window = self._windows[api_key]
+            while window and now - window[0][0] >= 60:
+                self._window_tokens[api_key] -= window.popleft()[1]
+            if (
+                (self.requests_per_minute is not None and len(window) >= self.requests_per_minute)
+                or (self.tokens_per_minute is not None and self._window_tokens[api_key] + prompt_tokens > self.tokens_per_minute)
+            ):
+                self.rate_limited += 1
+                wait = 60 - (now - window[0][0]) if window else self.retry_after
+                raise ResourceExhausted(f"Quota exceeded. Please retry in {wait:.3f}s.")
+            if self._random.random() < self.rate_limit_rate:
+                self.rate_limited += 1
+                raise ResourceExhausted(f"Resource has been exhausted. Please retry in {self.retry_after:.3f}s.")
+            window.append((now, prompt_tokens))
+            self._window_tokens[api_key] += prompt_tokens
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            return self._draw_latency(), self._random.random() < self.malformed_rate
+
+    def _respond(self, prompt: str, malformed: bool, latency: float) -> FakeResponse:
+        text = 'Sorry, I cannot help with that [' if malformed else fake_answer(prompt)
+        response = FakeResponse(text, len(prompt) // 4)
+        with self._lock:
+            if malformed:
+                self.malformed += 1
+            self.output_tokens += response.usage_metadata.candidates_token_count
+            self.latencies.append(latency)
+        return response
+
+    def generate_content(self, prompt: str, api_key: str | None = None) -> FakeResponse:
+        latency, malformed = self._admit(len(prompt) // 4, api_key)
+        time.sleep(latency)
+        return self._respond(prompt, malformed, latency)
+
+    async def generate_content_async(self, prompt: str, api_key: str | None = None) -> FakeResponse:
+        latency, malformed = self._admit(len(prompt) // 4, api_key)
+        await asyncio.sleep(latency)
+        return self._respond(prompt, malformed, latency)
+
+    def stats(self) -> dict:
+        """Returns the counters of the backend."""
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'rate_limited': self.rate_limited,
+                'malformed': self.malformed,
+                'prompt_tokens': self.prompt_tokens,
+                'output_tokens': self.output_tokens,
+            }
+
+    @contextlib.contextmanager
+    def install(self):
+        """
+        Returns a context manager that routes every GenerativeModel to this backend.
+        """
+        backend = self
+
+        class FakeGenerativeModel:
+            def __init__(self, model_name: str = 'fake', api_key: str | None = None, **kwargs):
+                self.model_name = model_name
+                self.api_key = api_key
+
+            def generate_content(self, prompt, **kwargs):
+                return backend.generate_content(prompt, self.api_key)
+
+            async def generate_content_async(self, prompt, **kwargs):
+                return await backend.generate_content_async(prompt, self.api_key)
+
+        with mock.patch('google.generativeai.GenerativeModel', FakeGenerativeModel), \
+             mock.patch('src.key_pool.build_model', lambda model_name, api_key: FakeGenerativeModel(model_name, api_key)):
+            yield
@@ -0,0 +1,305 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import google.ai.generativelanguage as glm
+import google.generativeai as genai
+from google.api_core.exceptions import PermissionDenied, ResourceExhausted
+from src.utils import AdaptiveRateLimiter, _record_call_stats, _response_token_count, retry_after_seconds
+
+# Consecutive 429/403 errors after which a key is benched, and how long the first benching lasts
+DEFAULT_BENCH_AFTER = 3
+DEFAULT_BENCH_SECONDS = 60.0
+
+# Benchings in a row without a success in between double the time, up to this factor
+MAX_BENCH_FACTOR = 16
+
+logger = logging.getLogger(__name__)
+
+def load_api_keys(path: str | None = None) -> list[str]:
+    """
+    Reads the API keys to spread requests over.
+
+    Keys are read from `path`, one per line, if given; otherwise from the
+    comma-separated GOOGLE_API_KEYS environment variable, falling back to
+    GOOGLE_API_KEY. Blank lines, '#' comments and duplicates are skipped.
+
+    Raises:
+        ValueError: If no key is found.
+        FileNotFoundError: If `path` does not exist.
+    """
+    if path is not None:
+        with open(path, 'r') as f:
+            candidates = [line.split('#', 1)[0] for line in f]
+    elif os.getenv("GOOGLE_API_KEYS"):
+        candidates = os.environ["GOOGLE_API_KEYS"].split(',')
+    else:
+        candidates = [os.getenv("GOOGLE_API_KEY", "")]
+    keys = list(dict.fromkeys(key.strip() for key in candidates if key.strip()))
+    if not keys:
+        raise ValueError(
+            f"No API key found in {path}." if path is not None
+            else "Neither GOOGLE_API_KEYS nor GOOGLE_API_KEY environment variable set."
+        )
+    return keys
+
+def mask_api_key(api_key: str) -> str:
+    """Returns a printable name for a key that does not give it away, e.g. '...f3Qx'."""
+    return f"...{api_key[-4:]}"
+
+def build_model(model_name: str, api_key: str):
+    """
+    Builds a GenerativeModel that authenticates with `api_key`.
+
+    genai.configure() holds a single key for the whole process, so the model
+    is given clients of its own instead of the process-wide ones.
+    """
+    model = genai.GenerativeModel(model_name=model_name)
+    model._client = glm.GenerativeServiceClient(client_options={'api_key': api_key})
+    model._async_client = glm.GenerativeServiceAsyncClient(client_options={'api_key': api_key})
+    return model
+
+class ApiKey:
+    """
+    One credential of a KeyPool, with its own models, rate limiter and health.
+    """
+
+    def __init__(self, api_key: str, limiter: AdaptiveRateLimiter):
+        self.api_key = api_key
+        self.name = mask_api_key(api_key)
+        self.limiter = limiter
+        self.consecutive_failures = 0
+        self.benchings_in_a_row = 0
+        self.benched_until = float('-inf')
+        self.requests = 0
+        self.rate_limited = 0
+        self.denied = 0
+        self.benchings = 0
+        self._models = {}
+
+    def model(self, model_name: str):
+        """Returns this key's model of the given name, building it on first use."""
+        if model_name not in self._models:
+            self._models[model_name] = build_model(model_name, self.api_key)
+        return self._models[model_name]
+
+    def stats(self) -> dict:
+        """Returns the counters of the key."""
+        return {
+            'requests': self.requests,
+            'rate_limited': self.rate_limited,
+            'denied': self.denied,
+            'benchings': self.benchings,
+            'current_rpm': self.limiter.current_rpm,
+        }
+
+class KeyPool:
+    """
+    Spreads API calls over several keys, each with its own quota.
+
+    Every key has its own clients and its own AdaptiveRateLimiter, so the
+    quotas add up: each call goes to the key whose limiter would let it
+    through soonest, with ties taken in turn. A key that answers
+    `bench_after` times in a row with 429 (quota exhausted) or 403
+    (permission denied) is benched, and gets no calls until the time is up.
+    The pool is thread-safe, so it can be shared by threads and coroutines.
+    """
+
+    def __init__(
+        self,
+        api_keys: list[str],
+        requests_per_minute: float = 2000,
+        tokens_per_minute: float = 4_000_000,
+        bench_after: int = DEFAULT_BENCH_AFTER,
+        bench_seconds: float = DEFAULT_BENCH_SECONDS,
+        clock=time.monotonic,
+        **limiter_kwargs,
+    ):
+        """
+        Args:
+            api_keys: The keys, at least one.
+            requests_per_minute: The request quota (RPM) of each key.
+            tokens_per_minute: The token quota (TPM) of each key.
+            bench_after: The number of 429/403 errors in a row that bench a key.
+            bench_seconds: How long a key is benched the first time. A key
+                benched again before any success is benched twice as long,
+                and never for less than the server's retry hint.
+            clock: A monotonic clock, injectable for tests.
+            **limiter_kwargs: Passed through to each key's AdaptiveRateLimiter.
+
+        Raises:
+            ValueError: If no key is given.
+        """
+        if not api_keys:
+            raise ValueError("A key pool needs at least one API key.")
+        self.bench_after = bench_after
+        self.bench_seconds = bench_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._next = 0
+        self.keys = [
+            ApiKey(api_key, AdaptiveRateLimiter(
+                requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute, clock=clock, **limiter_kwargs
+            ))
+            for api_key in api_keys
+        ]
+
+    @property
+    def current_rpm(self) -> float:
+        """The request rate the keys currently allow together, in requests per minute."""
+        return sum(key.limiter.current_rpm for key in self.keys)
+
+    def choose(self, tokens: int = 0) -> tuple[ApiKey, float]:
+        """
+        Picks the key for a request of `tokens` tokens.
+
+        Returns:
+            The key with the most headroom among those not benched, and 0.
+            If every key is benched, the one whose bench ends first and the
+            seconds until then.
+        """
+        with self._lock:
+            now = self._clock()
+            self._next = (self._next + 1) % len(self.keys)
+            in_turn = self.keys[self._next:] + self.keys[:self._next]
+            active = [key for key in in_turn if key.benched_until <= now]
+            if not active:
+                key = min(self.keys, key=lambda key: key.benched_until)
+                return key, key.benched_until - now
+            return min(active, key=lambda key: key.limiter.delay(tokens)), 0.0
+
+    def record_success(self, key: ApiKey, response, tokens_reserved: int = 0):
+        """Reports a successful call to the key's limiter and clears its failures."""
+        key.limiter.record_success(_response_token_count(response), tokens_reserved)
+        with self._lock:
+            key.requests += 1
+            key.consecutive_failures = 0
+            key.benchings_in_a_row = 0
+
+    def record_failure(self, key: ApiKey, error: Exception):
+        """
+        Reports a 429 or 403 error, benching the key once they add up.
+        """
+        retry_after = retry_after_seconds(error)
+        if isinstance(error, ResourceExhausted):
+            key.limiter.record_rate_limited(retry_after)
+        with self._lock:
+            if isinstance(error, ResourceExhausted):
+                key.rate_limited += 1
+            else:
+                key.denied += 1
+            key.consecutive_failures += 1
+            if key.consecutive_failures < self.bench_after:
+                return
+            factor = min(MAX_BENCH_FACTOR, 2 ** key.benchings_in_a_row)
+            seconds = max(self.bench_seconds * factor, retry_after or 0.0)
+            key.benched_until = self._clock() + seconds
+            key.consecutive_failures = 0
+            key.benchings_in_a_row += 1
+            key.benchings += 1
+        logger.warning(
+            f"API key {key.name} benched for {seconds:.0f}s after {self.bench_after} errors in a row: {error}"
+        )
+
+    def call(self, model_name: str, method_name: str, *args, estimated_tokens: int = 0, max_retries: int = 10, call_stats: dict | None = None, **kwargs):
+        """
+        Calls a method of the model on the key with the most headroom.
+
+        The call waits for its turn on the chosen key's limiter. On a 429 or
+        403 error it is reported against that key and retried, on whichever
+        key then has the most headroom.
+
+        Args:
+            model_name: The name of the generative model.
+            method_name: The model method to call, e.g. 'generate_content'.
+            estimated_tokens: The number of tokens the call is expected to use.
+            max_retries: How many 429/403 errors to tolerate before giving up.
+            call_stats: If given, filled in like call_with_rate_limiter()
+                does, plus the name of the key that answered ('api_key').
+
+        Raises:
+            Exception: If the call still fails after max_retries retries.
+        """
+        num_retries = 0
+        waited = 0.0
+        while True:
+            key, benched = self.choose(estimated_tokens)
+            started = time.monotonic()
+            if benched > 0:
+                time.sleep(benched)
+            key.limiter.acquire(estimated_tokens)
+            waited += time.monotonic() - started
+            try:
+                response = getattr(key.model(model_name), method_name)(*args, **kwargs)
+            except (ResourceExhausted, PermissionDenied) as e:
+                num_retries = self._failed(key, e, num_retries, max_retries, waited, call_stats)
+                continue
+            self.record_success(key, response, estimated_tokens)
+            self._succeeded(key, response, num_retries, waited, call_stats)
+            return response
+
+    async def call_async(self, model_name: str, method_name: str, *args, estimated_tokens: int = 0, max_retries: int = 10, call_stats: dict | None = None, **kwargs):
+        """
+        The asyncio counterpart of call, for coroutine methods such as 'generate_content_async'.
+        """
+        num_retries = 0
+        waited = 0.0
+        while True:
+            key, benched = self.choose(estimated_tokens)
+            started = time.monotonic()
+            if benched > 0:
+                await asyncio.sleep(benched)
+            await key.limiter.acquire_async(estimated_tokens)
+            waited += time.monotonic() - started
+            try:
+                response = await getattr(key.model(model_name), method_name)(*args, **kwargs)
+            except (ResourceExhausted, PermissionDenied) as e:
+                num_retries = self._failed(key, e, num_retries, max_retries, waited, call_stats)
+                continue
+            self.record_success(key, response, estimated_tokens)
+            self._succeeded(key, response, num_retries, waited, call_stats)
+            return response
+
+    def _failed(self, key: ApiKey, error: Exception, num_retries: int, max_retries: int, waited: float, call_stats: dict | None) -> int:
+        self.record_failure(key, error)
+        num_retries += 1
+        _record_call_stats(call_stats, None, num_retries, waited)
+        if num_retries > max_retries:
+            raise Exception(
+                f"Maximum number of retries ({max_retries}) exceeded."
+            ) from error
+        return num_retries
+
+    def _succeeded(self, key: ApiKey, response, num_retries: int, waited: float, call_stats: dict | None):
+        _record_call_stats(call_stats, response, num_retries, waited)
+        if call_stats is not None:
+            call_stats['api_key'] = key.name
+
+    def stats(self) -> dict:
+        """Returns the counters of every key, by key name."""
+        with self._lock:
+            return {key.name: key.stats() for key in self.keys}
+
+_key_pool = None
+_key_pool_lock = threading.Lock()
+
+def get_key_pool() -> KeyPool | None:
+    """Returns the process-wide key pool, or None if none was configured."""
+    return _key_pool
+
+def configure_key_pool(api_keys: list[str] | None, **kwargs) -> KeyPool | None:
+    """
+    Replaces the process-wide key pool.
+
+    Args:
+        api_keys: The keys of the pool, or None to remove it.
+        **kwargs: Passed through to KeyPool.
+
+    Returns:
+        The new pool, or None if it was removed.
+    """
+    global _key_pool
+    with _key_pool_lock:
+        _key_pool = KeyPool(api_keys, **kwargs) if api_keys is not None else None
+        return _key_pool
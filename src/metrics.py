@@ -0,0 +1,264 @@
+import collections
+import contextvars
+import json
+import os
+import threading
+import time
+import numpy as np
+
+METRICS_FORMATS = ('prometheus', 'json')
+
+# The source the current task is normalizing, attached to its call records
+current_source = contextvars.ContextVar('current_source', default=None)
+
+# Number of recent call latencies the percentiles are computed over
+LATENCY_SAMPLES = 10_000
+
+_PREFIX = 'tessela_normalization'
+
+# Name, type and help of each exported aggregate
+_PROMETHEUS_METRICS = (
+    ('calls', 'counter', 'API calls made, including failed ones.'),
+    ('verses', 'counter', 'Verses sent to the API.'),
+    ('cache_hits', 'counter', 'Verses answered from the response cache.'),
+    ('errors', 'counter', 'API calls that raised an error.'),
+    ('parse_failures', 'counter', 'Verses whose answer could not be parsed.'),
+    ('retries', 'counter', 'Rate-limit errors retried.'),
+    ('prompt_tokens', 'counter', 'Prompt tokens reported by the API.'),
+    ('output_tokens', 'counter', 'Output tokens reported by the API.'),
+    ('rate_limit_wait_seconds', 'counter', 'Seconds calls spent waiting on the rate limiter.'),
+    ('call_seconds', 'counter', 'Seconds spent in calls, including rate-limit waits.'),
+    ('write_seconds', 'counter', 'Seconds the result writers spent writing and checkpointing.'),
+    ('rows_written', 'counter', 'Rows committed by the result writers.'),
+    ('in_flight', 'gauge', 'API calls currently in flight.'),
+    ('writer_queue_rows', 'gauge', 'Results waiting in the writer queues.'),
+    ('verses_per_second', 'gauge', 'Verses finished per second since the start of the run.'),
+    ('error_rate', 'gauge', 'Fraction of API calls that raised an error.'),
+    ('requests_per_minute', 'gauge', 'API calls started over the last minute.'),
+    ('tokens_per_minute', 'gauge', 'Tokens reported over the last minute.'),
+    ('rate_limit_wait_fraction', 'gauge', 'Fraction of call time spent waiting on the rate limiter.'),
+    ('writer_busy_fraction', 'gauge', 'Fraction of the run the result writers spent writing.'),
+)
+
+class MetricsRecorder:
+    """
+    Collects per-call records and live aggregates of the normalization.
+
+    Every API call is recorded with its latency, token counts, retries,
+    rate-limit wait, parse failures and the verses it covered; records are
+    appended to an optional JSONL log. Aggregates (throughput, error rate,
+    in-flight calls, tokens per minute, latency percentiles, writer load)
+    are available from snapshot() and can be exported periodically as a
+    Prometheus textfile or JSON, to tell whether a run is bound by the
+    quota, by the API's latency or by its own I/O.
+
+    The recorder is thread-safe.
+    """
+
+    def __init__(self, call_log_path: str | None = None, clock=time.monotonic):
+        """
+        Args:
+            call_log_path: Where to append one JSON record per call, if anywhere.
+                Parent directories are created.
+            clock: A monotonic clock, injectable for tests.
+        """
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._started = clock()
+        self._totals = dict.fromkeys(
+            ('calls', 'verses', 'cache_hits', 'errors', 'parse_failures', 'retries',
+             'prompt_tokens', 'output_tokens', 'rate_limit_wait_seconds', 'call_seconds'), 0
+        )
+        self._in_flight = 0
+        self._latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self._window = collections.deque()
+        self._writers = {}
+        self._call_log = None
+        if call_log_path:
+            if os.path.dirname(call_log_path):
+                os.makedirs(os.path.dirname(call_log_path), exist_ok=True)
+            self._call_log = open(call_log_path, 'a', encoding='utf-8')
+        self._export_stop = threading.Event()
+        self._export_thread = None
+
+    def call_started(self) -> float:
+        """Counts a call as in flight and returns its start time for record_call()."""
+        with self._lock:
+            self._in_flight += 1
+        return self._clock()
+
+    def record_call(
+        self,
+        started: float,
+        verses: list[str],
+        call_stats: dict,
+        parse_failures: int = 0,
+        error: Exception | None = None,
+    ):
+        """
+        Records a finished call.
+
+        Args:
+            started: The value call_started() returned for the call.
+            verses: The keys of the verses the call covered.
+            call_stats: The stats call_with_rate_limiter() filled in, possibly empty.
+            parse_failures: How many of the verses came back unparseable.
+            error: The error the call raised, if any.
+        """
+        now = self._clock()
+        latency = now - started
+        prompt_tokens = call_stats.get('prompt_tokens') or 0
+        output_tokens = call_stats.get('output_tokens') or 0
+        record = {
+            'time': time.time(),
+            'source': current_source.get(),
+            'verses': verses,
+            'latency': latency,
+            'prompt_tokens': call_stats.get('prompt_tokens'),
+            'output_tokens': call_stats.get('output_tokens'),
+            'retries': call_stats.get('retries', 0),
+            'rate_limit_wait': call_stats.get('rate_limit_wait', 0.0),
+            'api_key': call_stats.get('api_key'),
+            'parse_failures': parse_failures,
+            'error': None if error is None else f"{type(error).__name__}: {error}",
+        }
+        with self._lock:
+            self._in_flight -= 1
+            totals = self._totals
+            totals['calls'] += 1
+            totals['verses'] += len(verses)
+            totals['errors'] += error is not None
+            totals['parse_failures'] += parse_failures
+            totals['retries'] += record['retries']
+            totals['prompt_tokens'] += prompt_tokens
+            totals['output_tokens'] += output_tokens
+            totals['rate_limit_wait_seconds'] += record['rate_limit_wait']
+            totals['call_seconds'] += latency
+            self._latencies.append(latency)
+            self._window.append((now, prompt_tokens + output_tokens))
+            if self._call_log is not None:
+                self._call_log.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def record_cache_hits(self, count: int = 1):
+        """Counts verses answered from the response cache."""
+        with self._lock:
+            self._totals['cache_hits'] += count
+
+    def watch_writer(self, name: str, writer):
+        """Includes a ResultWriter's queue depth and write time in the aggregates."""
+        with self._lock:
+            self._writers[name] = writer
+
+    def snapshot(self) -> dict:
+        """Returns the current aggregates."""
+        with self._lock:
+            now = self._clock()
+            while self._window and now - self._window[0][0] >= 60:
+                self._window.popleft()
+            snapshot = dict(self._totals)
+            snapshot['in_flight'] = self._in_flight
+            latencies = list(self._latencies)
+            window = list(self._window)
+            writers = list(self._writers.values())
+
+        elapsed = now - self._started
+        snapshot['elapsed_seconds'] = elapsed
+        snapshot['write_seconds'] = sum(writer.write_seconds for writer in writers)
+        snapshot['rows_written'] = sum(writer.rows_written for writer in writers)
+        snapshot['writer_queue_rows'] = sum(writer.queue_depth for writer in writers)
+        finished = snapshot['verses'] + snapshot['cache_hits']
+        snapshot['verses_per_second'] = finished / elapsed if elapsed > 0 else 0.0
+        snapshot['error_rate'] = snapshot['errors'] / snapshot['calls'] if snapshot['calls'] else 0.0
+        snapshot['requests_per_minute'] = len(window)
+        snapshot['tokens_per_minute'] = sum(tokens for _, tokens in window)
+        snapshot['rate_limit_wait_fraction'] = (
+            snapshot['rate_limit_wait_seconds'] / snapshot['call_seconds'] if snapshot['call_seconds'] else 0.0
+        )
+        snapshot['writer_busy_fraction'] = snapshot['write_seconds'] / elapsed if elapsed > 0 else 0.0
+        if latencies:
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            snapshot['latency_seconds'] = {'p50': float(p50), 'p95': float(p95), 'p99': float(p99)}
+        else:
+            snapshot['latency_seconds'] = {'p50': None, 'p95': None, 'p99': None}
+        return snapshot
+
+    def prometheus_text(self) -> str:
+        """Returns the aggregates in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        for name, kind, help_text in _PROMETHEUS_METRICS:
+            metric = f"{_PREFIX}_{name}" + ('_total' if kind == 'counter' else '')
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}", f"{metric} {snapshot[name]}"]
+        metric = f"{_PREFIX}_call_latency_seconds"
+        lines += [f"# HELP {metric} Latency of recent API calls.", f"# TYPE {metric} summary"]
+        for quantile, key in (('0.5', 'p50'), ('0.95', 'p95'), ('0.99', 'p99')):
+            value = snapshot['latency_seconds'][key]
+            lines.append(f'{metric}{{quantile="{quantile}"}} {"NaN" if value is None else value}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str, fmt: str = 'json'):
+        """
+        Writes the aggregates to `path`, replacing it atomically.
+
+        Args:
+            fmt: One of METRICS_FORMATS.
+        """
+        if fmt not in METRICS_FORMATS:
+            raise ValueError(f"Unknown metrics format: {fmt}")
+        text = self.prometheus_text() if fmt == 'prometheus' else json.dumps(self.snapshot(), indent=2)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(temporary_path, path)
+
+    def start_export(self, path: str, fmt: str = 'prometheus', interval: float = 5.0):
+        """Rewrites the aggregates to `path` every `interval` seconds until close()."""
+        def export():
+            while not self._export_stop.wait(interval):
+                self.write(path, fmt)
+                self._flush_call_log()
+            self.write(path, fmt)
+
+        self._export_thread = threading.Thread(target=export, name="metrics-export", daemon=True)
+        self._export_thread.start()
+
+    def _flush_call_log(self):
+        with self._lock:
+            if self._call_log is not None:
+                self._call_log.flush()
+
+    def close(self):
+        """Stops the export, writing the aggregates one last time, and closes the call log."""
+        if self._export_thread is not None:
+            self._export_stop.set()
+            self._export_thread.join()
+            self._export_thread = None
+        with self._lock:
+            if self._call_log is not None:
+                self._call_log.close()
+                self._call_log = None
+
+_metrics = None
+
+def get_metrics() -> MetricsRecorder | None:
+    """Returns the process-wide metrics recorder, or None if metrics are disabled."""
+    return _metrics
+
+def configure_metrics(enabled: bool = True, **kwargs) -> MetricsRecorder | None:
+    """
+    Replaces the process-wide metrics recorder.
+
+    Args:
+        enabled: Whether to record metrics at all.
+        **kwargs: Passed through to MetricsRecorder.
+
+    Returns:
+        The new recorder, or None if metrics are disabled.
+    """
+    global _metrics
+    if _metrics is not None:
+        _metrics.close()
+    _metrics = MetricsRecorder(**kwargs) if enabled else None
+    return _metrics
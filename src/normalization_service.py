@@ -1,12 +1,24 @@
 import google.generativeai as genai
 import os
 import json
-from src.utils import retry_with_exponential_backoff
+import logging
+from src.utils import AdaptiveRateLimiter, call_with_rate_limiter, async_call_with_rate_limiter, get_rate_limiter
+from src.response_cache import ResponseCache, get_response_cache
+from src.metrics import MetricsRecorder, get_metrics
+from src.key_pool import KeyPool, get_key_pool
+from src.structured_output import PROPOSITIONS_SCHEMA, generation_config, keyed_propositions_schema, parse_propositions, parse_keyed_propositions
+
+MODEL_NAME = "gemini-2.0-flash"
+
+# Rough allowance for the model's answer, reserved against the tokens-per-minute quota
+ESTIMATED_OUTPUT_TOKENS = 256
+
+logger = logging.getLogger(__name__)
 
 def configure_api_key():
     """
     Configures the Google Generative AI API key from an environment variable.
-    
+
     Raises:
         ValueError: If the GOOGLE_API_KEY environment variable is not set.
     """
@@ -15,44 +27,335 @@ def configure_api_key():
         raise ValueError("GOOGLE_API_KEY environment variable not set.")
     genai.configure(api_key=api_key)
 
-@retry_with_exponential_backoff()
-def normalize_text(book_name: str, chapter: int, verse: int, verse_text: str, prompt_path: str) -> list[str]:
+def estimate_tokens(prompt: str) -> int:
+    """Estimates the tokens a request uses, at about four characters per token."""
+    return len(prompt) // 4 + ESTIMATED_OUTPUT_TOKENS
+
+def _clean_response_text(response_text: str) -> str:
+    """Strips the markdown JSON fences the model sometimes wraps its answer in."""
+    return response_text.strip().replace('```json', '').replace('```', '').strip()
+
+def verse_key(book_name: str, chapter: int, verse: int) -> str:
+    """Returns the reference a verse is keyed by in batched prompts, e.g. 'GEN 1:1'."""
+    return f"{book_name} {chapter}:{verse}"
+
+def build_batches(verses: list[dict], token_budget: int) -> list[list[dict]]:
     """
-    Normalizes a verse of text using a generative AI model.
+    Packs verses into batches whose estimated size fits a token budget.
+
+    Each verse is costed at its text length plus an allowance for its
+    answer. A verse whose key already occurs in the current batch starts a
+    new batch, so keys stay unique within a request.
 
     Args:
-        verse_text: The text of the verse to normalize.
-        prompt_path: The path to the file containing the prompt template.
+        verses: Dicts with 'book_name', 'chapter', 'verse' and 'text' keys.
+        token_budget: The estimated number of tokens a batch may use,
+            excluding the fixed instruction block.
+
+    Returns:
+        A list of batches, each a non-empty list of verses.
+    """
+    batches = []
+    batch, batch_keys, batch_tokens = [], set(), 0
+    for row in verses:
+        key = verse_key(row['book_name'], row['chapter'], row['verse'])
+        # Missing texts are read by pandas as NaN
+        cost = len(row['text'] if isinstance(row['text'], str) else '') // 4 + ESTIMATED_OUTPUT_TOKENS
+        if batch and (batch_tokens + cost > token_budget or key in batch_keys):
+            batches.append(batch)
+            batch, batch_keys, batch_tokens = [], set(), 0
+        batch.append(row)
+        batch_keys.add(key)
+        batch_tokens += cost
+    if batch:
+        batches.append(batch)
+    return batches
+
+def _parse_batch_response(response_text: str, keys: list[str]) -> dict[str, list[str]]:
+    """
+    Parses a keyed JSON object returned for a batch.
+
+    Only entries for requested keys whose value is a non-empty list of
+    strings are kept; anything missing or malformed is left out so that the
+    caller can re-send it.
+    """
+    return parse_keyed_propositions(response_text, keys)
+
+class NormalizationService:
+    """
+    A long-lived client for normalizing verses with a generative AI model.
+
+    All per-process setup happens once in the constructor: the API key is
+    configured, the prompt templates are read and the model is built. With a
+    key pool, calls are spread over the pool's keys instead. The
+    normalization methods themselves do no file or console I/O apart from
+    the response cache, so they can be called from many coroutines or
+    threads at a time.
+    """
+
+    def __init__(
+        self,
+        prompt_path: str,
+        batch_prompt_path: str | None = None,
+        model_name: str = MODEL_NAME,
+        cache: ResponseCache | None = None,
+        rate_limiter: AdaptiveRateLimiter | None = None,
+        metrics: MetricsRecorder | None = None,
+        structured_output: bool = True,
+        key_pool: KeyPool | None = None,
+    ):
+        """
+        Args:
+            prompt_path: The path to the single-verse prompt template, which
+                takes a `verse_text` placeholder.
+            batch_prompt_path: The path to the batch prompt template, which
+                takes a `verses_json` placeholder. Required for batched calls.
+            model_name: The name of the generative model.
+            cache: The response cache. Defaults to the process-wide cache.
+            rate_limiter: The rate limiter. Defaults to the process-wide limiter.
+            metrics: The metrics recorder. Defaults to the process-wide recorder.
+            structured_output: Whether to ask the model for JSON that follows
+                a response schema. Answers are parsed leniently either way.
+            key_pool: The API keys to spread calls over, each with its own
+                rate limiter. Defaults to the process-wide pool; without one,
+                calls go through GOOGLE_API_KEY and `rate_limiter`.
+
+        Raises:
+            ValueError: If there is no key pool and the GOOGLE_API_KEY
+                environment variable is not set.
+            FileNotFoundError: If a prompt file does not exist.
+        """
+        self.key_pool = key_pool if key_pool is not None else get_key_pool()
+        if self.key_pool is None:
+            configure_api_key()
+
+        with open(prompt_path, 'r') as f:
+            self.prompt_template = f.read()
+        self.batch_prompt_template = None
+        if batch_prompt_path is not None:
+            with open(batch_prompt_path, 'r') as f:
+                self.batch_prompt_template = f.read()
+
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name=model_name) if self.key_pool is None else None
+        self.cache = cache if cache is not None else get_response_cache()
+        self.rate_limiter = rate_limiter if rate_limiter is not None else get_rate_limiter()
+        self.metrics = metrics if metrics is not None else get_metrics()
+        self.structured_output = structured_output
+
+        self._cache_key = ResponseCache.key_function(model_name, self.prompt_template)
+        if self.batch_prompt_template is not None:
+            self._batch_cache_key = ResponseCache.key_function(model_name, self.batch_prompt_template)
+
+    def _cached(self, key: str) -> list[str] | None:
+        cached = self.cache.get(key) if self.cache is not None else None
+        if cached is not None and self.metrics is not None:
+            self.metrics.record_cache_hits()
+        return cached
+
+    def _call_started(self) -> float | None:
+        return self.metrics.call_started() if self.metrics is not None else None
+
+    def _record_call(self, started: float | None, keys: list[str], call_stats: dict, parse_failures: int = 0, error: Exception | None = None):
+        if self.metrics is not None:
+            self.metrics.record_call(started, keys, call_stats, parse_failures=parse_failures, error=error)
+
+    def _store(self, key: str, propositions: list[str]):
+        if self.cache is not None and propositions:
+            self.cache.put(key, propositions)
+
+    def _generation_kwargs(self, schema: dict) -> dict:
+        return {'generation_config': generation_config(schema)} if self.structured_output else {}
+
+    def _generate(self, prompt: str, estimated_tokens: int, call_stats: dict, schema: dict):
+        if self.key_pool is not None:
+            return self.key_pool.call(
+                self.model_name, 'generate_content', prompt,
+                estimated_tokens=estimated_tokens, call_stats=call_stats, **self._generation_kwargs(schema)
+            )
+        return call_with_rate_limiter(
+            self.model.generate_content, prompt,
+            estimated_tokens=estimated_tokens, limiter=self.rate_limiter, call_stats=call_stats,
+            **self._generation_kwargs(schema)
+        )
+
+    async def _generate_async(self, prompt: str, estimated_tokens: int, call_stats: dict, schema: dict):
+        if self.key_pool is not None:
+            return await self.key_pool.call_async(
+                self.model_name, 'generate_content_async', prompt,
+                estimated_tokens=estimated_tokens, call_stats=call_stats, **self._generation_kwargs(schema)
+            )
+        return await async_call_with_rate_limiter(
+            self.model.generate_content_async, prompt,
+            estimated_tokens=estimated_tokens, limiter=self.rate_limiter, call_stats=call_stats,
+            **self._generation_kwargs(schema)
+        )
+
+    def _parse(self, response, verse_text: str) -> list[str]:
+        try:
+            propositions = parse_propositions(response.text)
+        except ValueError as e:
+            # The response was blocked or empty
+            logger.debug(f"Could not read the response for '{verse_text}': {e}")
+            return []
+        if propositions is None:
+            logger.debug(f"Could not parse the response for '{verse_text}'")
+            return []
+        return propositions
+
+    def normalize(self, book_name: str, chapter: int, verse: int, verse_text: str) -> list[str]:
+        """
+        Normalizes a verse of text.
+
+        Args:
+            verse_text: The text of the verse to normalize.
+
+        Returns:
+            A list of strings, where each string is a decomposed proposition.
+            Returns an empty list if the response cannot be parsed.
+        """
+        cache_key = self._cache_key(verse_text)
+        cached = self._cached(cache_key)
+        if cached is not None:
+            return cached
+
+        final_prompt = self.prompt_template.format(verse_text=verse_text)
+        keys = [verse_key(book_name, chapter, verse)]
+        call_stats = {}
+        started = self._call_started()
+        try:
+            response = self._generate(final_prompt, estimate_tokens(final_prompt), call_stats, PROPOSITIONS_SCHEMA)
+        except Exception as e:
+            self._record_call(started, keys, call_stats, error=e)
+            raise
+
+        propositions = self._parse(response, verse_text)
+        self._record_call(started, keys, call_stats, parse_failures=0 if propositions else 1)
+        self._store(cache_key, propositions)
+        return propositions
+
+    async def normalize_async(self, book_name: str, chapter: int, verse: int, verse_text: str) -> list[str]:
+        """
+        Asynchronous version of normalize.
+
+        Uses the SDK's generate_content_async, so many verses can be in flight
+        on a single event loop without one thread per request.
+        """
+        cache_key = self._cache_key(verse_text)
+        cached = self._cached(cache_key)
+        if cached is not None:
+            return cached
+
+        final_prompt = self.prompt_template.format(verse_text=verse_text)
+        keys = [verse_key(book_name, chapter, verse)]
+        call_stats = {}
+        started = self._call_started()
+        try:
+            response = await self._generate_async(final_prompt, estimate_tokens(final_prompt), call_stats, PROPOSITIONS_SCHEMA)
+        except Exception as e:
+            self._record_call(started, keys, call_stats, error=e)
+            raise
+
+        propositions = self._parse(response, verse_text)
+        self._record_call(started, keys, call_stats, parse_failures=0 if propositions else 1)
+        self._store(cache_key, propositions)
+        return propositions
+
+    async def normalize_batch_async(self, verses: list[dict]) -> dict[str, list[str]]:
+        """
+        Normalizes several verses with a single request.
+
+        Verses already in the response cache are answered from it and left
+        out of the request.
+
+        Args:
+            verses: Dicts with 'book_name', 'chapter', 'verse' and 'text' keys.
+
+        Returns:
+            A dict mapping verse_key() to the propositions of each verse that
+            came back well-formed. Missing or malformed verses are absent.
+        """
+        results = {}
+        keyed_verses = {}
+        cache_keys = {}
+        for row in verses:
+            key = verse_key(row['book_name'], row['chapter'], row['verse'])
+            cache_keys[key] = self._batch_cache_key(row['text'])
+            cached = self._cached(cache_keys[key])
+            if cached is not None:
+                results[key] = cached
+            else:
+                keyed_verses[key] = row['text']
+        if not keyed_verses:
+            return results
+
+        final_prompt = self.batch_prompt_template.format(verses_json=json.dumps(keyed_verses, ensure_ascii=False))
+        call_stats = {}
+        started = self._call_started()
+        try:
+            response = await self._generate_async(
+                final_prompt, len(final_prompt) // 4 + ESTIMATED_OUTPUT_TOKENS * len(keyed_verses), call_stats,
+                keyed_propositions_schema(list(keyed_verses))
+            )
+        except Exception as e:
+            self._record_call(started, list(keyed_verses), call_stats, error=e)
+            raise
+
+        try:
+            response_text = response.text
+        except ValueError:
+            # The response was blocked or empty; every verse is re-sent.
+            self._record_call(started, list(keyed_verses), call_stats, parse_failures=len(keyed_verses))
+            return results
+        fresh = _parse_batch_response(response_text, list(keyed_verses))
+        self._record_call(started, list(keyed_verses), call_stats, parse_failures=len(keyed_verses) - len(fresh))
+        for key, propositions in fresh.items():
+            self._store(cache_keys[key], propositions)
+        results.update(fresh)
+        return results
+
+    async def normalize_batched_async(self, verses: list[dict]) -> dict[str, list[str]]:
+        """
+        Normalizes one batch of verses, re-sending only what failed.
+
+        Verses that come back missing or malformed are split into two smaller
+        batches and re-sent; a single leftover verse falls back to the
+        single-verse prompt.
+
+        Returns:
+            A dict mapping verse_key() to propositions for every verse in the
+            batch. Verses that could not be normalized map to an empty list.
+        """
+        if len(verses) == 1:
+            row = verses[0]
+            propositions = await self.normalize_async(row['book_name'], row['chapter'], row['verse'], row['text'])
+            return {verse_key(row['book_name'], row['chapter'], row['verse']): propositions}
+
+        results = await self.normalize_batch_async(verses)
+        missing = [row for row in verses if verse_key(row['book_name'], row['chapter'], row['verse']) not in results]
+        if missing:
+            middle = (len(missing) + 1) // 2
+            for half in (missing[:middle], missing[middle:]):
+                if half:
+                    results.update(await self.normalize_batched_async(half))
+        return results
+
+def normalize_text(book_name: str, chapter: int, verse: int, verse_text: str, prompt_path: str) -> list[str]:
+    """
+    Normalizes a single verse with a one-off NormalizationService.
+
+    Convenient for ad-hoc use; anything normalizing many verses should keep
+    one NormalizationService instead.
 
     Returns:
         A list of strings, where each string is a decomposed proposition.
         Returns an empty list if an error occurs.
     """
     try:
-        configure_api_key()
-        
-        with open(prompt_path, 'r') as f:
-            prompt_template = f.read()
-            
-        model = genai.GenerativeModel(model_name="gemini-2.0-flash")
-        
-        final_prompt = prompt_template.format(verse_text=verse_text)
-        
-        response = model.generate_content(final_prompt)
-        
-        # The response text might be enclosed in markdown backticks for JSON
-        cleaned_response_text = response.text.strip().replace('```json', '').replace('```', '').strip()
-        print(f"Cleaned response text: {cleaned_response_text}")
-
-        propositions = json.loads(cleaned_response_text)
-        print(f"Propositions after json.loads: {propositions}")
-        print(verse_text)
-        print(propositions)
-        return propositions
+        return NormalizationService(prompt_path).normalize(book_name, chapter, verse, verse_text)
     except FileNotFoundError:
-        print(f"Error: Prompt file not found at {prompt_path}")
+        logger.error(f"Prompt file not found at {prompt_path}")
         return []
     except ValueError as e:
-        print(f"Configuration Error: {e}")
+        logger.error(f"Configuration Error: {e}")
         return []
-
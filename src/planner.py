@@ -0,0 +1,153 @@
+import importlib
+import json
+import math
+from src.normalization_service import MODEL_NAME, ESTIMATED_OUTPUT_TOKENS, build_batches, configure_api_key, verse_key
+
+TOKENIZERS = ('chars', 'api')
+
+# Most output tokens the model returns for one request
+MAX_OUTPUT_TOKENS = 8192
+
+# Share of the best achievable throughput the recommended batch size must reach
+BATCH_EFFICIENCY = 0.95
+
+# Extra concurrency on top of Little's law, to absorb latency spikes
+CONCURRENCY_HEADROOM = 1.25
+
+def chars_tokenizer(text: str) -> int:
+    """Counts tokens locally at about four characters per token."""
+    return len(text) // 4
+
+def api_tokenizer(model_name: str = MODEL_NAME):
+    """
+    Returns a tokenizer that asks the API for exact counts.
+
+    Raises:
+        ValueError: If the GOOGLE_API_KEY environment variable is not set.
+    """
+    import google.generativeai as genai
+    configure_api_key()
+    model = genai.GenerativeModel(model_name=model_name)
+    return lambda text: model.count_tokens(text).total_tokens
+
+def load_tokenizer(spec: str):
+    """
+    Returns the tokenizer named by `spec`.
+
+    Args:
+        spec: 'chars', 'api', or 'module:function' for any callable that
+            takes a string and returns its token count.
+
+    Raises:
+        ValueError: If the spec names no tokenizer.
+    """
+    if spec == 'chars':
+        return chars_tokenizer
+    if spec == 'api':
+        return api_tokenizer()
+    module_name, sep, function_name = spec.partition(':')
+    if not sep:
+        raise ValueError(f"Unknown tokenizer '{spec}'; expected one of {TOKENIZERS} or module:function.")
+    return getattr(importlib.import_module(module_name), function_name)
+
+def plan_source(rows: list[dict], prompt_template: str, batch_prompt_template: str | None, batch_tokens: int, count_tokens, output_tokens_per_verse: float) -> dict:
+    """
+    Renders the prompts a source's pending verses would be sent with and counts their tokens.
+
+    Args:
+        rows: The pending verses, dicts with 'book_name', 'chapter', 'verse' and 'text' keys.
+        prompt_template: The single-verse prompt template.
+        batch_prompt_template: The batch prompt template, used when batch_tokens is positive.
+        batch_tokens: The batch size of the run, as in build_batches(); 0 for single verses.
+        count_tokens: The tokenizer.
+        output_tokens_per_verse: The expected answer size of a verse.
+
+    Returns:
+        The number of verses and requests and the input and output tokens,
+        plus per-verse averages the recommendations are based on.
+    """
+    if batch_tokens > 0:
+        prompts = [
+            batch_prompt_template.format(verses_json=json.dumps(
+                {verse_key(row['book_name'], row['chapter'], row['verse']): row['text'] for row in batch},
+                ensure_ascii=False,
+            ))
+            for batch in build_batches(rows, batch_tokens)
+        ]
+    else:
+        prompts = [prompt_template.format(verse_text=row['text']) for row in rows]
+    text_tokens = sum(count_tokens(str(row['text'])) for row in rows)
+    return {
+        'verses': len(rows),
+        'requests': len(prompts),
+        'input_tokens': sum(count_tokens(prompt) for prompt in prompts),
+        'output_tokens': round(output_tokens_per_verse * len(rows)),
+        'text_tokens': text_tokens,
+        'batch_cost': sum(len(str(row['text'])) // 4 + ESTIMATED_OUTPUT_TOKENS for row in rows),
+    }
+
+def observed_output_tokens(normalizations, count_tokens) -> float:
+    """
+    Returns the mean size of the answers already received, in tokens.
+
+    Falls back to ESTIMATED_OUTPUT_TOKENS if there are none.
+    """
+    sizes = [count_tokens(json.dumps(value, ensure_ascii=False)) for value in normalizations if value]
+    return sum(sizes) / len(sizes) if sizes else ESTIMATED_OUTPUT_TOKENS
+
+def _verses_per_minute(verses_per_request: int, overhead: float, tokens_per_verse: float, rpm: float, tpm: float) -> float:
+    return min(rpm * verses_per_request, tpm * verses_per_request / (overhead + verses_per_request * tokens_per_verse))
+
+def plan_run(sources: dict[str, dict], prompt_overhead: float, batch_overhead: float | None, rpm: float, tpm: float, rpd: float | None, latency: float) -> dict:
+    """
+    Turns per-source plans into a schedule under the API quotas.
+
+    The minimum wall-clock time is bounded by whichever quota runs out
+    first. The recommended batch size is the smallest that gets within
+    BATCH_EFFICIENCY of the best throughput the quotas allow, and the
+    recommended concurrency keeps that request rate in flight at the given
+    latency (Little's law).
+
+    Args:
+        sources: plan_source() results by source name.
+        prompt_overhead: Tokens of the single-verse prompt without the verse.
+        batch_overhead: Tokens of the batch prompt without the verses, if batching is available.
+        rpm, tpm, rpd: The requests-per-minute, tokens-per-minute and requests-per-day quotas.
+        latency: The expected seconds per request.
+    """
+    totals = {key: sum(plan[key] for plan in sources.values()) for key in ('verses', 'requests', 'input_tokens', 'output_tokens')}
+    total_tokens = totals['input_tokens'] + totals['output_tokens']
+    request_minutes = totals['requests'] / rpm
+    token_minutes = total_tokens / tpm
+    plan = {
+        'sources': sources,
+        'totals': {**totals, 'tokens': total_tokens},
+        'minimum_wall_seconds': 60 * max(request_minutes, token_minutes),
+        'bound_by': 'requests_per_minute' if request_minutes >= token_minutes else 'tokens_per_minute',
+        'days': totals['requests'] / rpd if rpd else None,
+    }
+
+    verses = totals['verses']
+    if not verses:
+        plan['recommended_batch_tokens'] = 0
+        plan['recommended_concurrency'] = 1
+        return plan
+    text_tokens = sum(source['text_tokens'] for source in sources.values()) / verses
+    output_tokens = totals['output_tokens'] / verses
+    tokens_per_verse = text_tokens + output_tokens
+    best_size, best_rate = 1, _verses_per_minute(1, prompt_overhead, tokens_per_verse, rpm, tpm)
+    if batch_overhead is not None and output_tokens > 0:
+        largest = max(1, int(MAX_OUTPUT_TOKENS // output_tokens))
+        rates = {size: _verses_per_minute(size, batch_overhead, tokens_per_verse, rpm, tpm) for size in range(2, largest + 1)}
+        if rates and max(rates.values()) > best_rate:
+            target = BATCH_EFFICIENCY * max(rates.values())
+            best_size = min(size for size, rate in rates.items() if rate >= target)
+            best_rate = rates[best_size]
+    batch_cost = sum(source['batch_cost'] for source in sources.values()) / verses
+    plan['recommended_batch_tokens'] = 0 if best_size == 1 else math.ceil(best_size * batch_cost)
+    plan['recommended_verses_per_request'] = best_size
+    plan['recommended_wall_seconds'] = 60 * verses / best_rate
+    plan['recommended_concurrency'] = max(1, math.ceil(best_rate / best_size / 60 * latency * CONCURRENCY_HEADROOM))
+    if rpd:
+        plan['recommended_days'] = verses / best_size / rpd
+    return plan
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+class ResponseCache:
+    """
+    A persistent, content-addressed cache of normalization results.
+
+    Entries are keyed by a hash of the model name, the prompt template and
+    the verse text, so identical requests are answered locally no matter
+    which corpus or run they come from. The cache lives in a SQLite database
+    in WAL mode, which lets several threads and processes share it, and is
+    kept below `max_entries` by evicting the least recently used entries.
+    """
+
+    def __init__(self, path: str, max_entries: int = 500_000, evict_every: int = 100):
+        """
+        Args:
+            path: The path to the SQLite database file. Parent directories are created.
+            max_entries: The number of entries the cache is trimmed back to.
+            evict_every: How many insertions happen between eviction passes.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    @staticmethod
+    def make_key(model_name: str, prompt_template: str, verse_text: str) -> str:
+        """Returns the content hash an entry is stored under."""
+        return ResponseCache.key_function(model_name, prompt_template)(verse_text)
+
+    @staticmethod
+    def key_function(model_name: str, prompt_template: str):
+        """
+        Returns a function mapping verse text to its key for a fixed model and template.
+
+        The model name and template are hashed once, so each key only costs
+        hashing the verse text.
+        """
+        prefix = hashlib.sha256()
+        for part in (model_name, prompt_template):
+            prefix.update(part.encode('utf-8'))
+            prefix.update(b'\0')
+
+        def make_key(verse_text: str) -> str:
+            digest = prefix.copy()
+            digest.update(verse_text.encode('utf-8'))
+            digest.update(b'\0')
+            return digest.hexdigest()
+        return make_key
+
+    def get(self, key: str) -> list[str] | None:
+        """
+        Looks up an entry and marks it as recently used.
+
+        Returns:
+            The cached propositions, or None on a miss.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key: str, propositions: list[str]):
+        """Stores an entry, evicting the least recently used ones every `evict_every` insertions."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, last_used) VALUES (?, ?, ?)",
+                (key, json.dumps(propositions, ensure_ascii=False), time.time()),
+            )
+            self._puts += 1
+            if self._puts % self.evict_every == 0:
+                self._evict()
+
+    def _evict(self):
+        self._conn.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self) -> dict:
+        """Returns the hit and miss counters of this process."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        """Trims the cache to `max_entries` and closes the database."""
+        with self._lock:
+            self._evict()
+            self._conn.close()
+
+_response_cache = None
+
+def get_response_cache() -> ResponseCache | None:
+    """Returns the process-wide response cache, or None if caching is disabled."""
+    return _response_cache
+
+def configure_response_cache(path: str | None, **kwargs) -> ResponseCache | None:
+    """
+    Replaces the process-wide response cache.
+
+    Args:
+        path: The path to the cache database, or None to disable caching.
+        **kwargs: Passed through to ResponseCache.
+
+    Returns:
+        The new cache, or None if caching is disabled.
+    """
+    global _response_cache
+    if _response_cache is not None:
+        _response_cache.close()
+    _response_cache = ResponseCache(path, **kwargs) if path else None
+    return _response_cache
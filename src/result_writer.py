@@ -0,0 +1,389 @@
+import csv
+import glob
+import json
+import os
+import queue
+import threading
+import time
+import pandas as pd
+
+# Columns of the normalized outputs, with their Arrow type names
+OUTPUT_SCHEMA = [
+    ('book_name', 'string'),
+    ('chapter', 'int32'),
+    ('verse', 'int32'),
+    ('text', 'string'),
+    ('normalization', 'list<string>'),
+]
+OUTPUT_COLUMNS = [name for name, _ in OUTPUT_SCHEMA]
+
+# Durability policies, from fastest to safest
+DURABILITY_NONE = 'none'    # leave data in Python's buffers until the file is closed
+DURABILITY_FLUSH = 'flush'  # hand every batch to the OS; survives a killed process
+DURABILITY_FSYNC = 'fsync'  # force every batch to disk; survives a power loss
+DURABILITY_POLICIES = (DURABILITY_NONE, DURABILITY_FLUSH, DURABILITY_FSYNC)
+
+OUTPUT_FORMATS = ('csv', 'jsonl', 'parquet')
+
+def output_path(output_dir: str, source_name: str, output_format: str) -> str:
+    """Returns where the normalized results of a source are written, e.g. output/masoretic_normalised.csv."""
+    return os.path.join(output_dir, f"{source_name}_normalised.{output_format}")
+
+class _TextSink:
+    """
+    Shared durability handling of the line-oriented sinks.
+
+    With DURABILITY_NONE, rows sit in Python's buffers until the file is
+    closed, so they are only reported as committed then.
+    """
+
+    def __init__(self, durability: str):
+        self.durability = durability
+        self._pending = []
+
+    def _committed(self, rows: list[dict]) -> list[dict]:
+        if self.durability == DURABILITY_NONE:
+            self._pending.extend(rows)
+            return []
+        self._file.flush()
+        if self.durability == DURABILITY_FSYNC:
+            os.fsync(self._file.fileno())
+        return rows
+
+class CsvSink(_TextSink):
+    """Appends rows to a CSV file, with list columns such as the normalization stored as JSON strings."""
+
+    def __init__(self, path: str, durability: str = DURABILITY_FLUSH, schema: list[tuple[str, str]] = OUTPUT_SCHEMA):
+        super().__init__(durability)
+        self.columns = [name for name, _ in schema]
+        self._json_columns = {name for name, type_name in schema if type_name.startswith('list<')}
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'a', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        if is_new:
+            self._writer.writerow(self.columns)
+
+    def write(self, rows: list[dict]) -> list[dict]:
+        """Writes rows and returns those that are now committed."""
+        self._writer.writerows(
+            [json.dumps(row[column]) if column in self._json_columns else row[column] for column in self.columns]
+            for row in rows
+        )
+        return self._committed(rows)
+
+    def close(self) -> list[dict]:
+        self._file.close()
+        committed, self._pending = self._pending, []
+        return committed
+
+class JsonlSink(_TextSink):
+    """Appends rows to a JSON Lines file, one typed object per row."""
+
+    def __init__(self, path: str, durability: str = DURABILITY_FLUSH, schema: list[tuple[str, str]] = OUTPUT_SCHEMA):
+        super().__init__(durability)
+        self.columns = [name for name, _ in schema]
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def write(self, rows: list[dict]) -> list[dict]:
+        """Writes rows and returns those that are now committed."""
+        self._file.writelines(
+            json.dumps({column: row[column] for column in self.columns}, ensure_ascii=False) + '\n'
+            for row in rows
+        )
+        return self._committed(rows)
+
+    def close(self) -> list[dict]:
+        self._file.close()
+        committed, self._pending = self._pending, []
+        return committed
+
+class ParquetSink:
+    """
+    Writes rows to a directory of Parquet part files, one row group per batch.
+
+    A part file only becomes readable once its footer is written, so rows
+    are reported as committed when their part file is closed: after
+    `row_groups_per_file` batches, or when the sink is closed. Parts are
+    written under a temporary name and renamed when complete; leftovers of a
+    killed run are removed by remove_incomplete_parts().
+    """
+
+    def __init__(
+        self,
+        path: str,
+        durability: str = DURABILITY_FLUSH,
+        row_groups_per_file: int = 16,
+        schema: list[tuple[str, str]] = OUTPUT_SCHEMA,
+    ):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet output requires pyarrow: pip install pyarrow") from e
+        self._pa = pa
+        self._pq = pq
+        self.schema = pa.schema([(name, _arrow_type(pa, type_name)) for name, type_name in schema])
+        self.columns = [name for name, _ in schema]
+        self.path = path
+        self.durability = durability
+        self.row_groups_per_file = row_groups_per_file
+        os.makedirs(path, exist_ok=True)
+        remove_incomplete_parts(path)
+        self._part = len(glob.glob(os.path.join(path, 'part-*.parquet')))
+        self._writer = None
+        self._pending = []
+        self._row_groups = 0
+
+    def _open_part(self):
+        self._part_path = os.path.join(self.path, f"part-{self._part:05d}.parquet")
+        self._writer = self._pq.ParquetWriter(self._part_path + '.tmp', self.schema)
+        self._row_groups = 0
+
+    def _close_part(self) -> list[dict]:
+        self._writer.close()
+        if self.durability == DURABILITY_FSYNC:
+            with open(self._part_path + '.tmp', 'rb') as f:
+                os.fsync(f.fileno())
+        os.replace(self._part_path + '.tmp', self._part_path)
+        self._writer = None
+        self._part += 1
+        committed, self._pending = self._pending, []
+        return committed
+
+    def write(self, rows: list[dict]) -> list[dict]:
+        """Writes rows as one row group and returns the rows that are now committed."""
+        if self._writer is None:
+            self._open_part()
+        table = self._pa.Table.from_pylist(
+            [{column: row[column] for column in self.columns} for row in rows], schema=self.schema
+        )
+        self._writer.write_table(table)
+        self._pending.extend(rows)
+        self._row_groups += 1
+        if self._row_groups >= self.row_groups_per_file:
+            return self._close_part()
+        return []
+
+    def close(self) -> list[dict]:
+        if self._writer is None:
+            return []
+        return self._close_part()
+
+def _arrow_type(pa, type_name: str):
+    """Resolves an Arrow type name such as 'int32' or 'list<string>'."""
+    if type_name.startswith('list<') and type_name.endswith('>'):
+        return pa.list_(_arrow_type(pa, type_name[5:-1]))
+    return pa.type_for_alias(type_name)
+
+def remove_incomplete_parts(path: str):
+    """Deletes Parquet part files that a killed run never finished."""
+    for leftover in glob.glob(os.path.join(path, 'part-*.parquet.tmp')):
+        os.remove(leftover)
+
+def open_sink(path: str, output_format: str, durability: str = DURABILITY_FLUSH, schema: list[tuple[str, str]] = OUTPUT_SCHEMA):
+    """
+    Opens the sink for an output format.
+
+    Args:
+        schema: The columns written, as (name, Arrow type name) pairs.
+
+    Raises:
+        ValueError: If the output format or durability policy is unknown.
+    """
+    if durability not in DURABILITY_POLICIES:
+        raise ValueError(f"Unknown durability policy: {durability}")
+    if output_format == 'csv':
+        return CsvSink(path, durability, schema=schema)
+    if output_format == 'jsonl':
+        return JsonlSink(path, durability, schema=schema)
+    if output_format == 'parquet':
+        return ParquetSink(path, durability, schema=schema)
+    raise ValueError(f"Unknown output format: {output_format}")
+
+def read_output(path: str, output_format: str) -> pd.DataFrame:
+    """
+    Reads a normalized output back, with each normalization as a list of strings.
+
+    Raises:
+        ValueError: If the output format is unknown.
+    """
+    if output_format == 'csv':
+        df = pd.read_csv(path)
+        df['normalization'] = df['normalization'].map(lambda value: json.loads(value) if isinstance(value, str) else [])
+        return df
+    if output_format == 'jsonl':
+        return pd.read_json(path, lines=True, dtype={'book_name': str})
+    if output_format == 'parquet':
+        df = pd.read_parquet(path)
+        df['normalization'] = df['normalization'].map(list)
+        return df
+    raise ValueError(f"Unknown output format: {output_format}")
+
+def _from_csv(value: str, type_name: str):
+    if value == '':
+        return None
+    if type_name.startswith('list<'):
+        return json.loads(value)
+    if type_name.startswith('int'):
+        return int(value)
+    if type_name == 'bool':
+        return value == 'True'
+    return value
+
+class OutputTail:
+    """
+    Reads the rows appended to an output since the previous read.
+
+    Only complete lines of CSV and JSONL files are read, so a row that is
+    still being written is picked up by a later read. Parquet part files are
+    read once they have been renamed into place.
+    """
+
+    def __init__(self, path: str, output_format: str, schema: list[tuple[str, str]] = OUTPUT_SCHEMA):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}")
+        self.path = path
+        self.output_format = output_format
+        self.types = dict(schema)
+        self._offset = 0
+        self._header = None
+        self._parts = set()
+
+    def _read_lines(self) -> list[str]:
+        if not os.path.isfile(self.path):
+            return []
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            chunk = f.read()
+        end = chunk.rfind(b'\n')
+        if end == -1:
+            return []
+        self._offset += end + 1
+        return chunk[:end + 1].decode('utf-8').splitlines()
+
+    def read_new(self) -> list[dict]:
+        """Returns the rows that became complete since the previous call."""
+        if self.output_format == 'parquet':
+            parts = sorted(set(glob.glob(os.path.join(self.path, 'part-*.parquet'))) - self._parts)
+            rows = []
+            for part in parts:
+                df = pd.read_parquet(part)
+                rows.extend(df.to_dict('records'))
+                self._parts.add(part)
+            for row in rows:
+                for column, type_name in self.types.items():
+                    if type_name.startswith('list<') and row.get(column) is not None:
+                        row[column] = list(row[column])
+            return rows
+
+        lines = self._read_lines()
+        if self.output_format == 'jsonl':
+            return [json.loads(line) for line in lines if line]
+
+        records = list(csv.reader(lines))
+        if self._header is None and records:
+            self._header = records.pop(0)
+        return [
+            {column: _from_csv(value, self.types.get(column, 'string')) for column, value in zip(self._header, record)}
+            for record in records
+        ]
+
+_STOP = object()
+
+class ResultWriter:
+    """
+    Writes normalization results from a background thread.
+
+    Producers call submit(), which only enqueues the row. The writer thread
+    collects rows and hands them to the sink in batches of `batch_size`, or
+    after `flush_interval` seconds, whichever comes first. Rows the sink
+    reports as committed are passed to `on_commit`, so that the checkpoint
+    manifest never gets ahead of the output file.
+    """
+
+    def __init__(self, sink, batch_size: int = 500, flush_interval: float = 1.0, on_commit=None):
+        """
+        Args:
+            sink: A CsvSink, JsonlSink or ParquetSink.
+            batch_size: The number of rows written at once.
+            flush_interval: The maximum number of seconds a row waits to be written.
+            on_commit: Called from the writer thread with each list of committed rows.
+        """
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_commit = on_commit
+        self.error = None
+        self.write_seconds = 0.0
+        self.rows_written = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="result-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, row: dict, propositions: list[str]):
+        """Queues one normalized verse for writing."""
+        self.submit_row({
+            'book_name': row['book_name'],
+            'chapter': int(row['chapter']),
+            'verse': int(row['verse']),
+            # Missing texts are read by pandas as NaN; write them as empty values
+            'text': row['text'] if isinstance(row['text'], str) else None,
+            'normalization': propositions,
+            'verse_hash': row.get('verse_hash'),
+        })
+
+    def submit_row(self, row: dict):
+        """Queues a row that already has every column of the sink's schema."""
+        self._queue.put(row)
+
+    @property
+    def queue_depth(self) -> int:
+        """The number of results waiting to be written."""
+        return self._queue.qsize()
+
+    def _commit(self, rows: list[dict]):
+        if rows and self.on_commit is not None:
+            self.on_commit(rows)
+        self.rows_written += len(rows)
+
+    def _write(self, buffer: list[dict]):
+        started = time.monotonic()
+        self._commit(self.sink.write(buffer))
+        self.write_seconds += time.monotonic() - started
+
+    def _run(self):
+        buffer = []
+        deadline = None
+        stopping = False
+        try:
+            while not stopping:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self._queue.get(timeout=timeout)
+                    if item is _STOP:
+                        stopping = True
+                    else:
+                        buffer.append(item)
+                        if deadline is None:
+                            deadline = time.monotonic() + self.flush_interval
+                except queue.Empty:
+                    pass
+                if buffer and (stopping or len(buffer) >= self.batch_size or time.monotonic() >= deadline):
+                    self._write(buffer)
+                    buffer = []
+                    deadline = None
+            self._commit(self.sink.close())
+        except Exception as e:
+            self.error = e
+
+    def close(self):
+        """
+        Writes everything still queued, closes the sink and stops the thread.
+
+        Raises:
+            Exception: Whatever error stopped the writer thread, if any.
+        """
+        self._queue.put(_STOP)
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,65 @@
+from collections import deque
+
+class WeightedScheduler:
+    """
+    Hands out work items from several sources in proportion to their weights.
+
+    Uses smooth weighted round-robin: a source with weight 2 is picked twice
+    as often as one with weight 1, and picks are interleaved rather than
+    bunched. Once a source runs dry, its share goes to the remaining ones,
+    so workers pulling from the scheduler never idle while work is left.
+    """
+
+    def __init__(self):
+        self._queues = {}
+        self._weights = {}
+        self._current = {}
+
+    def add_source(self, name: str, items, weight: float = 1):
+        """
+        Registers the work of a source.
+
+        Raises:
+            ValueError: If the weight is not positive.
+        """
+        if weight <= 0:
+            raise ValueError(f"The weight of {name} must be positive, got {weight}.")
+        self._queues[name] = deque(items)
+        self._weights[name] = weight
+        self._current[name] = 0.0
+
+    def next(self):
+        """
+        Returns the next (source name, item) pair, or None if all work is handed out.
+        """
+        active = [name for name, items in self._queues.items() if items]
+        if not active:
+            return None
+        total = sum(self._weights[name] for name in active)
+        for name in active:
+            self._current[name] += self._weights[name]
+        chosen = max(active, key=self._current.__getitem__)
+        self._current[chosen] -= total
+        return chosen, self._queues[chosen].popleft()
+
+    def remaining(self, name: str) -> int:
+        """Returns the number of items of a source not yet handed out."""
+        return len(self._queues[name])
+
+    def __len__(self) -> int:
+        return sum(len(items) for items in self._queues.values())
+
+def parse_weights(spec: str) -> dict[str, float]:
+    """
+    Parses source weights given as 'name=weight,name=weight'.
+
+    Raises:
+        ValueError: If an entry is not of the form name=weight.
+    """
+    weights = {}
+    for entry in filter(None, (part.strip() for part in spec.split(','))):
+        name, sep, value = entry.partition('=')
+        if not sep:
+            raise ValueError(f"Expected name=weight, got '{entry}'.")
+        weights[name.strip()] = float(value)
+    return weights
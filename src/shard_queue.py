@@ -0,0 +1,207 @@
+import glob
+import os
+import re
+import socket
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from src.checkpoint import repair_torn_tail
+from src.result_writer import remove_incomplete_parts
+
+PENDING = 'pending'
+LEASED = 'leased'
+SHARD_DONE = 'done'
+
+def default_worker_id() -> str:
+    """Returns a worker name unique across machines and processes, e.g. 'node-3-4711'."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+@dataclass(frozen=True)
+class Shard:
+    """A range of rows [start, stop) of a source file, claimed as one unit of work."""
+    source: str
+    shard_id: int
+    start: int
+    stop: int
+
+class ShardQueue:
+    """
+    A work queue of verse ranges shared by workers on several machines.
+
+    Shards live in a SQLite database on storage every worker can reach.
+    A worker claims a shard with a lease that it renews while it works; a
+    shard whose lease runs out, because its worker died or lost the storage,
+    can be claimed by the next worker that asks. Claims run in an immediate
+    transaction, so two workers never hold the same live lease.
+
+    The journal is kept in rollback mode rather than WAL, which needs shared
+    memory and so does not work across machines on network file systems.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 300.0, clock=time.time):
+        """
+        Args:
+            path: The path to the SQLite database file. Parent directories are created.
+            lease_seconds: How long a claim lasts unless it is renewed.
+            clock: A wall clock shared by the machines, injectable for tests.
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS shards ("
+            "source TEXT NOT NULL, shard_id INTEGER NOT NULL, start INTEGER NOT NULL, stop INTEGER NOT NULL, "
+            "status TEXT NOT NULL, worker TEXT, lease_expires REAL, claims INTEGER NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (source, shard_id))"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def seed(self, source: str, total_rows: int, shard_size: int) -> int:
+        """
+        Splits the rows of a source into shards of `shard_size` rows.
+
+        Seeding is idempotent, so every worker can seed on start-up; shards
+        that exist already are left as they are. The shard size is fixed by
+        the first worker to seed the queue.
+
+        Returns:
+            The number of shards of the source.
+
+        Raises:
+            ValueError: If the queue was seeded with a different shard size.
+        """
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.execute("INSERT OR IGNORE INTO settings VALUES ('shard_size', ?)", (str(shard_size),))
+                seeded = int(self._conn.execute("SELECT value FROM settings WHERE name = 'shard_size'").fetchone()[0])
+                if seeded != shard_size:
+                    raise ValueError(f"The shard queue {self.path} was seeded with --shard-size {seeded}, not {shard_size}.")
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO shards (source, shard_id, start, stop, status) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (source, shard_id, start, min(start + shard_size, total_rows), PENDING)
+                        for shard_id, start in enumerate(range(0, total_rows, shard_size))
+                    ],
+                )
+        return -(-total_rows // shard_size)
+
+    def claim(self, worker: str, sources: list[str] | None = None) -> Shard | None:
+        """
+        Leases the next pending or expired shard to a worker.
+
+        Args:
+            worker: The name of the claiming worker.
+            sources: Only claim shards of these sources, if given.
+
+        Returns:
+            The claimed shard, or None if every shard is done or leased.
+        """
+        now = self._clock()
+        query = (
+            "SELECT source, shard_id, start, stop FROM shards "
+            "WHERE (status = ? OR (status = ? AND lease_expires < ?))"
+        )
+        params = [PENDING, LEASED, now]
+        if sources is not None:
+            query += f" AND source IN ({','.join('?' * len(sources))})"
+            params.extend(sources)
+        query += " ORDER BY claims, source, shard_id LIMIT 1"
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                row = self._conn.execute(query, params).fetchone()
+                if row is None:
+                    return None
+                self._conn.execute(
+                    "UPDATE shards SET status = ?, worker = ?, lease_expires = ?, claims = claims + 1 "
+                    "WHERE source = ? AND shard_id = ?",
+                    (LEASED, worker, now + self.lease_seconds, row[0], row[1]),
+                )
+        return Shard(*row)
+
+    def _update_lease(self, shard: Shard, worker: str, status: str, lease_expires: float | None) -> bool:
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                cursor = self._conn.execute(
+                    "UPDATE shards SET status = ?, lease_expires = ? "
+                    "WHERE source = ? AND shard_id = ? AND status = ? AND worker = ?",
+                    (status, lease_expires, shard.source, shard.shard_id, LEASED, worker),
+                )
+        return cursor.rowcount == 1
+
+    def renew(self, shard: Shard, worker: str) -> bool:
+        """
+        Extends a worker's lease on a shard.
+
+        Returns:
+            False if the lease was lost, i.e. it expired and another worker claimed the shard.
+        """
+        return self._update_lease(shard, worker, LEASED, self._clock() + self.lease_seconds)
+
+    def complete(self, shard: Shard, worker: str) -> bool:
+        """
+        Marks a leased shard as done.
+
+        Returns:
+            False if the lease was lost; the new owner then completes the shard.
+        """
+        return self._update_lease(shard, worker, SHARD_DONE, None)
+
+    def release(self, shard: Shard, worker: str) -> bool:
+        """Gives a leased shard back unfinished, so another worker can claim it right away."""
+        return self._update_lease(shard, worker, PENDING, None)
+
+    def progress(self) -> dict[str, dict[str, int]]:
+        """Returns the number of shards in each status, by source. Expired leases count as pending."""
+        now = self._clock()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT source, CASE WHEN status = ? AND lease_expires < ? THEN ? ELSE status END AS state, COUNT(*) "
+                "FROM shards GROUP BY source, state",
+                (LEASED, now, PENDING),
+            ).fetchall()
+        progress = {}
+        for source, status, count in rows:
+            progress.setdefault(source, {})[status] = count
+        return progress
+
+    def close(self):
+        """Closes the database connection."""
+        with self._lock:
+            self._conn.close()
+
+def shard_output_path(shard_dir: str, shard: Shard, worker: str, output_format: str) -> str:
+    """
+    Returns where a worker writes its results for a shard, e.g.
+    output/shards/masoretic/00003.node-3-4711.csv.
+
+    Every worker that holds the shard writes its own file, so a worker that
+    loses its lease never writes into the file of the next owner.
+    """
+    safe_worker = re.sub(r'[^\w.-]', '_', worker)
+    return os.path.join(shard_dir, shard.source, f"{shard.shard_id:05d}.{safe_worker}.{output_format}")
+
+def shard_outputs(shard_dir: str, source: str, output_format: str, shard_id: int | None = None) -> list[str]:
+    """Returns the output files of a shard, or of every shard of a source, in shard order."""
+    pattern = f"{shard_id:05d}.*" if shard_id is not None else "*"
+    return sorted(glob.glob(os.path.join(shard_dir, source, f"{pattern}.{output_format}")))
+
+def repair_shard_output(path: str) -> bool:
+    """
+    Removes what a killed worker left half written in a shard output.
+
+    Returns:
+        True if anything was removed.
+    """
+    if os.path.isdir(path):
+        remove_incomplete_parts(path)
+        return False
+    return repair_torn_tail(path)
@@ -0,0 +1,173 @@
+import ast
+import json
+
+# Response schema of a single-verse answer: a JSON array of propositions
+PROPOSITIONS_SCHEMA = {'type': 'array', 'items': {'type': 'string'}}
+
+_LITERAL_CHARACTERS = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789+-.')
+
+def generation_config(schema: dict) -> dict:
+    """Returns the generation config that constrains the model's answer to `schema`."""
+    return {'response_mime_type': 'application/json', 'response_schema': schema}
+
+def keyed_propositions_schema(keys: list[str]) -> dict:
+    """Returns the response schema of a batch answer: an object with an array of propositions per key."""
+    return {
+        'type': 'object',
+        'properties': {key: PROPOSITIONS_SCHEMA for key in keys},
+        'required': list(keys),
+    }
+
+def _strip_fences(text: str) -> str:
+    return text.strip().replace('```json', '').replace('```', '').strip()
+
+def _outermost(text: str, opening: str) -> str:
+    """Cuts the text from the first `opening` bracket to its last closing bracket, if any."""
+    closing = ']' if opening == '[' else '}'
+    start = text.find(opening)
+    if start < 0:
+        return text
+    end = text.rfind(closing)
+    return text[start:end + 1] if end > start else text[start:]
+
+def _repair(text: str) -> str:
+    """
+    Fixes the defects models commonly leave in JSON, in one pass.
+
+    Missing commas between values are inserted, trailing and doubled commas
+    dropped, and raw newlines and control characters inside strings escaped.
+    A truncated answer loses its unfinished string and gets its brackets
+    closed.
+    """
+    out = []
+    stack = []
+    in_string = False
+    in_literal = False
+    escaped = False
+    value_ended = False
+    string_start = 0
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+                value_ended = True
+            elif ch < ' ':
+                out.append('\\n' if ch == '\n' else f'\\u{ord(ch):04x}')
+                continue
+            out.append(ch)
+            continue
+        if in_literal and ch not in _LITERAL_CHARACTERS:
+            in_literal = False
+            value_ended = True
+        if ch.isspace():
+            out.append(ch)
+        elif ch in '"[{' or (ch in _LITERAL_CHARACTERS and not in_literal):
+            if value_ended:
+                out.append(',')
+            value_ended = False
+            if ch == '"':
+                in_string = True
+                string_start = len(out)
+            elif ch in '[{':
+                stack.append(']' if ch == '[' else '}')
+            else:
+                in_literal = True
+            out.append(ch)
+        elif ch in ']}':
+            _drop_trailing(out, ',')
+            if stack:
+                stack.pop()
+            out.append(ch)
+            value_ended = True
+        elif ch == ',':
+            if value_ended:
+                out.append(ch)
+            value_ended = False
+        elif ch == ':':
+            value_ended = False
+            out.append(ch)
+        else:
+            out.append(ch)
+    if in_string:
+        del out[string_start:]
+    _drop_trailing(out, ',:')
+    out.extend(reversed(stack))
+    return ''.join(out)
+
+def _drop_trailing(out: list[str], characters: str):
+    while out and (out[-1].isspace() or out[-1] in characters):
+        out.pop()
+
+def loads_lenient(text: str, opening: str = '['):
+    """
+    Parses the JSON value in a model's answer, repairing it if needed.
+
+    Well-formed answers take the json.loads fast path. Otherwise markdown
+    fences and surrounding prose are cut away, common defects are repaired,
+    and a Python literal (single quotes, True/False) is tried last.
+
+    Args:
+        text: The answer.
+        opening: '[' or '{', the bracket the expected value starts with.
+
+    Returns:
+        The parsed value, or None if nothing could be recovered.
+    """
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    candidate = _outermost(_strip_fences(text), opening)
+    for attempt in (candidate, _repair(candidate)):
+        try:
+            return json.loads(attempt)
+        except ValueError:
+            pass
+    try:
+        return ast.literal_eval(candidate)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+
+def as_propositions(value) -> list[str] | None:
+    """
+    Validates a parsed answer as a non-empty list of propositions.
+
+    An object with a single list value, such as {"propositions": [...]}, is
+    unwrapped, and blank propositions are dropped.
+
+    Returns:
+        The propositions, or None if the value does not hold any.
+    """
+    if isinstance(value, dict) and len(value) == 1:
+        value = next(iter(value.values()))
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        return None
+    propositions = [item.strip() for item in value if item.strip()]
+    return propositions or None
+
+def parse_propositions(text: str) -> list[str] | None:
+    """Parses a single-verse answer, or returns None if it is unusable."""
+    return as_propositions(loads_lenient(text, '['))
+
+def parse_keyed_propositions(text: str, keys: list[str]) -> dict[str, list[str]]:
+    """
+    Parses a keyed batch answer.
+
+    Returns:
+        The propositions of every requested key whose value is usable;
+        missing and malformed entries are left out.
+    """
+    parsed = loads_lenient(text, '{')
+    if not isinstance(parsed, dict):
+        return {}
+    results = {}
+    for key in keys:
+        value = parsed.get(key)
+        propositions = as_propositions(value) if isinstance(value, list) else None
+        if propositions is not None:
+            results[key] = propositions
+    return results
@@ -1,36 +1,290 @@
+import asyncio
+import re
+import threading
 import time
-import random
-from functools import wraps
 from google.api_core.exceptions import ResourceExhausted
 
-def retry_with_exponential_backoff(
-    initial_delay: float = 1,
-    exponential_base: float = 2,
-    jitter: bool = True,
-    max_retries: int = 5,
-):
-    """
-    A decorator to retry a function with exponential backoff.
-    """
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            num_retries = 0
-            delay = initial_delay
-            while True:
-                try:
-                    return func(*args, **kwargs)
-                except ResourceExhausted as e:
-                    num_retries += 1
-                    if num_retries > max_retries:
-                        raise Exception(
-                            f"Maximum number of retries ({max_retries}) exceeded."
-                        ) from e
-                    
-                    delay *= exponential_base * (1 + jitter * random.random())
-                    print(f"Rate limit exceeded. Retrying in {delay:.2f} seconds...")
-                    time.sleep(delay)
-                except Exception as e:
-                    raise e
-        return wrapper
-    return decorator
+class AdaptiveRateLimiter:
+    """
+    A process-wide token-bucket rate limiter with AIMD rate control.
+
+    Requests and tokens are drawn from two buckets that refill at the current
+    rate. Every successful call raises the rate additively, up to the
+    configured quota; a rate-limit error cuts it multiplicatively and, when
+    the server sends a retry hint, holds back every caller until it expires.
+    The limiter is thread-safe, so it can be shared by threads and coroutines.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 2000,
+        tokens_per_minute: float = 4_000_000,
+        initial_fraction: float = 0.5,
+        min_fraction: float = 0.05,
+        decrease_factor: float = 0.5,
+        decrease_cooldown: float = 1.0,
+        burst_seconds: float = 1.0,
+        clock=time.monotonic,
+    ):
+        """
+        Args:
+            requests_per_minute: The request quota (RPM) the rate never exceeds.
+            tokens_per_minute: The token quota (TPM) the rate never exceeds.
+            initial_fraction: The fraction of the quota to start at.
+            min_fraction: The fraction of the quota the rate is never cut below.
+            decrease_factor: The factor the rate is multiplied by on a rate-limit error.
+            decrease_cooldown: Seconds during which further rate-limit errors
+                do not cut the rate again, so one burst of 429s counts once.
+            burst_seconds: How many seconds' worth of requests may be sent at once.
+            clock: A monotonic clock, injectable for tests.
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.min_fraction = min_fraction
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+        self.burst_seconds = burst_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._fraction = min(1.0, max(min_fraction, initial_fraction))
+        self._last_refill = clock()
+        self._last_decrease = float('-inf')
+        self._requests = self._request_capacity()
+        self._tokens = self._token_capacity()
+
+    @property
+    def current_rpm(self) -> float:
+        """The request rate currently allowed, in requests per minute."""
+        return self._fraction * self.requests_per_minute
+
+    @property
+    def current_tpm(self) -> float:
+        """The token rate currently allowed, in tokens per minute."""
+        return self._fraction * self.tokens_per_minute
+
+    def _request_capacity(self) -> float:
+        return max(1.0, self.current_rpm / 60 * self.burst_seconds)
+
+    def _token_capacity(self) -> float:
+        return max(1.0, self.current_tpm / 60 * self.burst_seconds)
+
+    def _refill(self, now: float):
+        elapsed = now - self._last_refill
+        if elapsed <= 0:
+            return
+        self._requests = min(self._request_capacity(), self._requests + elapsed * self.current_rpm / 60)
+        self._tokens = min(self._token_capacity(), self._tokens + elapsed * self.current_tpm / 60)
+        self._last_refill = now
+
+    def reserve(self, tokens: int = 0) -> float:
+        """
+        Reserves one request and `tokens` tokens.
+
+        Buckets may go into debt, so concurrent callers queue up in the order
+        they reserved instead of racing each other once capacity frees up.
+
+        Returns:
+            The number of seconds the caller must wait before sending.
+        """
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            self._requests -= 1
+            self._tokens -= tokens
+            return self._delay(now)
+
+    def _delay(self, now: float, requests: float = 0.0, tokens: float = 0.0) -> float:
+        deficit = max(
+            (requests - self._requests) / (self.current_rpm / 60),
+            (tokens - self._tokens) / (self.current_tpm / 60),
+            0.0,
+        )
+        return max(0.0, self._last_refill - now + deficit)
+
+    def delay(self, tokens: int = 0) -> float:
+        """
+        Returns how many seconds a request of `tokens` tokens would wait if it
+        were reserved now, without reserving it.
+        """
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            return self._delay(now, 1.0, tokens)
+
+    def acquire(self, tokens: int = 0):
+        """Blocks the calling thread until a request of `tokens` tokens may be sent."""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens: int = 0):
+        """Waits on the event loop until a request of `tokens` tokens may be sent."""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def record_success(self, tokens_used: int | None = None, tokens_reserved: int = 0):
+        """
+        Raises the rate by one request per minute after a successful call.
+
+        If the actual token usage is known, the difference from the reserved
+        estimate is settled against the token bucket.
+        """
+        with self._lock:
+            self._refill(self._clock())
+            if tokens_used is not None:
+                self._tokens -= tokens_used - tokens_reserved
+            self._fraction = min(1.0, self._fraction + 1 / self.requests_per_minute)
+
+    def record_rate_limited(self, retry_after: float | None = None):
+        """
+        Cuts the rate after a rate-limit error and drains both buckets.
+
+        Args:
+            retry_after: The server's retry hint in seconds, if it sent one.
+                No request is released before it has elapsed.
+        """
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            if now - self._last_decrease >= self.decrease_cooldown:
+                self._fraction = max(self.min_fraction, self._fraction * self.decrease_factor)
+                self._last_decrease = now
+            self._requests = min(self._requests, 0.0)
+            self._tokens = min(self._tokens, 0.0)
+            if retry_after is not None and now + retry_after > self._last_refill:
+                self._last_refill = now + retry_after
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+def get_rate_limiter() -> AdaptiveRateLimiter:
+    """Returns the process-wide rate limiter, creating it with default quotas if needed."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = AdaptiveRateLimiter()
+        return _rate_limiter
+
+def configure_rate_limiter(**kwargs) -> AdaptiveRateLimiter:
+    """
+    Replaces the process-wide rate limiter.
+
+    Args:
+        **kwargs: Passed through to AdaptiveRateLimiter.
+
+    Returns:
+        The new rate limiter.
+    """
+    global _rate_limiter
+    with _rate_limiter_lock:
+        _rate_limiter = AdaptiveRateLimiter(**kwargs)
+        return _rate_limiter
+
+_RETRY_HINT_PATTERNS = (
+    re.compile(r"retry in (\d+(?:\.\d+)?)\s*s", re.IGNORECASE),
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)"),
+)
+
+def retry_after_seconds(exc: Exception) -> float | None:
+    """
+    Extracts the server's retry hint from a rate-limit error.
+
+    Looks for a google.rpc.RetryInfo in the error details first and falls
+    back to the hint embedded in the error message.
+
+    Returns:
+        The hint in seconds, or None if the server did not send one.
+    """
+    for detail in getattr(exc, 'details', None) or []:
+        delay = getattr(detail, 'retry_delay', None)
+        if delay is not None and hasattr(delay, 'seconds'):
+            return delay.seconds + getattr(delay, 'nanos', 0) / 1e9
+    for pattern in _RETRY_HINT_PATTERNS:
+        match = pattern.search(str(exc))
+        if match:
+            return float(match.group(1))
+    return None
+
+def _usage_count(response, field: str) -> int | None:
+    count = getattr(getattr(response, 'usage_metadata', None), field, None)
+    return count if isinstance(count, int) else None
+
+def _response_token_count(response) -> int | None:
+    """Returns the total token count reported in a response's usage metadata, if any."""
+    return _usage_count(response, 'total_token_count')
+
+def _record_call_stats(call_stats: dict | None, response, retries: int, waited: float):
+    if call_stats is not None:
+        call_stats['retries'] = retries
+        call_stats['rate_limit_wait'] = waited
+        call_stats['prompt_tokens'] = _usage_count(response, 'prompt_token_count')
+        call_stats['output_tokens'] = _usage_count(response, 'candidates_token_count')
+
+def call_with_rate_limiter(func, *args, estimated_tokens: int = 0, limiter: AdaptiveRateLimiter | None = None, max_retries: int = 10, call_stats: dict | None = None, **kwargs):
+    """
+    Calls an API function through the shared rate limiter.
+
+    The call waits for its turn, reports success or rate-limit errors back to
+    the limiter, and is retried on ResourceExhausted. Backing off is left to
+    the limiter, so all callers slow down together instead of independently.
+
+    Args:
+        func: The API function to call.
+        estimated_tokens: The number of tokens the call is expected to use.
+        limiter: The limiter to use. Defaults to the process-wide limiter.
+        max_retries: How many rate-limit errors to tolerate before giving up.
+        call_stats: If given, filled with the number of 'retries', the seconds
+            spent waiting on the limiter ('rate_limit_wait'), and the
+            'prompt_tokens' and 'output_tokens' the response reports.
+
+    Raises:
+        Exception: If the call is still rate limited after max_retries retries.
+    """
+    limiter = limiter or get_rate_limiter()
+    num_retries = 0
+    waited = 0.0
+    while True:
+        started = time.monotonic()
+        limiter.acquire(estimated_tokens)
+        waited += time.monotonic() - started
+        try:
+            response = func(*args, **kwargs)
+        except ResourceExhausted as e:
+            limiter.record_rate_limited(retry_after_seconds(e))
+            num_retries += 1
+            _record_call_stats(call_stats, None, num_retries, waited)
+            if num_retries > max_retries:
+                raise Exception(
+                    f"Maximum number of retries ({max_retries}) exceeded."
+                ) from e
+            continue
+        limiter.record_success(_response_token_count(response), estimated_tokens)
+        _record_call_stats(call_stats, response, num_retries, waited)
+        return response
+
+async def async_call_with_rate_limiter(func, *args, estimated_tokens: int = 0, limiter: AdaptiveRateLimiter | None = None, max_retries: int = 10, call_stats: dict | None = None, **kwargs):
+    """
+    The asyncio counterpart of call_with_rate_limiter, for coroutine functions.
+    """
+    limiter = limiter or get_rate_limiter()
+    num_retries = 0
+    waited = 0.0
+    while True:
+        started = time.monotonic()
+        await limiter.acquire_async(estimated_tokens)
+        waited += time.monotonic() - started
+        try:
+            response = await func(*args, **kwargs)
+        except ResourceExhausted as e:
+            limiter.record_rate_limited(retry_after_seconds(e))
+            num_retries += 1
+            _record_call_stats(call_stats, None, num_retries, waited)
+            if num_retries > max_retries:
+                raise Exception(
+                    f"Maximum number of retries ({max_retries}) exceeded."
+                ) from e
+            continue
+        limiter.record_success(_response_token_count(response), estimated_tokens)
+        _record_call_stats(call_stats, response, num_retries, waited)
+        return response
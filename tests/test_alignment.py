@@ -0,0 +1,87 @@
+import unittest
+import pandas as pd
+
+from src.alignment import (
+    aligned_table, canonical_books, canonical_references, pack_verse_ids, parse_chapter_verse,
+    parse_references, unpack_verse_ids, versification_from_markers,
+)
+
+class TestCanonicalReferences(unittest.TestCase):
+
+    def test_every_scheme_maps_to_the_same_book(self):
+        """First Chronicles is recognized under each dataset's naming scheme."""
+        names = {'masoretic': '1CH', 'vulgate': '1 Paralipomenon', 'septuagint': '1 Chronicles', 'stepbible': '1Ch', 'ctat': '1Ch'}
+        for scheme, name in names.items():
+            self.assertEqual(canonical_books(pd.Series([name]), scheme).iloc[0], '1CH', scheme)
+        self.assertEqual(canonical_books(pd.Series(['3 Kings']), 'vulgate').iloc[0], '1KI')
+
+    def test_unknown_book_names(self):
+        """Unknown names raise, or become missing values when coerced."""
+        with self.assertRaises(ValueError):
+            canonical_books(pd.Series(['Tobias']), 'vulgate')
+        self.assertTrue(canonical_books(pd.Series(['Tobias']), 'vulgate', errors='coerce').isna().all())
+
+    def test_verse_ids_round_trip(self):
+        ids = pack_verse_ids(pd.Series(['GEN', 'MAL']), pd.Series([1, 3]), pd.Series([1, 24]))
+        self.assertEqual(ids.tolist(), [1001001, 39003024])
+        self.assertEqual(unpack_verse_ids(ids).values.tolist(), [['GEN', 1, 1], ['MAL', 3, 24]])
+
+    def test_versification_tables_are_applied(self):
+        """English and Septuagint numbering are mapped to the Hebrew numbering."""
+        masoretic = pd.DataFrame({'book_name': ['MAL', 'JOE'], 'chapter': [4, 3], 'verse': [1, 5]})
+        self.assertEqual(canonical_references(masoretic, 'masoretic')['verse_id'].tolist(), [39003019, 29004005])
+
+        septuagint = pd.DataFrame({'book_name': ['Psalms', 'Psalms', 'Joshua (Vaticanus)'], 'chapter': [50, 151, 1], 'verse': [3, 1, 1]})
+        refs = canonical_references(septuagint, 'septuagint')
+        self.assertEqual(refs['verse_id'].tolist()[0], 19051003)
+        self.assertTrue(pd.isna(refs['verse_id'].iloc[1]))
+        self.assertEqual(refs['recension'].tolist()[2], 'Vaticanus')
+
+    def test_repeated_verse_numbers_use_the_occurrence(self):
+        """The Vulgate restarts Psalm 9 at verse 1 for what is Hebrew Psalm 10."""
+        vulgate = pd.DataFrame({'book_name': ['Psalms'] * 3, 'chapter': [9, 9, 9], 'verse': [1, 2, 1]})
+        self.assertEqual(canonical_references(vulgate, 'vulgate')['verse_id'].tolist(), [19009001, 19009002, 19010001])
+
+    def test_parse_references(self):
+        """References are parsed from HOTTP lines and noisy CTAT values."""
+        self.assertEqual(parse_references(pd.Series(['GEN 32:2'])).values.tolist(), [['GEN', 32, 2]])
+        self.assertEqual(parse_chapter_verse(pd.Series(['8: 14', '2:30 :31', 'n/a'])).iloc[:2].values.tolist(), [[8, 14], [2, 30]])
+
+    def test_versification_from_markers(self):
+        """Consecutive verses with the same offset become one row."""
+        df = pd.DataFrame({
+            'book_name': ['GEN', 'GEN', 'GEN', 'GEN'],
+            'chapter': [31, 32, 32, 33],
+            'verse': [55, 1, 2, 1],
+            'text': ['(32-1) Early.', '(32-2) And Jacob.', '(32-3) And Jacob said.', 'And Jacob lifted.'],
+        })
+        table = versification_from_markers(df)
+        self.assertEqual(
+            table[['chapter', 'verse_start', 'verse_end', 'to_chapter', 'to_verse']].values.tolist(),
+            [[31, 55, 55, 32, 1], [32, 1, 2, 32, 2]],
+        )
+
+class TestAlignedTable(unittest.TestCase):
+
+    def test_sources_are_joined_by_verse_id(self):
+        texts = {
+            'masoretic': pd.DataFrame({'book_name': ['MAL', 'MAL'], 'chapter': [3, 4], 'verse': [18, 1], 'text': ['M18', 'M41']}),
+            'septuagint': pd.DataFrame({
+                'book_name': ['Malachi', 'Malachi', 'Joshua (Alexandrinus)', 'Joshua (Vaticanus)'],
+                'chapter': [3, 3, 1, 1], 'verse': [18, 19, 1, 1], 'text': ['S18', 'S19', 'A', 'B'],
+            }),
+        }
+        normalizations = {
+            'masoretic': pd.DataFrame({'book_name': ['MAL'], 'chapter': [4], 'verse': [1], 'normalization': [['P.']]}),
+        }
+        table = aligned_table(texts, normalizations)
+
+        self.assertEqual(table.index.tolist(), [6001001, 39003018, 39003019])
+        self.assertEqual(table.loc[39003019, 'text_masoretic'], 'M41')
+        self.assertEqual(table.loc[39003019, 'text_septuagint'], 'S19')
+        self.assertEqual(table.loc[39003019, 'normalization_masoretic'], ['P.'])
+        self.assertEqual(table.loc[6001001, 'text_septuagint'], 'B')
+        self.assertEqual(table.loc[6001001, ['book', 'chapter', 'verse']].tolist(), ['JOS', 1, 1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import argparse
+import json
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from scripts import batch_job
+from src.batch_job import parse_request_key, parse_result, read_results, request_key, request_line
+from src.checkpoint import CheckpointManifest, verse_hash
+from src.result_writer import read_output
+
+def result_line(key: str, text: str | None) -> str:
+    if text is None:
+        return json.dumps({'key': key, 'error': {'code': 500, 'message': 'Internal error'}}) + '\n'
+    return json.dumps({'key': key, 'response': {'candidates': [{'content': {'parts': [{'text': text}]}}]}}) + '\n'
+
+class TestBatchJob(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = [
+            {'book_name': 'GEN', 'chapter': 1, 'verse': 1, 'text': 'In the beginning.'},
+            {'book_name': 'GEN', 'chapter': 1, 'verse': 2, 'text': 'The earth was void.'},
+        ]
+        for row in self.rows:
+            row['verse_hash'] = verse_hash(row['book_name'], row['chapter'], row['verse'], row['text'])
+
+    def test_request_lines(self):
+        """Single verses use the single-verse prompt and batches the keyed batch prompt, with a schema."""
+        single = json.loads(request_line('masoretic', self.rows[:1], "Verse: {verse_text}", "Verses: {verses_json}"))
+        self.assertEqual(parse_request_key(single['key']), ('masoretic', [self.rows[0]['verse_hash']]))
+        self.assertEqual(single['request']['contents'][0]['parts'][0]['text'], "Verse: In the beginning.")
+        self.assertEqual(single['request']['generation_config']['response_schema']['type'], 'array')
+
+        batch = json.loads(request_line('masoretic', self.rows, "Verse: {verse_text}", "Verses: {verses_json}", structured_output=False))
+        self.assertIn('"GEN 1:2": "The earth was void."', batch['request']['contents'][0]['parts'][0]['text'])
+        self.assertNotIn('generation_config', batch['request'])
+        with self.assertRaises(ValueError):
+            parse_request_key('masoretic')
+
+    def test_parse_result(self):
+        """Answers are parsed per verse; failed requests and missing verses map to empty lists."""
+        key = request_key('masoretic', [row['verse_hash'] for row in self.rows])
+        result = json.loads(result_line(key, '```json\n{"GEN 1:1": ["A."]}\n```'))
+        self.assertEqual(parse_result(result, self.rows), {self.rows[0]['verse_hash']: ["A."], self.rows[1]['verse_hash']: []})
+        self.assertEqual(parse_result(json.loads(result_line(key, None)), self.rows[:1]), {self.rows[0]['verse_hash']: []})
+
+class TestIngest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmpdir.name)
+        os.makedirs('data')
+        pd.DataFrame({
+            'book_name': ['GEN', 'GEN', 'GEN'], 'chapter': [1, 1, 1], 'verse': [1, 2, 3],
+            'text': ['In the beginning.', 'The earth was void.', 'Let there be light.'],
+        }).to_csv(os.path.join('data', 'masoretic.csv'), index=False)
+        self.hashes = [
+            verse_hash('GEN', 1, 1, 'In the beginning.'),
+            verse_hash('GEN', 1, 2, 'The earth was void.'),
+            verse_hash('GEN', 1, 3, 'Let there be light.'),
+        ]
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmpdir.cleanup()
+
+    def test_ingest_result_file(self):
+        """Results are merged into the output and the manifest, and re-ingesting adds nothing."""
+        with open('results.jsonl', 'w') as f:
+            f.write(result_line(request_key('masoretic', self.hashes[:2]), '{"GEN 1:1": ["A."], "GEN 1:2": ["B."]}'))
+            f.write(result_line(request_key('masoretic', self.hashes[2:]), None))
+            f.write(result_line(request_key('masoretic', [12345]), '["Stale."]'))
+            f.write('{"key": "masoretic:1')
+        args = argparse.Namespace(results='results.jsonl', output_format='csv', durability='flush')
+
+        counts = batch_job.ingest(args)
+        self.assertEqual(counts, {'done': 2, 'failed': 1, 'skipped': 0, 'unknown': 1})
+        counts = batch_job.ingest(args)
+        self.assertEqual(counts['done'], 0)
+        self.assertEqual(counts['skipped'], 2)
+
+        output = read_output(os.path.join('output', 'masoretic_normalised.csv'), 'csv')
+        self.assertEqual(output['normalization'].tolist(), [["A."], ["B."]])
+        manifest = CheckpointManifest(os.path.join('output', 'checkpoint_csv.sqlite'))
+        self.assertEqual(manifest.completed('masoretic'), set(self.hashes[:2]))
+        manifest.close()
+
+if __name__ == '__main__':
+    unittest.main()
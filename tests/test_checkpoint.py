@@ -0,0 +1,54 @@
+import unittest
+import os
+import shutil
+import tempfile
+import pandas as pd
+
+from src.checkpoint import CheckpointManifest, DONE, FAILED, verse_hash, verse_hashes, repair_torn_tail
+
+class TestCheckpointManifest(unittest.TestCase):
+
+    def setUp(self):
+        """Create the manifest in a temporary directory."""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.manifest = CheckpointManifest(os.path.join(self.tmp_dir, 'checkpoint.sqlite'))
+        self.output_path = os.path.join(self.tmp_dir, 'masoretic_normalised.csv')
+
+    def tearDown(self):
+        self.manifest.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_verse_hash_ignores_number_representation(self):
+        """Chapters and verses read back from CSV as strings hash the same as integers."""
+        self.assertEqual(verse_hash('GEN', 1, 1, 'Text.'), verse_hash('GEN', '1', '1', 'Text.'))
+        self.assertNotEqual(verse_hash('GEN', 1, 1, 'Text.'), verse_hash('GEN', 1, 1, 'Other text.'))
+
+    def test_verse_hashes_matches_verse_hash(self):
+        """The DataFrame helper agrees with the scalar hash."""
+        df = pd.DataFrame({'book_name': ['GEN'], 'chapter': [1], 'verse': [2], 'text': ['Text.']})
+        self.assertEqual(verse_hashes(df).iloc[0], verse_hash('GEN', 1, 2, 'Text.'))
+
+    def test_done_verses_are_not_downgraded(self):
+        """Only DONE verses count as completed, and a later failure does not undo them."""
+        self.manifest.mark('masoretic', [1, 2], DONE)
+        self.manifest.mark('masoretic', [2, 3], FAILED)
+        self.assertEqual(self.manifest.completed('masoretic'), {1, 2})
+        self.assertEqual(self.manifest.counts('masoretic'), {DONE: 2, FAILED: 1})
+        self.assertEqual(self.manifest.completed('vulgate'), set())
+
+    def test_import_csv_skips_torn_tail(self):
+        """An older output file seeds the manifest, ignoring a half-written last row."""
+        with open(self.output_path, 'w') as f:
+            f.write('book_name,chapter,verse,text,normalization\n')
+            f.write('GEN,1,1,Text one.,"[""A.""]"\n')
+            f.write('GEN,1,2,Text two.,[]\n')
+            f.write('GEN,1,3,Text three.,"[""B')
+
+        self.assertTrue(repair_torn_tail(self.output_path))
+        self.assertFalse(repair_torn_tail(self.output_path))
+        self.assertEqual(self.manifest.import_csv('masoretic', self.output_path), 2)
+        self.assertEqual(self.manifest.completed('masoretic'), {verse_hash('GEN', 1, 1, 'Text one.')})
+        self.assertTrue(self.manifest.has_source('masoretic'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+from unittest.mock import patch, MagicMock, AsyncMock
+import os
+
+from src.comparison_service import ComparisonService, PairMatcher, _parse_comparison, parse_pairs
+
+class TestComparisonParsing(unittest.TestCase):
+
+    def test_parse_comparison(self):
+        """Answers are parsed with or without fences and bullets; anything else is rejected."""
+        self.assertEqual(_parse_comparison('* [true, "Vulgate adds an insult."]'), (True, "Vulgate adds an insult."))
+        self.assertEqual(_parse_comparison('```json\n[false]\n```'), (False, ''))
+        self.assertIsNone(_parse_comparison('["yes", "no"]'))
+        self.assertIsNone(_parse_comparison('No difference.'))
+
+    def test_parse_pairs(self):
+        self.assertEqual(parse_pairs('masoretic:vulgate, vulgate:septuagint'), [('masoretic', 'vulgate'), ('vulgate', 'septuagint')])
+        with self.assertRaises(ValueError):
+            parse_pairs('masoretic:masoretic')
+
+class TestPairMatcher(unittest.TestCase):
+
+    def test_pairs_are_emitted_once_both_sides_exist(self):
+        """A verse is paired across versifications as soon as its second side arrives."""
+        matcher = PairMatcher([('masoretic', 'septuagint')])
+        self.assertEqual(matcher.add('masoretic', [{'book_name': 'MAL', 'chapter': 4, 'verse': 1, 'normalization': ['M.']}]), [])
+
+        pairs = matcher.add('septuagint', [
+            {'book_name': 'Malachi', 'chapter': 3, 'verse': 19, 'normalization': ['S.']},
+            {'book_name': 'Malachi', 'chapter': 3, 'verse': 18, 'normalization': ['Unpaired.']},
+        ])
+        self.assertEqual(len(pairs), 1)
+        self.assertEqual((pairs[0]['book'], pairs[0]['chapter'], pairs[0]['verse']), ('MAL', 3, 19))
+        self.assertEqual((pairs[0]['normalization_a'], pairs[0]['normalization_b']), (['M.'], ['S.']))
+
+        again = matcher.add('septuagint', [{'book_name': 'Malachi', 'chapter': 3, 'verse': 19, 'normalization': ['S.']}])
+        self.assertEqual(again, [])
+
+    def test_failed_normalizations_are_not_paired(self):
+        matcher = PairMatcher([('masoretic', 'vulgate')])
+        matcher.add('masoretic', [{'book_name': 'GEN', 'chapter': 1, 'verse': 1, 'normalization': []}])
+        self.assertEqual(matcher.add('vulgate', [{'book_name': 'Genesis', 'chapter': 1, 'verse': 1, 'normalization': ['V.']}]), [])
+
+class TestComparisonService(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.prompt_path = 'tests/dummy_comparison_prompt.txt'
+        with open(self.prompt_path, 'w') as f:
+            f.write("Compare this:\n")
+
+    def tearDown(self):
+        if os.path.exists(self.prompt_path):
+            os.remove(self.prompt_path)
+
+    @patch('src.comparison_service.configure_api_key')
+    @patch('google.generativeai.GenerativeModel')
+    async def test_compare_async(self, MockGenerativeModel, MockConfigureApiKey):
+        """The verse is appended to the prompt and the answer parsed."""
+        mock_response = MagicMock()
+        mock_response.text = '[true, "Different."]'
+        mock_model_instance = MagicMock()
+        mock_model_instance.generate_content_async = AsyncMock(return_value=mock_response)
+        MockGenerativeModel.return_value = mock_model_instance
+
+        service = ComparisonService(self.prompt_path)
+        result = await service.compare_async('masoretic', ['A.'], 'vulgate', ['B.'])
+
+        self.assertEqual(result, (True, "Different."))
+        prompt = mock_model_instance.generate_content_async.await_args.args[0]
+        self.assertTrue(prompt.startswith("Compare this:\n\nSource 1: Masoretic:"))
+        self.assertIn('Source 2: Vulgate:\n\n["B."]', prompt)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,10 @@
 import unittest
 import pandas as pd
 import os
+import tempfile
 
 # This import will fail until we create the file in the next step
-from src.data_loader import load_data, filter_septuagint
+from src.data_loader import load_data, iter_data, filter_septuagint
 
 class TestDataLoader(unittest.TestCase):
 
@@ -56,5 +57,44 @@ class TestDataLoader(unittest.TestCase):
         # Check that only rows with potential_difference_verse == True remain
         self.assertTrue(all(filtered_df['potential_difference_verse']))
 
+    def test_typed_projected_load(self):
+        """Columns get their declared types, and columns without a header are skipped."""
+        with open(self.septuagint_csv_path, 'w') as f:
+            f.write(
+                "book_name,chapter,verse,potential_difference_verse,text,,,\n"
+                "Genesis,1,1,True,Verse 1 text,,,\n"
+                "Genesis,1,2,False,,,,\n"
+                "Exodus,20,1,True,Verse 3 text,,,\n"
+            )
+
+        df = load_data(self.septuagint_csv_path)
+        self.assertListEqual(list(df.columns), ['book_name', 'chapter', 'verse', 'potential_difference_verse', 'text'])
+        self.assertEqual(df['book_name'].dtype, 'category')
+        self.assertEqual(df['chapter'].dtype, 'int16')
+        self.assertEqual(df['potential_difference_verse'].dtype, 'boolean')
+        self.assertEqual(len(filter_septuagint(df)), 2)
+        self.assertListEqual(list(load_data(self.septuagint_csv_path, columns=['verse', 'text']).columns), ['verse', 'text'])
+        with self.assertRaises(KeyError):
+            load_data(self.septuagint_csv_path, columns=['missing'])
+
+    def test_corpus_cache(self):
+        """The Parquet copy is used until the CSV file changes, and chunks add up to the whole file."""
+        with tempfile.TemporaryDirectory() as cache_dir:
+            first = load_data(self.dummy_csv_path, cache_dir=cache_dir)
+            self.assertEqual(len([name for name in os.listdir(cache_dir) if name.endswith('.parquet')]), 1)
+            pd.testing.assert_frame_equal(load_data(self.dummy_csv_path, cache_dir=cache_dir), first)
+
+            pd.DataFrame({
+                'book_name': ['Genesis'] * 3, 'chapter': [1, 1, 1], 'verse': [1, 2, 3], 'text': ['a', 'b', 'c'],
+            }).to_csv(self.dummy_csv_path, index=False)
+            changed = load_data(self.dummy_csv_path, cache_dir=cache_dir)
+            self.assertEqual(changed['text'].tolist(), ['a', 'b', 'c'])
+
+            chunks = list(iter_data(self.dummy_csv_path, chunk_rows=2, cache_dir=cache_dir))
+            self.assertEqual([len(chunk) for chunk in chunks], [2, 1])
+            self.assertEqual(chunks[1].index.tolist(), [2])
+            self.assertEqual(pd.concat(chunks)['text'].tolist(), changed['text'].tolist())
+            self.assertEqual([len(chunk) for chunk in iter_data(self.dummy_csv_path, chunk_rows=2)], [2, 1])
+
 if __name__ == '__main__':
     unittest.main()
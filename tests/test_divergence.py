@@ -0,0 +1,44 @@
+import unittest
+import numpy as np
+import pandas as pd
+
+from src.divergence import clean_texts, divergence_flags, jaccard_similarity
+
+class TestDivergence(unittest.TestCase):
+
+    def test_clean_texts(self):
+        """Verse markers, punctuation and case do not count as differences."""
+        self.assertEqual(clean_texts(pd.Series(["(3-1) And God  said: 'Let there be light.'"])).iloc[0], "and god said let there be light")
+
+    def test_jaccard_similarity_matches_set_arithmetic(self):
+        """The vectorized similarity equals the Jaccard index of the trigram sets."""
+        texts_a = pd.Series(["In the beginning God created", "Abc", "Same text", None])
+        texts_b = pd.Series(["In the beginning God made", "Xyz", "same text!", "Anything"])
+        similarity = jaccard_similarity(texts_a, texts_b)
+
+        def trigrams(text):
+            return {text[i:i + 3] for i in range(len(text) - 2)}
+        a, b = trigrams("in the beginning god created"), trigrams("in the beginning god made")
+        self.assertAlmostEqual(similarity[0], len(a & b) / len(a | b))
+        self.assertEqual(similarity[1], 0.0)
+        self.assertEqual(similarity[2], 1.0)
+        self.assertTrue(np.isnan(similarity[3]))
+
+    def test_divergence_flags(self):
+        """Verses are flagged when they differ from another source or have no counterpart."""
+        texts = {
+            'masoretic': pd.DataFrame({
+                'book_name': ['GEN', 'GEN', 'GEN'], 'chapter': [1, 1, 1], 'verse': [1, 2, 3],
+                'text': ['In the beginning God created the heaven.', 'And the earth was void.', 'Only here.'],
+            }),
+            'vulgate': pd.DataFrame({
+                'book_name': ['Genesis', 'Genesis'], 'chapter': [1, 1], 'verse': [1, 2],
+                'text': ['In the beginning God created heaven.', 'A wholly unrelated sentence.'],
+            }),
+        }
+        flags = divergence_flags(texts, threshold=0.5)
+        self.assertEqual(flags['masoretic'].tolist(), [False, True, True])
+        self.assertEqual(flags['vulgate'].tolist(), [False, True])
+
+if __name__ == '__main__':
+    unittest.main()
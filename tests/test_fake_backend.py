@@ -0,0 +1,67 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import patch
+from google.api_core.exceptions import ResourceExhausted
+
+from src.fake_backend import FakeGeminiBackend, fake_answer
+from src.normalization_service import NormalizationService
+from src.utils import AdaptiveRateLimiter, retry_after_seconds
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestFakeBackend(unittest.TestCase):
+
+    def test_fake_answer(self):
+        """Single-verse, batch and comparison prompts get answers of the shape they ask for."""
+        self.assertEqual(json.loads(fake_answer("Verse: He spoke. They went.\nOutput:")), ["He spoke.", "They went."])
+        batch = fake_answer('Example: {"A 1:1": "x"}\nVerses: {"GEN 1:1": "In the beginning.", "GEN 1:2": "Void."}\nOutput:')
+        self.assertEqual(json.loads(batch), {"GEN 1:1": ["In the beginning."], "GEN 1:2": ["Void."]})
+        self.assertEqual(json.loads(fake_answer("Source 1: a\n[]\nSource 2: b\n[]\nOutput:")), [False, ""])
+
+    def test_injected_errors(self):
+        """Injected 429s carry a retry hint, and malformed answers are not JSON."""
+        backend = FakeGeminiBackend(latency='constant', latency_mean=0.0, rate_limit_rate=1.0, retry_after=2.5)
+        with self.assertRaises(ResourceExhausted) as raised:
+            backend.generate_content("Verse: x\nOutput:")
+        self.assertEqual(retry_after_seconds(raised.exception), 2.5)
+
+        backend = FakeGeminiBackend(latency='constant', latency_mean=0.0, malformed_rate=1.0)
+        with self.assertRaises(ValueError):
+            json.loads(backend.generate_content("Verse: x\nOutput:").text)
+        self.assertEqual(backend.stats()['malformed'], 1)
+
+    def test_quota_window(self):
+        """The per-minute quota rejects requests until the oldest leaves the window."""
+        clock = FakeClock()
+        backend = FakeGeminiBackend(latency='constant', latency_mean=0.0, requests_per_minute=2, clock=clock)
+        backend.generate_content("Verse: a\nOutput:")
+        clock.now = 10.0
+        backend.generate_content("Verse: b\nOutput:")
+        with self.assertRaises(ResourceExhausted) as raised:
+            backend.generate_content("Verse: c\nOutput:")
+        self.assertAlmostEqual(retry_after_seconds(raised.exception), 50.0)
+        clock.now = 60.0
+        backend.generate_content("Verse: c\nOutput:")
+        self.assertEqual(backend.stats()['requests'], 3)
+        self.assertEqual(backend.stats()['rate_limited'], 1)
+
+    @patch.dict('os.environ', {'GOOGLE_API_KEY': 'fake-key'})
+    def test_drives_normalization_service(self):
+        """The service runs unchanged against the installed backend."""
+        backend = FakeGeminiBackend(latency='constant', latency_mean=0.0)
+        limiter = AdaptiveRateLimiter(requests_per_minute=60_000, tokens_per_minute=10**9)
+        with backend.install():
+            service = NormalizationService('prompts/normalization_prompt.txt', cache=None, rate_limiter=limiter)
+            propositions = asyncio.run(service.normalize_async("GEN", 1, 1, "God created. It was good."))
+        self.assertEqual(propositions, ["God created.", "It was good."])
+        self.assertEqual(backend.stats()['requests'], 1)
+        self.assertGreater(backend.stats()['prompt_tokens'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from google.api_core.exceptions import PermissionDenied, ResourceExhausted
+
+from src.fake_backend import FakeGeminiBackend
+from src.key_pool import KeyPool, load_api_keys, mask_api_key
+from src.normalization_service import NormalizationService
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestKeyPool(unittest.TestCase):
+
+    @patch.dict('os.environ', {'GOOGLE_API_KEYS': 'key-a, key-b,,key-a', 'GOOGLE_API_KEY': 'key-c'})
+    def test_load_api_keys(self):
+        """Keys come from a file, then GOOGLE_API_KEYS, then GOOGLE_API_KEY, without duplicates."""
+        self.assertEqual(load_api_keys(), ['key-a', 'key-b'])
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'keys.txt')
+            with open(path, 'w') as f:
+                f.write("key-d\n\n# spare\nkey-e  # second project\n")
+            self.assertEqual(load_api_keys(path), ['key-d', 'key-e'])
+        with patch.dict('os.environ', {'GOOGLE_API_KEYS': ''}):
+            self.assertEqual(load_api_keys(), ['key-c'])
+        with patch.dict('os.environ', {'GOOGLE_API_KEYS': '', 'GOOGLE_API_KEY': ''}):
+            with self.assertRaises(ValueError):
+                load_api_keys()
+        self.assertEqual(mask_api_key('AIzaSecretf3Qx'), '...f3Qx')
+
+    def test_routes_to_most_headroom_and_benches_failing_keys(self):
+        """Calls go to the key with spare quota, and a key failing in a row is benched for a while."""
+        clock = FakeClock()
+        pool = KeyPool(['key-a', 'key-b'], requests_per_minute=60, initial_fraction=1.0, bench_after=2, bench_seconds=30.0, clock=clock)
+        first, benched = pool.choose()
+        self.assertEqual(benched, 0.0)
+        first.limiter.reserve()
+        second, _ = pool.choose()
+        self.assertIsNot(second, first)
+
+        pool.record_failure(second, PermissionDenied("API key not valid."))
+        self.assertEqual(second.benched_until, float('-inf'))
+        pool.record_failure(second, ResourceExhausted("Quota exceeded. Please retry in 5s."))
+        self.assertEqual(second.benched_until, 30.0)
+        clock.now = 10.0
+        self.assertIs(pool.choose()[0], first)
+
+        # With every key benched, the one back first is chosen with the time left
+        pool.record_failure(first, PermissionDenied("denied"))
+        pool.record_failure(first, PermissionDenied("denied"))
+        key, wait = pool.choose()
+        self.assertIs(key, second)
+        self.assertEqual(wait, 20.0)
+        self.assertEqual(pool.stats()[first.name]['denied'], 2)
+
+    def test_throughput_scales_with_keys(self):
+        """Each key has its own quota, so more keys get more requests through before a 429."""
+        backend = FakeGeminiBackend(latency='constant', latency_mean=0.0, requests_per_minute=3)
+        with backend.install():
+            pool = KeyPool(['key-a', 'key-b', 'key-c'], requests_per_minute=60_000, initial_fraction=1.0)
+            service = NormalizationService('prompts/normalization_prompt.txt', cache=None, metrics=None, key_pool=pool)
+
+            async def normalize_all():
+                return await asyncio.gather(*(service.normalize_async("GEN", 1, verse, "God created.") for verse in range(9)))
+
+            results = asyncio.run(normalize_all())
+        self.assertEqual(results, [["God created."]] * 9)
+        self.assertEqual(backend.stats()['requests'], 9)
+        self.assertEqual(backend.stats()['rate_limited'], 0)
+        self.assertEqual(sorted(stats['requests'] for stats in pool.stats().values()), [3, 3, 3])
+
+if __name__ == '__main__':
+    unittest.main()
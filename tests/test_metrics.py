@@ -0,0 +1,100 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.fake_backend import FakeGeminiBackend
+from src.metrics import MetricsRecorder, current_source
+from src.normalization_service import NormalizationService
+from src.utils import AdaptiveRateLimiter
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestMetricsRecorder(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.call_log = os.path.join(self.tmpdir.name, 'calls.jsonl')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_aggregates_and_call_log(self):
+        """Calls are logged one record per line and summed into the aggregates."""
+        clock = FakeClock()
+        metrics = MetricsRecorder(self.call_log, clock=clock)
+        started = metrics.call_started()
+        self.assertEqual(metrics.snapshot()['in_flight'], 1)
+        clock.now = 2.0
+        current_source.set('vulgate')
+        metrics.record_call(started, ['GEN 1:1', 'GEN 1:2'], {'retries': 1, 'rate_limit_wait': 0.5, 'prompt_tokens': 30, 'output_tokens': 10}, parse_failures=1)
+        started = metrics.call_started()
+        metrics.record_call(started, ['GEN 1:3'], {}, error=RuntimeError("boom"))
+        metrics.record_cache_hits(3)
+        metrics.close()
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['in_flight'], 0)
+        self.assertEqual((snapshot['calls'], snapshot['verses'], snapshot['cache_hits']), (2, 3, 3))
+        self.assertEqual((snapshot['errors'], snapshot['parse_failures'], snapshot['retries']), (1, 1, 1))
+        self.assertEqual(snapshot['error_rate'], 0.5)
+        self.assertEqual(snapshot['tokens_per_minute'], 40)
+        self.assertEqual(snapshot['verses_per_second'], 3.0)
+        self.assertEqual(snapshot['rate_limit_wait_fraction'], 0.25)
+        clock.now = 70.0
+        self.assertEqual(metrics.snapshot()['tokens_per_minute'], 0)
+
+        with open(self.call_log) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(records[0]['source'], 'vulgate')
+        self.assertEqual(records[0]['verses'], ['GEN 1:1', 'GEN 1:2'])
+        self.assertEqual(records[0]['latency'], 2.0)
+        self.assertEqual(records[1]['error'], "RuntimeError: boom")
+
+    def test_prometheus_export(self):
+        """The textfile holds every aggregate with its type, and latency quantiles."""
+        metrics = MetricsRecorder()
+        metrics.record_call(metrics.call_started(), ['GEN 1:1'], {'prompt_tokens': 5, 'output_tokens': 5})
+        path = os.path.join(self.tmpdir.name, 'metrics.prom')
+        metrics.write(path, 'prometheus')
+        with open(path) as f:
+            text = f.read()
+        self.assertIn("# TYPE tessela_normalization_calls_total counter\ntessela_normalization_calls_total 1\n", text)
+        self.assertIn("tessela_normalization_prompt_tokens_total 5\n", text)
+        self.assertIn('tessela_normalization_call_latency_seconds{quantile="0.99"}', text)
+        with self.assertRaises(ValueError):
+            metrics.write(path, 'xml')
+
+    @patch.dict('os.environ', {'GOOGLE_API_KEY': 'fake-key'})
+    def test_service_records_calls(self):
+        """The normalization service records retries, tokens and parse failures per call."""
+        backend = FakeGeminiBackend(latency='constant', latency_mean=0.0, retry_after=0.0)
+        metrics = MetricsRecorder(self.call_log)
+        limiter = AdaptiveRateLimiter(requests_per_minute=60_000, tokens_per_minute=10**9)
+        with backend.install():
+            service = NormalizationService('prompts/normalization_prompt.txt', rate_limiter=limiter, metrics=metrics)
+            asyncio.run(service.normalize_async("GEN", 1, 1, "God created."))
+            backend.rate_limit_rate = 1.0
+            with self.assertRaises(Exception):
+                asyncio.run(service.normalize_async("GEN", 1, 2, "It was good."))
+        metrics.close()
+
+        with open(self.call_log) as f:
+            first, second = [json.loads(line) for line in f]
+        self.assertEqual(first['verses'], ['GEN 1:1'])
+        self.assertEqual(first['retries'], 0)
+        self.assertGreater(first['prompt_tokens'], 0)
+        self.assertEqual(first['parse_failures'], 0)
+        self.assertEqual(second['retries'], 11)
+        self.assertIn("Maximum number of retries", second['error'])
+        self.assertEqual(metrics.snapshot()['errors'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,12 @@
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 import os
+import tempfile
 
 # This import will fail until we create the file in the next step
-from src.normalization_service import normalize_text
+from src.normalization_service import NormalizationService, build_batches, _parse_batch_response
+from src.response_cache import configure_response_cache
+from src.structured_output import PROPOSITIONS_SCHEMA, generation_config
 
 class TestNormalizationService(unittest.TestCase):
 
@@ -35,8 +38,9 @@ class TestNormalizationService(unittest.TestCase):
 
         verse_text = "This is a test verse."
         
-        # Act: Call the function we are testing
-        propositions = normalize_text(verse_text, self.prompt_path)
+        # Act: Call the service we are testing
+        service = NormalizationService(self.prompt_path, model_name="gemini-2.5-pro")
+        propositions = service.normalize("Genesis", 1, 1, verse_text)
 
         # Assert: Check that the function behaved as expected
         self.assertEqual(propositions, ["Proposition 1.", "Proposition 2."])
@@ -45,7 +49,132 @@ class TestNormalizationService(unittest.TestCase):
         MockGenerativeModel.assert_called_with(model_name="gemini-2.5-pro")
         
         expected_prompt = f"Decompose this: {verse_text}"
-        mock_model_instance.generate_content.assert_called_once_with(expected_prompt)
+        mock_model_instance.generate_content.assert_called_once_with(
+            expected_prompt, generation_config=generation_config(PROPOSITIONS_SCHEMA)
+        )
+
+    @patch('src.normalization_service.configure_api_key')
+    @patch('google.generativeai.GenerativeModel')
+    def test_setup_happens_once(self, MockGenerativeModel, MockConfigureApiKey):
+        """The key, prompt and model are set up once, not on every call."""
+        mock_response = MagicMock()
+        mock_response.text = '["Proposition."]'
+        MockGenerativeModel.return_value.generate_content.return_value = mock_response
+
+        service = NormalizationService(self.prompt_path)
+        os.remove(self.prompt_path)
+        for verse in range(3):
+            self.assertEqual(service.normalize("Genesis", 1, verse, f"Verse {verse}."), ["Proposition."])
+
+        MockConfigureApiKey.assert_called_once()
+        MockGenerativeModel.assert_called_once()
+
+    @patch('src.normalization_service.configure_api_key')
+    @patch('google.generativeai.GenerativeModel')
+    def test_unparseable_response_returns_empty_list(self, MockGenerativeModel, MockConfigureApiKey):
+        """A response that is not JSON yields no propositions."""
+        mock_response = MagicMock()
+        mock_response.text = 'I cannot do that.'
+        MockGenerativeModel.return_value.generate_content.return_value = mock_response
+
+        service = NormalizationService(self.prompt_path)
+        self.assertEqual(service.normalize("Genesis", 1, 1, "A verse."), [])
+
+class TestNormalizationServiceAsync(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        """Set up a dummy prompt file."""
+        self.prompt_path = 'tests/dummy_prompt_async.txt'
+        with open(self.prompt_path, 'w') as f:
+            f.write("Decompose this: {verse_text}")
+
+    def tearDown(self):
+        """Remove the dummy prompt file."""
+        if os.path.exists(self.prompt_path):
+            os.remove(self.prompt_path)
+
+    @patch('src.normalization_service.configure_api_key')
+    @patch('google.generativeai.GenerativeModel')
+    async def test_repeated_verse_is_served_from_cache(self, MockGenerativeModel, MockConfigureApiKey):
+        """A second identical request is answered by the response cache."""
+        mock_response = MagicMock()
+        mock_response.text = '["Proposition 1."]'
+        mock_model_instance = MagicMock()
+        mock_model_instance.generate_content_async = AsyncMock(return_value=mock_response)
+        MockGenerativeModel.return_value = mock_model_instance
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            configure_response_cache(os.path.join(tmp_dir, 'cache.sqlite'))
+            try:
+                service = NormalizationService(self.prompt_path)
+                first = await service.normalize_async("GEN", 1, 1, "A verse.")
+                second = await service.normalize_async("PSA", 136, 2, "A verse.")
+            finally:
+                configure_response_cache(None)
+
+        self.assertEqual(first, second)
+        mock_model_instance.generate_content_async.assert_awaited_once()
+
+    @patch('src.normalization_service.configure_api_key')
+    @patch('google.generativeai.GenerativeModel')
+    async def test_normalize_text_async(self, MockGenerativeModel, MockConfigureApiKey):
+        """The async path awaits generate_content_async and parses fenced JSON."""
+        mock_response = MagicMock()
+        mock_response.text = '```json\n["Proposition 1."]\n```'
+
+        mock_model_instance = MagicMock()
+        mock_model_instance.generate_content_async = AsyncMock(return_value=mock_response)
+        MockGenerativeModel.return_value = mock_model_instance
+
+        service = NormalizationService(self.prompt_path)
+        propositions = await service.normalize_async("GEN", 1, 1, "A verse.")
+
+        self.assertEqual(propositions, ["Proposition 1."])
+        mock_model_instance.generate_content_async.assert_awaited_once_with(
+            "Decompose this: A verse.", generation_config=generation_config(PROPOSITIONS_SCHEMA)
+        )
+
+class TestBatchedNormalization(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.verses = [
+            {'book_name': 'GEN', 'chapter': 1, 'verse': v, 'text': f'Verse {v} text.'}
+            for v in range(1, 5)
+        ]
+
+    def test_build_batches_respects_token_budget(self):
+        """Verses are packed until the next one would exceed the budget."""
+        batches = build_batches(self.verses, token_budget=600)
+        self.assertEqual([len(b) for b in batches], [2, 2])
+
+    def test_build_batches_splits_on_duplicate_key(self):
+        """A repeated reference starts a new batch."""
+        batches = build_batches(self.verses[:1] * 2, token_budget=10_000)
+        self.assertEqual(len(batches), 2)
+
+    def test_parse_batch_response_drops_malformed_entries(self):
+        """Only well-formed entries for requested keys are kept."""
+        text = '```json\n{"GEN 1:1": ["A."], "GEN 1:2": "not a list", "GEN 9:9": ["B."]}\n```'
+        self.assertEqual(_parse_batch_response(text, ["GEN 1:1", "GEN 1:2"]), {"GEN 1:1": ["A."]})
+        self.assertEqual(_parse_batch_response("not json", ["GEN 1:1"]), {})
+
+    @patch.object(NormalizationService, 'normalize_async', new_callable=AsyncMock)
+    @patch.object(NormalizationService, 'normalize_batch_async', new_callable=AsyncMock)
+    @patch.object(NormalizationService, '__init__', return_value=None)
+    async def test_only_missing_verses_are_resent(self, mock_init, mock_batch, mock_single):
+        """Missing verses are re-sent in smaller batches, down to single verses."""
+        mock_batch.side_effect = [
+            {"GEN 1:1": ["A."]},
+            {"GEN 1:2": ["B."]},
+        ]
+        mock_single.side_effect = [["C."], []]
+
+        service = NormalizationService('prompt.txt', 'batch_prompt.txt')
+        results = await service.normalize_batched_async(self.verses)
+
+        self.assertEqual(results, {"GEN 1:1": ["A."], "GEN 1:2": ["B."], "GEN 1:3": ["C."], "GEN 1:4": []})
+        self.assertEqual(mock_batch.await_args_list[1].args[0], self.verses[1:3])
+        self.assertEqual(mock_single.await_count, 2)
 
 if __name__ == '__main__':
     unittest.main()
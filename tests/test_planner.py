@@ -0,0 +1,50 @@
+import unittest
+
+from src.planner import chars_tokenizer, load_tokenizer, observed_output_tokens, plan_run, plan_source
+
+class TestPlanner(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = [
+            {'book_name': 'GEN', 'chapter': 1, 'verse': verse, 'text': 'x' * 400}
+            for verse in range(1, 11)
+        ]
+
+    def test_plan_source(self):
+        """Prompts are rendered per verse, or per batch when batching."""
+        single = plan_source(self.rows, "P" * 4000 + "{verse_text}", None, 0, chars_tokenizer, 50)
+        self.assertEqual(single['requests'], 10)
+        self.assertEqual(single['input_tokens'], 10 * 1100)
+        self.assertEqual(single['output_tokens'], 500)
+        self.assertEqual(single['text_tokens'], 1000)
+
+        batched = plan_source(self.rows, "{verse_text}", "B" * 4000 + "{verses_json}", 1000, chars_tokenizer, 50)
+        # Each verse costs 100 + 256 estimated tokens, so two fit a 1000-token batch
+        self.assertEqual(batched['requests'], 5)
+        self.assertLess(batched['input_tokens'], single['input_tokens'])
+
+    def test_plan_run(self):
+        """The quota that runs out first bounds the run, and batching is recommended when it pays off."""
+        source = plan_source(self.rows, "P" * 4000 + "{verse_text}", None, 0, chars_tokenizer, 50)
+        plan = plan_run({'masoretic': source}, prompt_overhead=1000, batch_overhead=1000, rpm=5, tpm=10**6, rpd=4, latency=2.0)
+        self.assertEqual(plan['bound_by'], 'requests_per_minute')
+        self.assertEqual(plan['minimum_wall_seconds'], 120)
+        self.assertEqual(plan['days'], 2.5)
+        self.assertGreater(plan['recommended_batch_tokens'], 0)
+        self.assertLess(plan['recommended_wall_seconds'], plan['minimum_wall_seconds'])
+
+        plan = plan_run({'masoretic': source}, prompt_overhead=1000, batch_overhead=1000, rpm=10**6, tpm=11_500, rpd=None, latency=2.0)
+        self.assertEqual(plan['bound_by'], 'tokens_per_minute')
+        self.assertIsNone(plan['days'])
+
+    def test_tokenizers(self):
+        """Tokenizers are chosen by name or by import path."""
+        self.assertIs(load_tokenizer('chars'), chars_tokenizer)
+        self.assertIs(load_tokenizer('src.planner:chars_tokenizer'), chars_tokenizer)
+        with self.assertRaises(ValueError):
+            load_tokenizer('unknown')
+        self.assertEqual(observed_output_tokens([["abcd" * 10], []], chars_tokenizer), 11)
+        self.assertEqual(observed_output_tokens([], chars_tokenizer), 256)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+
+from src.response_cache import ResponseCache
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        """Create the cache in a temporary directory."""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.tmp_dir, 'cache', 'responses.sqlite')
+        self.cache = ResponseCache(self.cache_path, max_entries=2, evict_every=1)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_key_depends_on_model_template_and_text(self):
+        """Changing any part of the request changes the key."""
+        key = ResponseCache.make_key("model", "template {verse_text}", "text")
+        self.assertEqual(key, ResponseCache.make_key("model", "template {verse_text}", "text"))
+        self.assertNotEqual(key, ResponseCache.make_key("other", "template {verse_text}", "text"))
+        self.assertNotEqual(key, ResponseCache.make_key("model", "changed {verse_text}", "text"))
+        self.assertNotEqual(key, ResponseCache.make_key("model", "template {verse_text}", "other"))
+
+    def test_get_put_and_counters(self):
+        """Hits and misses are counted and values round-trip."""
+        self.assertIsNone(self.cache.get("a"))
+        self.cache.put("a", ["Proposition."])
+        self.assertEqual(self.cache.get("a"), ["Proposition."])
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    def test_persists_across_instances(self):
+        """Entries survive reopening the database."""
+        self.cache.put("a", ["Proposition."])
+        reopened = ResponseCache(self.cache_path)
+        self.assertEqual(reopened.get("a"), ["Proposition."])
+        reopened.close()
+
+    def test_evicts_least_recently_used(self):
+        """The least recently used entry is evicted once the cache is full."""
+        self.cache.put("a", ["A."])
+        self.cache.put("b", ["B."])
+        self.cache.get("a")
+        self.cache.put("c", ["C."])
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("a"), ["A."])
+
+    def test_concurrent_access(self):
+        """Many threads can read and write the same cache."""
+        cache = ResponseCache(os.path.join(self.tmp_dir, 'shared.sqlite'))
+
+        def work(n):
+            for i in range(50):
+                cache.put(f"{n}-{i}", [str(i)])
+                self.assertEqual(cache.get(f"{n}-{i}"), [str(i)])
+
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(cache), 400)
+        cache.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import pandas as pd
+
+from src.result_writer import ResultWriter, CsvSink, JsonlSink, open_sink, read_output, OutputTail, DURABILITY_NONE
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+class TestResultWriter(unittest.TestCase):
+
+    def setUp(self):
+        """Create the output files in a temporary directory."""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.rows = [
+            {'book_name': 'GEN', 'chapter': 1, 'verse': v, 'text': f'Verse {v}, text.', 'verse_hash': v}
+            for v in range(1, 6)
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_all(self, sink, **kwargs):
+        committed = []
+        writer = ResultWriter(sink, on_commit=committed.extend, **kwargs)
+        for row in self.rows:
+            writer.submit(row, [row['text']] if row['verse'] % 2 else [])
+        writer.close()
+        return committed
+
+    def test_csv_output_is_readable_by_pandas(self):
+        """The CSV sink writes a header once and a JSON-encoded normalization column."""
+        path = os.path.join(self.tmp_dir, 'out.csv')
+        self._write_all(CsvSink(path), batch_size=2)
+        self._write_all(CsvSink(path), batch_size=2)
+        df = pd.read_csv(path)
+        self.assertEqual(len(df), 10)
+        self.assertEqual(json.loads(df['normalization'][0]), ['Verse 1, text.'])
+
+    def test_jsonl_output_is_typed(self):
+        """The JSONL sink keeps the normalization as a list."""
+        path = os.path.join(self.tmp_dir, 'out.jsonl')
+        committed = self._write_all(JsonlSink(path), batch_size=10, flush_interval=60)
+        df = pd.read_json(path, lines=True)
+        self.assertEqual(df['normalization'].tolist()[:2], [['Verse 1, text.'], []])
+        self.assertEqual([row['verse_hash'] for row in committed], [1, 2, 3, 4, 5])
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_parquet_output_is_readable_as_a_dataset(self):
+        """Each run adds complete part files to the Parquet directory."""
+        path = os.path.join(self.tmp_dir, 'out.parquet')
+        committed = self._write_all(open_sink(path, 'parquet'), batch_size=2)
+        self._write_all(open_sink(path, 'parquet'), batch_size=2)
+        self.assertEqual(len(committed), 5)
+        df = pd.read_parquet(path)
+        self.assertEqual(len(df), 10)
+        self.assertEqual(list(df['normalization'][0]), ['Verse 1, text.'])
+
+    def test_read_output_returns_lists_in_every_format(self):
+        """Outputs read back have the normalization as a list, whatever the format."""
+        formats = ['csv', 'jsonl'] + (['parquet'] if pyarrow is not None else [])
+        for output_format in formats:
+            path = os.path.join(self.tmp_dir, f'out.{output_format}')
+            self._write_all(open_sink(path, output_format))
+            df = read_output(path, output_format)
+            self.assertEqual(df['normalization'].tolist()[:2], [['Verse 1, text.'], []], output_format)
+
+    def test_tail_reads_only_complete_rows(self):
+        """A row still being written is returned by a later read, once complete."""
+        path = os.path.join(self.tmp_dir, 'out.csv')
+        tail = OutputTail(path, 'csv')
+        self.assertEqual(tail.read_new(), [])
+        self._write_all(CsvSink(path))
+        with open(path, 'a') as f:
+            f.write('GEN,1,6,"Verse 6')
+        rows = tail.read_new()
+        self.assertEqual([row['verse'] for row in rows], [1, 2, 3, 4, 5])
+        self.assertEqual(rows[0]['normalization'], ['Verse 1, text.'])
+        with open(path, 'a') as f:
+            f.write(', text.",[]\n')
+        self.assertEqual(tail.read_new(), [{'book_name': 'GEN', 'chapter': 1, 'verse': 6, 'text': 'Verse 6, text.', 'normalization': []}])
+
+    def test_no_durability_commits_only_on_close(self):
+        """Without flushing, rows are reported committed only once the file is closed."""
+        sink = CsvSink(os.path.join(self.tmp_dir, 'out.csv'), durability=DURABILITY_NONE)
+        self.assertEqual(sink.write([dict(self.rows[0], normalization=[])]), [])
+        self.assertEqual(len(sink.close()), 1)
+
+    def test_unknown_format_is_rejected(self):
+        with self.assertRaises(ValueError):
+            open_sink(os.path.join(self.tmp_dir, 'out.xml'), 'xml')
+
+if __name__ == '__main__':
+    unittest.main()
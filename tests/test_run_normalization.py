@@ -0,0 +1,43 @@
+import unittest
+from unittest.mock import MagicMock
+
+from scripts.run_normalization import normalize_sources
+from src.scheduler import WeightedScheduler
+
+class FakeService:
+    """Fails the first `failures` attempts at every verse."""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.attempts = {}
+
+    async def normalize_async(self, book_name, chapter, verse, verse_text):
+        self.attempts[verse] = self.attempts.get(verse, 0) + 1
+        return [] if self.attempts[verse] <= self.failures else [verse_text]
+
+class TestNormalizeSources(unittest.IsolatedAsyncioTestCase):
+
+    async def run_sources(self, service, max_attempts):
+        rows = [{'book_name': 'GEN', 'chapter': 1, 'verse': verse, 'text': f"Verse {verse}."} for verse in range(1, 6)]
+        scheduler = WeightedScheduler()
+        scheduler.add_source('masoretic', [[row] for row in rows])
+        writer = MagicMock()
+        await normalize_sources(scheduler, {'masoretic': writer}, {'masoretic': MagicMock()}, service, concurrency=3, max_attempts=max_attempts)
+        return {call.args[0]['verse']: call.args[1] for call in writer.submit.call_args_list}
+
+    async def test_failed_verses_are_reasked(self):
+        """Failed verses are re-asked during the run and written once they succeed."""
+        service = FakeService(failures=2)
+        written = await self.run_sources(service, max_attempts=3)
+        self.assertEqual(written, {verse: [f"Verse {verse}."] for verse in range(1, 6)})
+        self.assertEqual(set(service.attempts.values()), {3})
+
+    async def test_attempts_are_bounded(self):
+        """After the last attempt the empty result is written, once per verse."""
+        service = FakeService(failures=5)
+        written = await self.run_sources(service, max_attempts=2)
+        self.assertEqual(written, {verse: [] for verse in range(1, 6)})
+        self.assertEqual(set(service.attempts.values()), {2})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+from src.scheduler import WeightedScheduler, parse_weights
+
+class TestWeightedScheduler(unittest.TestCase):
+
+    def _drain(self, scheduler):
+        picks = []
+        while (item := scheduler.next()) is not None:
+            picks.append(item)
+        return picks
+
+    def test_picks_follow_weights_and_interleave(self):
+        """A source with twice the weight is picked twice as often, interleaved."""
+        scheduler = WeightedScheduler()
+        scheduler.add_source('septuagint', range(4), weight=2)
+        scheduler.add_source('masoretic', range(2), weight=1)
+        names = [name for name, _ in self._drain(scheduler)]
+        self.assertEqual(names, ['septuagint', 'masoretic', 'septuagint', 'septuagint', 'masoretic', 'septuagint'])
+
+    def test_remaining_sources_absorb_capacity(self):
+        """Once a source is exhausted, the others are picked back to back."""
+        scheduler = WeightedScheduler()
+        scheduler.add_source('masoretic', ['m1'])
+        scheduler.add_source('vulgate', ['v1', 'v2', 'v3'])
+        self.assertEqual(self._drain(scheduler), [('masoretic', 'm1'), ('vulgate', 'v1'), ('vulgate', 'v2'), ('vulgate', 'v3')])
+        self.assertEqual(len(scheduler), 0)
+
+    def test_items_keep_their_order_within_a_source(self):
+        scheduler = WeightedScheduler()
+        scheduler.add_source('vulgate', [1, 2, 3])
+        self.assertEqual(scheduler.remaining('vulgate'), 3)
+        self.assertEqual([item for _, item in self._drain(scheduler)], [1, 2, 3])
+
+    def test_rejects_non_positive_weight(self):
+        with self.assertRaises(ValueError):
+            WeightedScheduler().add_source('vulgate', [], weight=0)
+
+    def test_parse_weights(self):
+        self.assertEqual(parse_weights('septuagint=2, masoretic=0.5'), {'septuagint': 2.0, 'masoretic': 0.5})
+        self.assertEqual(parse_weights(''), {})
+        with self.assertRaises(ValueError):
+            parse_weights('septuagint')
+
+if __name__ == '__main__':
+    unittest.main()
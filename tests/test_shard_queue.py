@@ -0,0 +1,100 @@
+import argparse
+import os
+import tempfile
+import unittest
+
+from scripts import merge_shards
+from src.checkpoint import CheckpointManifest, verse_hash
+from src.result_writer import ResultWriter, open_sink, output_path, read_output
+from src.shard_queue import Shard, ShardQueue, shard_output_path, shard_outputs
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TestShardQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.clock = FakeClock()
+        self.path = os.path.join(self.tmpdir.name, 'queue.sqlite')
+        self.queue = ShardQueue(self.path, lease_seconds=60, clock=self.clock)
+
+    def tearDown(self):
+        self.queue.close()
+        self.tmpdir.cleanup()
+
+    def test_seed(self):
+        """Seeding splits a source into ranges, is idempotent and keeps the first shard size."""
+        self.assertEqual(self.queue.seed('masoretic', 250, 100), 3)
+        self.assertEqual(self.queue.seed('masoretic', 250, 100), 3)
+        self.assertEqual(self.queue.progress(), {'masoretic': {'pending': 3}})
+        with self.assertRaises(ValueError):
+            self.queue.seed('vulgate', 250, 50)
+        last = [self.queue.claim('a') for _ in range(3)][-1]
+        self.assertEqual(last, Shard('masoretic', 2, 200, 250))
+
+    def test_leases(self):
+        """A shard is held by one worker until its lease expires, and a lost lease cannot be completed."""
+        self.queue.seed('masoretic', 200, 100)
+        other = ShardQueue(self.path, lease_seconds=60, clock=self.clock)
+        first = self.queue.claim('a')
+        second = other.claim('b')
+        self.assertNotEqual(first, second)
+        self.assertIsNone(other.claim('c'))
+
+        self.clock.now += 50
+        self.assertTrue(self.queue.renew(first, 'a'))
+        self.clock.now += 50
+        # b stopped renewing, so its shard goes to c
+        self.assertEqual(other.claim('c'), second)
+        self.assertFalse(other.complete(second, 'b'))
+        self.assertTrue(other.complete(second, 'c'))
+        self.assertTrue(self.queue.release(first, 'a'))
+        self.assertEqual(self.queue.progress(), {'masoretic': {'pending': 1, 'done': 1}})
+        other.close()
+
+class TestMergeShards(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmpdir.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmpdir.cleanup()
+
+    def write_shard(self, shard: Shard, worker: str, results: list[tuple[int, str, list[str]]]):
+        path = shard_output_path(merge_shards.SHARD_DIR, shard, worker, 'csv')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        writer = ResultWriter(open_sink(path, 'csv'))
+        for verse, text, propositions in results:
+            writer.submit({'book_name': 'GEN', 'chapter': 1, 'verse': verse, 'text': text}, propositions)
+        writer.close()
+
+    def test_merge(self):
+        """Shard outputs are merged once per verse, preferring successes, and merging again adds nothing."""
+        first, second = Shard('masoretic', 0, 0, 2), Shard('masoretic', 1, 2, 4)
+        # A worker that lost its lease and the one that took the shard over both wrote verse 2
+        self.write_shard(first, 'dead', [(1, 'In the beginning.', ["A."]), (2, 'The earth was void.', [])])
+        self.write_shard(first, 'alive', [(2, 'The earth was void.', ["B."])])
+        self.write_shard(second, 'alive', [(3, 'Let there be light.', [])])
+        self.assertEqual(len(shard_outputs(merge_shards.SHARD_DIR, 'masoretic', 'csv')), 3)
+
+        args = argparse.Namespace(shard_queue=None, output_format='csv', durability='flush')
+        self.assertEqual(merge_shards.merge(args), {'masoretic': {'merged': 3, 'skipped': 0}})
+        self.assertEqual(merge_shards.merge(args), {'masoretic': {'merged': 0, 'skipped': 3}})
+
+        output = read_output(output_path('output', 'masoretic', 'csv'), 'csv').sort_values('verse')
+        self.assertEqual(output['normalization'].tolist(), [["A."], ["B."], []])
+        manifest = CheckpointManifest(os.path.join('output', 'checkpoint_csv.sqlite'))
+        self.assertEqual(manifest.counts('masoretic'), {'done': 2, 'failed': 1})
+        self.assertIn(verse_hash('GEN', 1, 3, 'Let there be light.'), manifest.recorded('masoretic'))
+        manifest.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+
+from src.structured_output import keyed_propositions_schema, loads_lenient, parse_keyed_propositions, parse_propositions
+
+class TestStructuredOutput(unittest.TestCase):
+
+    def test_well_formed_answers(self):
+        """Valid JSON takes the fast path; fences and surrounding prose are cut away."""
+        self.assertEqual(parse_propositions('["A.", "B."]'), ["A.", "B."])
+        self.assertEqual(parse_propositions('```json\n["A."]\n```'), ["A."])
+        self.assertEqual(parse_propositions('Output:\n["A."]\nHope this helps!'), ["A."])
+
+    def test_repairs_common_defects(self):
+        """Missing and trailing commas, raw newlines and Python literals are repaired."""
+        self.assertEqual(parse_propositions('[\n  "A."\n  "B."\n]'), ["A.", "B."])
+        self.assertEqual(parse_propositions('["A.", "B.",]'), ["A.", "B."])
+        self.assertEqual(parse_propositions('["Line\none."]'), ["Line\none."])
+        self.assertEqual(parse_propositions("['A.', 'B.']"), ["A.", "B."])
+        self.assertEqual(loads_lenient('{"a": true "b": [1 2]}', '{'), {"a": True, "b": [1, 2]})
+
+    def test_truncated_answers(self):
+        """A truncated answer keeps its finished values and loses the unfinished one."""
+        self.assertEqual(parse_propositions('["A.", "B.", "Unfini'), ["A.", "B."])
+        text = '{"GEN 1:1": ["A."], "GEN 1:2": ["B.", "C'
+        self.assertEqual(parse_keyed_propositions(text, ["GEN 1:1", "GEN 1:2"]), {"GEN 1:1": ["A."], "GEN 1:2": ["B."]})
+
+    def test_unusable_answers(self):
+        """Answers without propositions are rejected rather than passed on."""
+        self.assertIsNone(parse_propositions("I cannot help with that."))
+        self.assertIsNone(parse_propositions("[]"))
+        self.assertIsNone(parse_propositions('[1, 2]'))
+        self.assertEqual(parse_propositions('{"propositions": ["A.", " "]}'), ["A."])
+
+    def test_keyed_schema(self):
+        """The batch schema requires an array of strings for every key."""
+        schema = keyed_propositions_schema(["GEN 1:1"])
+        self.assertEqual(schema['required'], ["GEN 1:1"])
+        self.assertEqual(schema['properties']["GEN 1:1"], {'type': 'array', 'items': {'type': 'string'}})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+from unittest.mock import MagicMock
+from google.api_core.exceptions import ResourceExhausted
+
+from src.utils import AdaptiveRateLimiter, call_with_rate_limiter, retry_after_seconds
+
+class FakeClock:
+    """A manually advanced clock for deterministic limiter tests."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestAdaptiveRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = AdaptiveRateLimiter(
+            requests_per_minute=60, tokens_per_minute=6000, initial_fraction=1.0, clock=self.clock
+        )
+
+    def test_reserve_spaces_requests_at_the_current_rate(self):
+        """At 60 RPM with a one-second burst, the second request waits one second."""
+        self.assertEqual(self.limiter.reserve(), 0.0)
+        self.assertAlmostEqual(self.limiter.reserve(), 1.0)
+        self.assertAlmostEqual(self.limiter.reserve(), 2.0)
+
+    def test_reserve_respects_the_token_quota(self):
+        """A request needing more tokens than are available waits for the token bucket."""
+        self.assertAlmostEqual(self.limiter.reserve(tokens=300), 2.0)
+
+    def test_rate_limit_cuts_rate_once_per_cooldown(self):
+        """A burst of 429s halves the rate only once."""
+        self.limiter.record_rate_limited()
+        self.limiter.record_rate_limited()
+        self.assertAlmostEqual(self.limiter.current_rpm, 30)
+        self.clock.now += 2
+        self.limiter.record_rate_limited()
+        self.assertAlmostEqual(self.limiter.current_rpm, 15)
+
+    def test_success_raises_rate_up_to_quota(self):
+        """Each success adds one request per minute, capped at the quota."""
+        self.limiter.record_rate_limited()
+        self.limiter.record_success()
+        self.assertAlmostEqual(self.limiter.current_rpm, 31)
+        for _ in range(100):
+            self.limiter.record_success()
+        self.assertAlmostEqual(self.limiter.current_rpm, 60)
+
+    def test_retry_hint_holds_back_all_callers(self):
+        """No request is released before the server's retry hint has elapsed."""
+        self.limiter.record_rate_limited(retry_after=10)
+        self.assertGreaterEqual(self.limiter.reserve(), 10)
+
+class TestCallWithRateLimiter(unittest.TestCase):
+
+    def test_retries_through_limiter(self):
+        """A 429 is reported to the limiter and the call is retried."""
+        limiter = MagicMock()
+        func = MagicMock(side_effect=[ResourceExhausted("Please retry in 0.5s."), "ok"])
+        self.assertEqual(call_with_rate_limiter(func, "prompt", limiter=limiter), "ok")
+        limiter.record_rate_limited.assert_called_once_with(0.5)
+        limiter.record_success.assert_called_once()
+        self.assertEqual(limiter.acquire.call_count, 2)
+
+    def test_gives_up_after_max_retries(self):
+        """The call fails once max_retries rate-limit errors have occurred."""
+        func = MagicMock(side_effect=ResourceExhausted("quota"))
+        with self.assertRaises(Exception):
+            call_with_rate_limiter(func, limiter=MagicMock(), max_retries=2)
+        self.assertEqual(func.call_count, 3)
+
+    def test_retry_after_seconds_without_hint(self):
+        """Errors without a retry hint yield None."""
+        self.assertIsNone(retry_after_seconds(ResourceExhausted("quota")))
+
+if __name__ == '__main__':
+    unittest.main()